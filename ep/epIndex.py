@@ -0,0 +1,191 @@
+#!/usr/bin/python
+
+# Lookups over an epStore.py store without scanning it:
+#   index = EpIndex(EpStore('export/store'))
+#   rows = index.rows(neuron=index.neurons[0],tex='SHADE')
+#   best = index.topK(5,by=('neuron','tex'))
+# The stimulus ids are parsed once with idPattern into integer key columns,
+# neuron (a code into index.neurons), gen, lineage and stim, next to tex (a code
+# into index.textures). Every key also gets its rows in key order, so the rows
+# of one value are a searchsorted range of that order. Keys and orders are saved
+# in the index folder of the store and reused until the store or the pattern
+# changes. Ids that do not match the pattern get -1 in every key.
+
+import os
+import re
+import json
+import argparse
+import numpy as np
+
+from epStore import EpStore
+
+# descId of a stimulus: neuron (prefix and run), generation, lineage, stimulus
+idPattern = r'^(?P<neuron>.+?)_g-(?P<gen>\d+)_l-(?P<lineage>\d+)_s-(?P<stim>\d+)$'
+keyNames = ['neuron','gen','lineage','stim','tex']
+textures = ['SPECULAR','SHADE','TWOD']
+
+def parseIds(ids,pattern=idPattern):
+
+    # integer key columns and the neuron names the neuron codes point to
+    pattern = re.compile(pattern)
+    parts = dict((name,np.full(len(ids),-1,dtype=np.int32)) for name in ['gen','lineage','stim'])
+    neuronNames = []
+    unmatched = 0
+
+    for row,stimId in enumerate(ids):
+        match = pattern.match(str(stimId))
+        if match is None:
+            neuronNames.append(None)
+            unmatched += 1
+            continue
+
+        neuronNames.append(match.group('neuron'))
+        for name in parts:
+            parts[name][row] = int(match.group(name))
+
+    neurons = sorted(set(name for name in neuronNames if name is not None))
+    code = dict((name,i) for i,name in enumerate(neurons))
+    parts['neuron'] = np.array([code.get(name,-1) for name in neuronNames],dtype=np.int32)
+
+    if unmatched:
+        print(str(unmatched) + ' of ' + str(len(ids)) + ' ids do not match ' + pattern.pattern)
+    return parts, neurons
+
+def textureCodes(tex):
+
+    # codes of the three known surfaces first, anything else after them
+    values,inverse = np.unique(tex,return_inverse=True)
+    names = textures + sorted(set(str(value) for value in values) - set(textures))
+    lookup = np.array([names.index(str(value)) for value in values],dtype=np.int32)
+    return lookup[inverse].astype(np.int32), names
+
+class EpIndex:
+
+    def __init__(self,store,pattern=idPattern,indexDir=None):
+        self.store = store
+        self.indexDir = indexDir or os.path.join(store.storeDir,'index')
+        self.pattern = pattern
+
+        if not self.isCurrent():
+            self.build()
+        self.load()
+
+    def isCurrent(self):
+        metaFile = os.path.join(self.indexDir,'meta.json')
+        if not os.path.exists(metaFile):
+            return False
+
+        with open(metaFile) as inputfile:
+            meta = json.load(inputfile)
+        return meta.get('pattern') == self.pattern and meta.get('store') == self.store.meta['created'] and meta.get('rows') == len(self.store)
+
+    def build(self):
+        os.makedirs(self.indexDir,exist_ok=True)
+        keys,neurons = parseIds(self.store['id'],self.pattern)
+        keys['tex'],textureNames = textureCodes(np.asarray(self.store['tex']))
+
+        for name in keyNames:
+            np.save(os.path.join(self.indexDir,name + '.npy'),keys[name])
+            np.save(os.path.join(self.indexDir,name + '_order.npy'),np.argsort(keys[name],kind='stable').astype(np.int32))
+
+        meta = {'pattern':self.pattern,'store':self.store.meta['created'],'rows':len(self.store),'neurons':neurons,'textures':textureNames}
+        with open(os.path.join(self.indexDir,'meta.json') + '.tmp','w') as outputfile:
+            json.dump(meta,outputfile,indent=1)
+        os.replace(os.path.join(self.indexDir,'meta.json') + '.tmp',os.path.join(self.indexDir,'meta.json'))
+        return
+
+    def load(self):
+        with open(os.path.join(self.indexDir,'meta.json')) as inputfile:
+            meta = json.load(inputfile)
+
+        self.neurons = meta['neurons']
+        self.textures = meta['textures']
+        self.keys = dict((name,np.load(os.path.join(self.indexDir,name + '.npy'),mmap_mode='r')) for name in keyNames)
+        self.orders = dict((name,np.load(os.path.join(self.indexDir,name + '_order.npy'),mmap_mode='r')) for name in keyNames)
+        self.sortedKeys = {}
+        return
+
+    def code(self,name,value):
+        # neuron names and texture names to their codes, integers pass through
+        if name == 'neuron' and isinstance(value,str):
+            return self.neurons.index(value) if value in self.neurons else -2
+        if name == 'tex' and isinstance(value,str):
+            return self.textures.index(value) if value in self.textures else -2
+        return int(value)
+
+    def keyRange(self,name,value):
+        # rows with key name == value, in row order
+        if name not in self.sortedKeys:
+            self.sortedKeys[name] = np.asarray(self.keys[name])[self.orders[name]]
+
+        value = self.code(name,value)
+        start,stop = np.searchsorted(self.sortedKeys[name],[value,value+1])
+        return np.sort(self.orders[name][start:stop])
+
+    def rows(self,**query):
+        # rows matching every key = value of the query, a list of values matches
+        # any of them. the narrowest key is looked up, the others filter it
+        if not query:
+            return np.arange(len(self.store))
+
+        for name in query:
+            if name not in keyNames:
+                raise KeyError('no key ' + str(name) + ', the index has ' + ', '.join(keyNames))
+
+        ranges = {}
+        for name,value in query.items():
+            values = value if isinstance(value,(list,tuple,np.ndarray)) else [value]
+            ranges[name] = np.unique(np.concatenate([self.keyRange(name,v) for v in values])) if len(values) else np.zeros(0,dtype=np.int32)
+
+        narrowest = min(ranges,key=lambda name: len(ranges[name]))
+        selected = ranges[narrowest]
+        for name,value in query.items():
+            if name != narrowest:
+                values = value if isinstance(value,(list,tuple,np.ndarray)) else [value]
+                selected = selected[np.isin(np.asarray(self.keys[name])[selected],[self.code(name,v) for v in values])]
+
+        return selected
+
+    def groups(self,by=('neuron',),rows=None):
+        # the distinct key combinations of rows and, for each, the rows that have it
+        rows = self.rows() if rows is None else np.asarray(rows)
+        columns = [np.asarray(self.keys[name])[rows] for name in by]
+        order = np.lexsort(columns[::-1])
+        combos = np.stack([column[order] for column in columns],axis=-1)
+        starts = np.flatnonzero(np.concatenate([[True],np.any(combos[1:] != combos[:-1],axis=1)])) if len(rows) else np.zeros(0,dtype=np.int64)
+        return combos[starts], np.split(rows[order],starts[1:]) if len(rows) else []
+
+    def topK(self,k,by=('neuron','tex'),column='resp',rows=None):
+        # rows of the k largest values of column in every group of by, largest
+        # first. NaN values come last and are only taken to fill up a group. ids
+        # that do not match the pattern are left out
+        rows = self.rows() if rows is None else np.asarray(rows)
+        rows = rows[np.asarray(self.keys['neuron'])[rows] >= 0]
+        values = np.asarray(self.store[column],dtype=np.float64)[rows]
+        values = np.where(np.isnan(values),-np.inf,values)
+        columns = [np.asarray(self.keys[name])[rows] for name in by]
+
+        order = np.lexsort([-values] + columns[::-1])
+        combos = np.stack([column[order] for column in columns],axis=-1)
+        newGroup = np.concatenate([[True],np.any(combos[1:] != combos[:-1],axis=1)]) if len(rows) else np.zeros(0,dtype=bool)
+        starts = np.flatnonzero(newGroup)
+        rank = np.arange(len(order)) - starts[np.cumsum(newGroup)-1] if len(rows) else np.zeros(0,dtype=np.int64)
+
+        keep = order[rank < k]
+        return rows[keep]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the id index of an epStore.py store and show the top responses')
+    parser.add_argument('store',nargs='?',default=os.path.join(os.path.dirname(os.path.abspath(__file__)),'export','store'))
+    parser.add_argument('--pattern',default=idPattern)
+    parser.add_argument('--top',type=int,default=3)
+    args = parser.parse_args()
+
+    store = EpStore(args.store)
+    index = EpIndex(store,args.pattern)
+    print(str(len(store)) + ' stimuli of ' + str(len(index.neurons)) + ' neurons')
+
+    ids = store['id']
+    resp = store['resp']
+    for row in index.topK(args.top):
+        print(index.neurons[index.keys['neuron'][row]] + ' ' + index.textures[index.keys['tex'][row]] + ' ' + ids[row] + ' ' + str(round(float(resp[row]),2)))
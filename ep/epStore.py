@@ -0,0 +1,228 @@
+#!/usr/bin/python
+
+# Columnar copy of the shapeResp structs that ep_data_collate.m saves to
+# export/phys_shapeResp_N.mat, for analyses in Python:
+#   python epStore.py                       converts export/phys_shapeResp_*.mat
+#   python epStore.py export/phys_shapeResp_4.mat --out export/store4
+# and then
+#   store = EpStore('export/store')
+#   resp,tex = store['resp'], store['tex']
+# Every field is a column of its own in the store folder. id, col, tex, x, y, s
+# and resp, and file and index (which mat file a record came from and its
+# 1-based position in shapeResp there, as ep_data_img.m addresses stimuli), are
+# .npy arrays that are memory-mapped on first use, so a column costs nothing
+# until it is touched and the others are never read. The spec XML strings are
+# one blob of UTF-8 with an offset column and are only read record by record.
+# meta.json goes in last and lists the sizes and times of the mat files it was
+# made from, a store that is current is not converted again.
+
+import sys
+import os
+import re
+import json
+import glob
+import time
+import argparse
+import numpy as np
+
+dir = os.path.dirname(os.path.abspath(__file__))
+defaultStore = os.path.join(dir,'export','store')
+storeVersion = 1
+
+# shapeResp fields and how they are stored, the spec field is the blob
+floatColumns = {'col':3,'x':1,'y':1,'s':1,'resp':1}
+stringColumns = ['id','tex']
+
+def fileNumber(matFile):
+
+    match = re.search(r'_(\d+)\.mat$',matFile)
+    return int(match.group(1)) if match else 0
+
+def sourceStamps(matFiles):
+
+    return dict((os.path.abspath(matFile),[os.path.getsize(matFile),os.path.getmtime(matFile)]) for matFile in matFiles)
+
+def readShapeResp(matFile):
+
+    # the struct array as a list of field -> value dicts. MATLAB saves it as
+    # v7 by default; v7.3 files are HDF5, which loadmat does not read
+    from scipy.io import loadmat
+
+    try:
+        shapeResp = loadmat(matFile,squeeze_me=True,chars_as_strings=True)['shapeResp']
+    except NotImplementedError:
+        raise ValueError(matFile + ' is a v7.3 mat file, save it again with -v7')
+
+    shapeResp = np.atleast_1d(shapeResp)
+    return [dict((name,record[name]) for name in shapeResp.dtype.names) for record in shapeResp]
+
+def toFloats(value,width):
+
+    # missing values ([] in MATLAB) become NaN
+    value = np.asarray(value,dtype=np.float64).ravel()
+    if value.size == 0:
+        return np.full(width,np.nan)
+
+    if value.size != width:
+        raise ValueError('expected ' + str(width) + ' values, got ' + str(value.size))
+    return value
+
+def toText(value):
+
+    value = np.asarray(value)
+    return '' if value.size == 0 else str(value.item() if value.ndim else value)
+
+def isCurrent(storeDir,matFiles):
+
+    metaFile = os.path.join(storeDir,'meta.json')
+    if not os.path.exists(metaFile):
+        return False
+
+    with open(metaFile) as inputfile:
+        meta = json.load(inputfile)
+    return meta.get('version') == storeVersion and meta.get('sources') == json.loads(json.dumps(sourceStamps(matFiles)))
+
+def convert(matFiles,storeDir=defaultStore,readRecords=readShapeResp):
+
+    # one mat file at a time: the numbers are gathered in lists and the specs
+    # written out as they come, so only one struct array is in memory at once
+    matFiles = sorted(matFiles,key=lambda matFile: (fileNumber(matFile),matFile))
+    os.makedirs(storeDir,exist_ok=True)
+    metaFile = os.path.join(storeDir,'meta.json')
+    if os.path.exists(metaFile):
+        os.remove(metaFile)                             # the store is not valid until it is back
+
+    columns = dict((name,[]) for name in list(floatColumns) + stringColumns + ['file','index'])
+    offsets = [0]
+
+    with open(os.path.join(storeDir,'spec.blob'),'wb') as blob:
+        for matFile in matFiles:
+            start = time.time()
+            records = readRecords(matFile)
+
+            for index,record in enumerate(records):
+                for name,width in floatColumns.items():
+                    columns[name].append(toFloats(record[name],width))
+                for name in stringColumns:
+                    columns[name].append(toText(record[name]))
+                columns['file'].append(fileNumber(matFile))
+                columns['index'].append(index+1)
+
+                spec = toText(record['spec']).encode('utf-8')
+                blob.write(spec)
+                offsets.append(offsets[-1]+len(spec))
+
+            print('Read ' + str(len(records)) + ' records from ' + matFile + ' in ' + str(round(time.time()-start,1)) + 's')
+
+    arrays = {'file':np.array(columns['file'],dtype=np.int16),'index':np.array(columns['index'],dtype=np.int32)}
+    for name,width in floatColumns.items():
+        arrays[name] = np.array(columns[name],dtype=np.float64).reshape(-1,width) if width > 1 else np.array(columns[name],dtype=np.float64).ravel()
+    for name in stringColumns:
+        arrays[name] = np.array(columns[name],dtype=np.str_) if columns[name] else np.zeros(0,dtype='<U1')
+    arrays['spec_offsets'] = np.array(offsets,dtype=np.int64)
+
+    for name,array in arrays.items():
+        np.save(os.path.join(storeDir,name + '.npy'),array)
+
+    meta = {
+        'version':storeVersion,
+        'rows':len(offsets)-1,
+        'columns':dict((name,{'dtype':array.dtype.str,'shape':list(array.shape)}) for name,array in arrays.items() if name != 'spec_offsets'),
+        'sources':sourceStamps(matFiles),
+        'created':time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    meta['columns']['spec'] = {'dtype':'blob','shape':[meta['rows']]}
+
+    with open(metaFile + '.tmp','w') as outputfile:
+        json.dump(meta,outputfile,indent=1,sort_keys=True)
+    os.replace(metaFile + '.tmp',metaFile)
+    return meta
+
+class SpecColumn:
+
+    # spec XML of record i as store['spec'][i], slices and index arrays give lists
+    def __init__(self,storeDir):
+        self.offsets = np.load(os.path.join(storeDir,'spec_offsets.npy'),mmap_mode='r')
+        self.blobFile = os.path.join(storeDir,'spec.blob')
+        self.blob = None
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if np.ndim(index):
+            return [self[i] for i in np.asarray(index).ravel()]
+
+        return self.raw(index).decode('utf-8')
+
+    def raw(self,index):
+        # the bytes of one spec, for hashing or parsing without decoding
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('spec ' + str(index) + ' of ' + str(len(self)))
+
+        start,stop = int(self.offsets[index]),int(self.offsets[index+1])
+        if start == stop:
+            return b''
+        if self.blob is None:
+            self.blob = np.memmap(self.blobFile,dtype=np.uint8,mode='r')
+        return self.blob[start:stop].tobytes()
+
+class EpStore:
+
+    def __init__(self,storeDir=defaultStore):
+        self.storeDir = storeDir
+        with open(os.path.join(storeDir,'meta.json')) as inputfile:
+            self.meta = json.load(inputfile)
+
+        if self.meta.get('version') != storeVersion:
+            raise ValueError(storeDir + ' was written by another version of epStore.py, convert it again')
+        self.loaded = {}
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __contains__(self,name):
+        return name in self.meta['columns']
+
+    def __getitem__(self,name):
+        # columns are mapped on first use and kept
+        if name not in self.loaded:
+            if name not in self.meta['columns']:
+                raise KeyError('no column ' + str(name) + ', the store has ' + ', '.join(self.columns()))
+
+            if name == 'spec':
+                self.loaded[name] = SpecColumn(self.storeDir)
+            else:
+                self.loaded[name] = np.load(os.path.join(self.storeDir,name + '.npy'),mmap_mode='r')
+
+        return self.loaded[name]
+
+    def columns(self):
+        return sorted(self.meta['columns'])
+
+    def load(self,*names):
+        return dict((name,self[name]) for name in names)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert the phys_shapeResp mat files into a columnar store')
+    parser.add_argument('mat_files',nargs='*',help='defaults to export/phys_shapeResp_*.mat')
+    parser.add_argument('--out',default=defaultStore)
+    parser.add_argument('--force',action='store_true',help='convert even if the store is current')
+    args = parser.parse_args()
+
+    matFiles = args.mat_files or glob.glob(os.path.join(dir,'export','phys_shapeResp_*.mat'))
+    if not matFiles:
+        parser.error('no phys_shapeResp mat files found, run ep_data_collate.m first')
+
+    if not args.force and isCurrent(args.out,matFiles):
+        print(args.out + ' is current')
+        sys.exit(0)
+
+    start = time.time()
+    meta = convert(matFiles,args.out)
+    print('Wrote ' + str(meta['rows']) + ' records from ' + str(len(matFiles)) + ' files to ' + args.out + ' in ' + str(round(time.time()-start,1)) + 's')
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+
+# The mstickspec XML of every ep stimulus as flat numpy arrays:
+#   shapes = parseStore(EpStore('export/store'))
+#   limbs = shapes['components']
+#   first = limbs['start'][i], limbs['start'][i+1]    components of stimulus i
+# Every spec is read with XMLPullParser in pieces and its elements are dropped
+# once read. Elements whose tag ends with tags['component'] are the limbs and
+# those ending with tags['joint'] the joints; every number below one becomes a
+# column named by its path from there ('pos/x', 'mAxis_rad', a repeated path
+# gets .1, .2, ...), and every other number of the spec a per stimulus column of
+# shapes['shape']. Stimuli with different numbers of limbs share the flat
+# component and joint arrays, start holds where each stimulus begins, and a
+# value a limb does not have is NaN. true/false become 1/0.
+# Specs are parsed once per distinct spec, in parallel, and kept in
+# export/mstickCache.npz by their sha1, so an analysis of the same data (or of
+# data that only adds stimuli) only parses what is new.
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import xml.etree.ElementTree as ET
+
+from concurrent.futures import ProcessPoolExecutor
+
+from epStore import EpStore, defaultStore
+
+dir = os.path.dirname(os.path.abspath(__file__))
+defaultCache = os.path.join(dir,'export','mstickCache.npz')
+parserVersion = 1
+
+# tag name endings of the limb and joint elements of an mstickspec
+tags = {'component':'TubeInfo','joint':'JuncPt_Info'}
+sections = ['components','joints','shape']
+feedSize = 1 << 16
+
+def leafValue(text):
+
+    text = (text or '').strip()
+    if text == 'true':
+        return 1.0
+    if text == 'false':
+        return 0.0
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def parseSpec(spec,tags=tags):
+
+    # lists of {path: value} for the limbs and joints and one for the rest
+    parser = ET.XMLPullParser(events=('start','end'))
+    found = {'components':[],'joints':[],'shape':{}}
+    path = []
+    section = None                                      # (name, depth, values, path counts) of the limb or joint being read
+    shapeCounts = {}
+
+    for start in range(0,len(spec),feedSize):
+        parser.feed(spec[start:start+feedSize])
+        for event,elem in parser.read_events():
+            name = elem.tag.rsplit('}',1)[-1]
+
+            if event == 'start':
+                if section is None and name.endswith(tags['component']):
+                    section = ('components',len(path)+1,{},{})
+                elif section is None and name.endswith(tags['joint']):
+                    section = ('joints',len(path)+1,{},{})
+                path.append(name)
+                continue
+
+            if section is not None and len(path) == section[1]:
+                found[section[0]].append(section[2])
+                section = None
+
+            elif len(elem) == 0:
+                value = leafValue(elem.text)
+                if value is not None:
+                    if section is None:
+                        key,values,counts = '/'.join(path[1:]),found['shape'],shapeCounts
+                    else:
+                        key,values,counts = '/'.join(path[section[1]:]),section[2],section[3]
+
+                    counts[key] = counts.get(key,0) + 1
+                    values[key if counts[key] == 1 else key + '.' + str(counts[key]-1)] = value
+
+            path.pop()
+            elem.clear()
+
+    parser.close()
+    return found
+
+def toColumns(records):
+
+    # list of {path: value} to {path: array} with NaN where a record has no value
+    names = sorted(set(name for record in records for name in record))
+    columns = dict((name,np.full(len(records),np.nan)) for name in names)
+    for row,record in enumerate(records):
+        for name,value in record.items():
+            columns[name][row] = value
+
+    return columns
+
+def joinColumns(parts):
+
+    # (length, columns) pieces end to end, NaN where a piece lacks a column
+    names = sorted(set(name for length,columns in parts for name in columns))
+    total = sum(length for length,columns in parts)
+    joined = dict((name,np.full(total,np.nan)) for name in names)
+
+    offset = 0
+    for length,columns in parts:
+        for name,column in columns.items():
+            joined[name][offset:offset+length] = column
+        offset += length
+
+    return joined
+
+def parseChunk(specs,tags=tags):
+
+    # struct of arrays of a list of specs, run in the worker processes
+    parsed = [parseSpec(spec,tags) for spec in specs]
+    chunk = {'shape':toColumns([found['shape'] for found in parsed])}
+    for name in ['components','joints']:
+        chunk[name] = toColumns([record for found in parsed for record in found[name]])
+        chunk[name + 'Counts'] = np.array([len(found[name]) for found in parsed],dtype=np.int64)
+
+    return chunk
+
+def joinChunks(chunks):
+
+    shapes = {'shape':joinColumns([(len(chunk['componentsCounts']),chunk['shape']) for chunk in chunks])}
+    for name in ['components','joints']:
+        counts = np.concatenate([chunk[name + 'Counts'] for chunk in chunks]) if chunks else np.zeros(0,dtype=np.int64)
+        shapes[name] = joinColumns([(int(chunk[name + 'Counts'].sum()),chunk[name]) for chunk in chunks])
+        shapes[name]['start'] = np.concatenate([[0],np.cumsum(counts)]).astype(np.int64)
+
+    return shapes
+
+def takeShapes(shapes,rows):
+
+    # the shapes of rows, in that order, with start offsets of their own
+    rows = np.asarray(rows,dtype=np.int64)
+    taken = {'shape':dict((name,column[rows]) for name,column in shapes['shape'].items())}
+
+    for name in ['components','joints']:
+        start = shapes[name]['start']
+        counts = start[rows+1]-start[rows]
+        newStart = np.concatenate([[0],np.cumsum(counts)]).astype(np.int64)
+        elements = np.repeat(start[rows]-newStart[:-1],counts) + np.arange(newStart[-1])
+
+        taken[name] = dict((column,values[elements]) for column,values in shapes[name].items() if column != 'start')
+        taken[name]['start'] = newStart
+
+    return taken
+
+def specHash(spec):
+
+    return hashlib.sha1(spec).hexdigest()
+
+def cacheTag(tags):
+
+    return json.dumps({'version':parserVersion,'tags':tags},sort_keys=True)
+
+def loadCache(cacheFile,tags):
+
+    # hashes and shapes parsed before with the same tags, empty otherwise
+    if not cacheFile or not os.path.exists(cacheFile):
+        return [], None
+
+    with np.load(cacheFile) as cached:
+        if str(cached['tag']) != cacheTag(tags):
+            return [], None
+
+        shapes = dict((name,{}) for name in sections)
+        for key in cached.files:
+            if '.' in key:
+                name,column = key.split('.',1)
+                shapes[name][column] = cached[key]
+        return list(cached['hashes']), shapes
+
+def saveCache(cacheFile,tags,hashes,shapes):
+
+    arrays = {'tag':np.array(cacheTag(tags)),'hashes':np.array(hashes,dtype=np.str_)}
+    for name in sections:
+        for column,values in shapes[name].items():
+            arrays[name + '.' + column] = values
+
+    os.makedirs(os.path.dirname(os.path.abspath(cacheFile)),exist_ok=True)
+    with open(cacheFile + '.tmp','wb') as outputfile:
+        np.savez(outputfile,**arrays)
+    os.replace(cacheFile + '.tmp',cacheFile)
+    return
+
+def shapeChunk(shapes):
+
+    # joinChunks input from shapes
+    chunk = {'shape':shapes['shape']}
+    for name in ['components','joints']:
+        chunk[name] = dict((column,values) for column,values in shapes[name].items() if column != 'start')
+        chunk[name + 'Counts'] = np.diff(shapes[name]['start'])
+
+    return chunk
+
+def parseSpecs(specs,tags=tags,workers=None,chunkSize=256,cacheFile=defaultCache):
+
+    # shapes of a list of spec bytes or strings, one per spec, in order
+    specs = [spec.encode('utf-8') if isinstance(spec,str) else spec for spec in specs]
+    hashes = [specHash(spec) for spec in specs]
+    cachedHashes,cached = loadCache(cacheFile,tags)
+    known = dict((digest,row) for row,digest in enumerate(cachedHashes))
+
+    todo = {}
+    for spec,digest in zip(specs,hashes):
+        if digest not in known and digest not in todo:
+            todo[digest] = spec
+    print(str(len(specs)) + ' specs, ' + str(len(set(hashes))) + ' distinct, ' + str(len(todo)) + ' to parse')
+
+    if todo:
+        start = time.time()
+        pending = list(todo.values())
+        pieces = [pending[i:i+chunkSize] for i in range(0,len(pending),chunkSize)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(parseChunk,pieces,[tags]*len(pieces)))
+
+        parsed = joinChunks(chunks)
+        print('Parsed ' + str(len(pending)) + ' specs in ' + str(round(time.time()-start,1)) + 's')
+
+        # the cache grows by the new specs
+        if cached is None:
+            cachedHashes,cached = [],parsed
+        else:
+            cached = joinChunks([shapeChunk(cached),shapeChunk(parsed)])
+        cachedHashes = cachedHashes + list(todo)
+        known = dict((digest,row) for row,digest in enumerate(cachedHashes))
+        if cacheFile:
+            saveCache(cacheFile,tags,cachedHashes,cached)
+
+    if cached is None:
+        cached = joinChunks([])
+    return takeShapes(cached,[known[digest] for digest in hashes])
+
+def parseStore(store,rows=None,**kwargs):
+
+    # shapes of the store rows, all of them by default
+    specs = store['spec']
+    rows = range(len(specs)) if rows is None else rows
+    return parseSpecs([specs.raw(row) for row in rows],**kwargs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parse the mstick specs of an epStore.py store into flat arrays')
+    parser.add_argument('--store',default=defaultStore)
+    parser.add_argument('--cache',default=defaultCache)
+    parser.add_argument('--workers',type=int,default=os.cpu_count())
+    parser.add_argument('--component-tag',default=tags['component'],help='tag ending of the limb elements')
+    parser.add_argument('--joint-tag',default=tags['joint'],help='tag ending of the joint elements')
+    args = parser.parse_args()
+
+    start = time.time()
+    shapes = parseStore(EpStore(args.store),tags={'component':args.component_tag,'joint':args.joint_tag},workers=args.workers,cacheFile=args.cache)
+    print(str(len(shapes['components']['start'])-1) + ' stimuli, ' + str(shapes['components']['start'][-1]) + ' limbs, ' + str(shapes['joints']['start'][-1]) + ' joints in ' + str(round(time.time()-start,1)) + 's')
+    for name in sections:
+        print(name + ': ' + ', '.join(sorted(column for column in shapes[name] if column != 'start')))
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+
+# Regenerate the images of many ep stimuli at once, the batch version of
+# ep_data_img.m:
+#   python regenImages.py --neuron <name> --out export/images
+#   python regenImages.py --rows 0 1 2 --workers 8
+# Stimuli come from the epStore.py store, picked by row or through epIndex.py.
+# genImage.jar draws one stimulus per run from <dir>/<id>_spec.xml into
+# <dir>/<id>.png, so every job gets a folder of its own to run in and several
+# JVMs run side by side. Images are kept in export/imageCache under a hash of
+# the spec, texture, contrast, color and the jar itself; a stimulus drawn
+# before is linked from there, and stimuli with the same spec and colors are
+# drawn once.
+
+import sys
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from epStore import EpStore, defaultStore
+
+dir = os.path.dirname(os.path.abspath(__file__))
+defaultJar = os.path.join(dir,'imgGen','genImage.jar')
+defaultCache = os.path.join(dir,'export','imageCache')
+
+def nativeDir():
+
+    return os.path.join(dir,'imgGen','macos' if sys.platform == 'darwin' else 'linux')
+
+def imageArgs(col):
+
+    # as ep_data_img.m: the color rounded up to 0/1 per channel and its maximum
+    # as the contrast, written like num2str does
+    col = np.asarray(col,dtype=np.float64)
+    return '%.5g' % col.max(), [str(int(c)) for c in np.ceil(col)]
+
+def jarStamp(jarFile):
+
+    return str(os.path.getsize(jarFile)) + ':' + str(os.path.getmtime(jarFile))
+
+def imageKey(spec,tex,contrast,color,stamp):
+
+    digest = hashlib.sha1(spec)
+    digest.update(('\n' + '\n'.join([str(tex),contrast,' '.join(color),stamp])).encode('utf-8'))
+    return digest.hexdigest()
+
+def linkFile(source,destination):
+
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source,destination)
+    except OSError:
+        shutil.copy2(source,destination)
+    return
+
+def drawImage(job,args):
+
+    # one JVM in a folder of its own, the png moved into the cache when it is there
+    workDir = tempfile.mkdtemp(prefix='regen',dir=args.cache)
+    try:
+        with open(os.path.join(workDir,'1_spec.xml'),'wb') as outputfile:
+            outputfile.write(job['spec'])
+
+        cmd = [args.java,'-Djava.library.path=' + nativeDir(),'-jar',args.jar,workDir + '/','1',job['tex'],job['contrast']] + job['color']
+        start = time.time()
+        try:
+            proc = subprocess.run(cmd,stdout=subprocess.PIPE,stderr=subprocess.STDOUT,universal_newlines=True,timeout=args.timeout)
+            output,code = proc.stdout,proc.returncode
+        except subprocess.TimeoutExpired as error:
+            output,code = str(error.output or ''),'timeout'
+
+        image = os.path.join(workDir,'1.png')
+        if code != 0 or not os.path.exists(image):
+            return {'status':'error','code':code,'output':output[-2000:],'seconds':time.time()-start}
+
+        os.replace(image,os.path.join(args.cache,job['key'] + '.png'))
+        return {'status':'ok','seconds':time.time()-start}
+
+    finally:
+        shutil.rmtree(workDir,ignore_errors=True)
+
+def regenImages(store,rows,args):
+
+    os.makedirs(args.cache,exist_ok=True)
+    os.makedirs(args.out,exist_ok=True)
+    stamp = jarStamp(args.jar)
+    ids,tex,col,specs = store['id'],store['tex'],store['col'],store['spec']
+
+    # rows by cache key, so a key shared by several stimuli is drawn once
+    jobs = {}
+    for row in rows:
+        contrast,color = imageArgs(col[row])
+        spec = specs.raw(row)
+        key = imageKey(spec,tex[row],contrast,color,stamp)
+        if key not in jobs:
+            jobs[key] = {'key':key,'spec':spec,'tex':str(tex[row]),'contrast':contrast,'color':color,'rows':[]}
+        jobs[key]['rows'].append(int(row))
+
+    todo = [job for key,job in jobs.items() if not os.path.exists(os.path.join(args.cache,key + '.png'))]
+    print(str(len(rows)) + ' stimuli, ' + str(len(jobs)) + ' distinct images, ' + str(len(jobs)-len(todo)) + ' in the cache')
+
+    counts = {'drawn':0,'failed':0,'cached':len(jobs)-len(todo)}
+    lock = threading.Lock()
+    results = {}
+
+    def run(job):
+        result = drawImage(job,args)
+        with lock:
+            results[job['key']] = result
+            counts['drawn' if result['status'] == 'ok' else 'failed'] += 1
+            print('[' + str(counts['drawn']+counts['failed']) + '/' + str(len(todo)) + '] ' + str(ids[job['rows'][0]]) + ' ' + result['status'])
+        return
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1,args.workers)) as pool:
+        list(pool.map(run,todo))
+
+    for key,job in jobs.items():
+        image = os.path.join(args.cache,key + '.png')
+        if os.path.exists(image):
+            for row in job['rows']:
+                linkFile(image,os.path.join(args.out,str(ids[row]) + '.png'))
+
+    failed = dict((str(ids[jobs[key]['rows'][0]]),result) for key,result in results.items() if result['status'] != 'ok')
+    if failed:
+        with open(os.path.join(args.out,'regenFailures.json'),'w') as outputfile:
+            json.dump(failed,outputfile,indent=1,sort_keys=True)
+
+    print('drew ' + str(counts['drawn']) + ', failed ' + str(counts['failed']) + ', cached ' + str(counts['cached']) + ' in ' + str(round(time.time()-start)) + 's')
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Regenerate ep stimulus images with several genImage.jar runs at once')
+    parser.add_argument('--store',default=defaultStore)
+    parser.add_argument('--rows',nargs='+',type=int,help='store rows to draw')
+    parser.add_argument('--neuron',nargs='+',help='draw the stimuli of these neurons, as epIndex.py names them')
+    parser.add_argument('--tex',nargs='+',help='only these surfaces, SPECULAR, SHADE or TWOD')
+    parser.add_argument('--out',default=os.path.join(dir,'export','images'))
+    parser.add_argument('--cache',default=defaultCache)
+    parser.add_argument('--workers',type=int,default=os.cpu_count())
+    parser.add_argument('--timeout',type=float,default=120,help='seconds one image may take')
+    parser.add_argument('--jar',default=defaultJar)
+    parser.add_argument('--java',default='java')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.jar):
+        parser.error(args.jar + ' not found')
+
+    store = EpStore(args.store)
+    if args.rows is not None:
+        rows = args.rows
+    else:
+        from epIndex import EpIndex
+        query = {}
+        if args.neuron:
+            query['neuron'] = args.neuron
+        if args.tex:
+            query['tex'] = args.tex
+        rows = EpIndex(store).rows(**query)
+
+    counts = regenImages(store,rows,args)
+    sys.exit(1 if counts['failed'] else 0)
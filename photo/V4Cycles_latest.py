@@ -4,50 +4,166 @@ import bmesh
 import sys
 import os
 import math
-from mathutils import Vector, Euler
+from mathutils import Vector, Euler, Matrix
 import inspect
+import json
+import re
+import time
+import platform
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
+import envGeometry
 
 dir = os.path.dirname(bpy.data.filepath)
 if not dir in sys.path:
     sys.path.append(dir)
 
-def draw(vertSpec,faceSpec):
-    print('Drawing medial axis form...')
+specCache = OrderedDict()
+specCacheSize = 8
+
+# cleaned stimulus meshes by spec hash, kept out of the scene with a fake user
+cleanMeshes = OrderedDict()
+cleanMeshCacheSize = 4
+
+def readSpec(vertFile,faceFile):
+
+    # parse a stimulus once and hand the same arrays to all of its environments
+    key = (os.path.abspath(vertFile),os.path.abspath(faceFile))
+    stamp = (os.path.getmtime(vertFile),os.path.getmtime(faceFile))
+
+    if key in specCache and specCache[key][0] == stamp:
+        specCache.move_to_end(key)
+
+    else:
+        vertSpec = np.loadtxt(vertFile,delimiter=',',usecols=(0,1,2),dtype=np.float32,ndmin=2)
+        faceSpec = np.loadtxt(faceFile,delimiter=',',usecols=(0,1,2),dtype=np.float64,ndmin=2).astype(np.int32)
+        specCache[key] = (stamp,vertSpec,faceSpec)
+
+        while len(specCache) > specCacheSize:
+            specCache.popitem(last=False)
+
+    return specCache[key][1], specCache[key][2]
+
+def meshFromArrays(name,verts,faces):
+
+    # bulk version of from_pydata for float32 (n,3) verts and int32 (m,k) faces,
+    # or a list of such face arrays with different k
+    if isinstance(faces,np.ndarray):
+        faces = [faces]
+
+    me = bpy.data.meshes.new(name)
+    me.vertices.add(len(verts))
+    me.vertices.foreach_set('co',np.ascontiguousarray(verts,dtype=np.float32).ravel())
+
+    totals = np.concatenate([np.full(len(block),block.shape[1],dtype=np.int32) for block in faces])
+    me.loops.add(int(totals.sum()))
+    me.loops.foreach_set('vertex_index',np.concatenate([np.ascontiguousarray(block,dtype=np.int32).ravel() for block in faces]))
+
+    me.polygons.add(len(totals))
+    me.polygons.foreach_set('loop_start',(np.cumsum(totals)-totals).astype(np.int32))
+    me.polygons.foreach_set('loop_total',totals)
+
+    me.update(calc_edges=True)
+    return me
+
+def cleanMesh(vertSpec,faceSpec):
 
-    edges = []
+    # weld, fill holes of up to four sides, make the normals point out and smooth
+    # the stimulus in one bmesh pass, origin at the median of the vertices. made
+    # once per stimulus, returns the mesh and the median
+    key = specHash(vertSpec,faceSpec)
+    if key in cleanMeshes:
+        cleanMeshes.move_to_end(key)
+        return cleanMeshes[key]
 
-    faces = []
-    for face in faceSpec:
-        faces.append((int(face[0])-1,int(face[1])-1,int(face[2])-1))
+    # spec faces are 1-based, spec vertices are y-up and go to (x,-z,y)/vertScale
+    # in one product
+    faces = np.asarray(faceSpec,dtype=np.float64)[:,:3].astype(np.int32)-1
 
     vertScale = 1.5
-    verts = []
-    for vertex in vertSpec:
-        verts.append((float(vertex[0])/vertScale,-1*float(vertex[2])/vertScale,float(vertex[1])/vertScale))
-        
+    axes = np.array([[1,0,0],[0,0,1],[0,-1,0]],dtype=np.float32)/vertScale
+    verts = np.dot(np.asarray(vertSpec,dtype=np.float32)[:,:3],axes)
+    me = meshFromArrays('AldenMesh',verts,faces)
+
+    bm = bmesh.new()
+    bm.from_mesh(me)
+    bmesh.ops.remove_doubles(bm,verts=bm.verts,dist=0.0001)
+    bmesh.ops.holes_fill(bm,edges=bm.edges,sides=4)
+    bmesh.ops.recalc_face_normals(bm,faces=bm.faces)
+    bm.to_mesh(me)
+    bm.free()
+
+    me.polygons.foreach_set('use_smooth',np.ones(len(me.polygons),dtype=bool))
+    me.edges.foreach_set('use_edge_sharp',np.zeros(len(me.edges),dtype=bool))
+
+    co = np.empty(len(me.vertices)*3,dtype=np.float32)
+    me.vertices.foreach_get('co',co)
+    co = co.reshape(-1,3)
+    median = co.mean(axis=0,dtype=np.float64)
+    me.vertices.foreach_set('co',(co-median).astype(np.float32).ravel())
+    me.update()
+
+    me.use_fake_user = True
+    cleanMeshes[key] = (me,Vector(median))
+    while len(cleanMeshes) > cleanMeshCacheSize:
+        old,oldMedian = cleanMeshes.popitem(last=False)[1]
+        old.use_fake_user = False
+        if old.users == 0:
+            bpy.data.meshes.remove(old)
+
+    return cleanMeshes[key]
+
+def draw(vertSpec,faceSpec):
+    print('Drawing medial axis form...')
+
+    # takes the readSpec arrays or the csv.reader rows. every environment gets
+    # its own copy of the cleaned mesh, corrugation and material slots change it
+    cleaned,median = cleanMesh(vertSpec,faceSpec)
+    me = cleaned.copy()
+    me.use_fake_user = False
+
     # assemble Alden medial axis object
-    me = bpy.data.meshes.new('AldenMesh')
-    me.from_pydata(verts,edges,faces)
     ob = bpy.data.objects.new('AldenObject', me)
-    
+    ob.location = median
+
     bpy.ops.object.select_all(action='DESELECT')
     bpy.context.scene.objects.link(ob)
     bpy.context.scene.objects.active = ob
     ob.select = True
-    bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
-    
-    # remove doubles from mesh and smooth surface
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.remove_doubles()
-    bpy.ops.mesh.fill_holes()
-    bpy.ops.mesh.normals_make_consistent(inside=False)
-    bpy.ops.mesh.faces_shade_smooth()
-    bpy.ops.mesh.mark_sharp(clear=True, use_verts=True)
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
+    touchMesh(me)
     return ob
 
 def makeRamStimShader(aldenStim,material):
+
+    mat = makeStimMaterial(aldenStim,material)
+
+    if material in ['Corrugated','CorrugatedMirror']:
+        multiplier = max(objectBounds(aldenStim)['extent'])/70
+
+        corrugationTexture = bpy.data.textures.new('Corrugation',type='CLOUDS')
+        corrugationTexture.noise_scale = 0.8
+        corrugationTexture.nabla = 0.03
+        corrugationTexture.noise_depth = 2.0
+
+        bpy.ops.object.modifier_add(type='DISPLACE')
+        corrugation = bpy.context.object.modifiers['Displace']
+        corrugation.texture = corrugationTexture
+        corrugation.strength = multiplier
+        bpy.ops.object.modifier_apply(apply_as='DATA',modifier='Displace')
+        touchMesh(aldenStim.data)
+
+    bpy.ops.object.material_slot_add()
+    aldenStim.material_slots[0].material = mat
+    bpy.ops.object.material_slot_assign()
+    return
+
+def makeStimMaterial(aldenStim,material):
+
+    # surface shader of the stimulus, corrugation is geometry and done by the caller
     mat = bpy.data.materials.new('Mat')
     mat.use_nodes = True
     mat.node_tree.nodes.remove(mat.node_tree.nodes[1])
@@ -80,7 +196,7 @@ def makeRamStimShader(aldenStim,material):
         textureImage = root + imageName
 
         im = mat.node_tree.nodes.new('ShaderNodeTexImage')
-        im.image = bpy.data.images.load(textureImage)
+        im.image = loadImage(textureImage)
         col = mat.node_tree.nodes.new('ShaderNodeBsdfDiffuse')
 
         texCoord = mat.node_tree.nodes.new('ShaderNodeTexCoord')
@@ -100,252 +216,236 @@ def makeRamStimShader(aldenStim,material):
         col.inputs[1].default_value = 0.0;
         # add plain stim code here
 
-    if material in ['Corrugated','CorrugatedMirror']:
-        bpy.context.scene.update()
-        vertsGlobal = [aldenStim.matrix_world * v.co for v in aldenStim.data.vertices]
-        x = [v[0] for v in vertsGlobal]
-        y = [v[1] for v in vertsGlobal]
-        z = [v[2] for v in vertsGlobal]
-        multiplier = max([abs(max(x)-min(x)),abs(max(y)-min(y)),abs(max(z)-min(z))])/70
+    mat.node_tree.links.new(col.outputs[0],mat.node_tree.nodes[0].inputs[0])
+    return mat
 
-        corrugationTexture = bpy.data.textures.new('Corrugation',type='CLOUDS')
-        corrugationTexture.noise_scale = 0.8
-        corrugationTexture.nabla = 0.03
-        corrugationTexture.noise_depth = 2.0
+def swapStimMaterial(aldenStim,material):
 
-        bpy.ops.object.modifier_add(type='DISPLACE')
-        corrugation = bpy.context.object.modifiers['Displace']
-        corrugation.texture = corrugationTexture
-        corrugation.strength = multiplier
-        bpy.ops.object.modifier_apply(apply_as='DATA',modifier='Displace')
-    
-    mat.node_tree.links.new(col.outputs[0],mat.node_tree.nodes[0].inputs[0])
+    # other surface for the stimulus already in the scene. corrugation changes
+    # the mesh and cannot be swapped in or out this way
+    old = aldenStim.material_slots[0].material
+    aldenStim.material_slots[0].material = makeStimMaterial(aldenStim,material)
 
-    bpy.ops.object.material_slot_add()
-    aldenStim.material_slots[0].material = mat
-    bpy.ops.object.material_slot_assign()
+    if old is not None and old.users == 0:
+        bpy.data.materials.remove(old)
     return
 
 def correctAldenRotation(aldenStim,camera,sun,rotation,frontLight=0):
 
-    # rotate alden stimulus to sit at 0,0,0, then rotate object to heighten camera
-    bpy.ops.object.empty_add(type='PLAIN_AXES',radius=1,location=camera.location)
-    rotEmpty = bpy.data.objects['Empty']
-    rotEmpty.name = 'AldenZeroEmpty'
+    # rotate alden stimulus about the camera to sit on its line of sight, then
+    # tilt it about itself to heighten the camera. as lamp_add used to leave the
+    # new sun active, only scenes without a sun lamp (or with frontLight 2) tilt
+    # the camera with the stimulus, and the suns are never tilted. all placed
+    # through matrix_world, no operators
+    stimMatrix,tilt = aldenPlacement(aldenStim,camera,rotation)
+    aldenStim.matrix_world = stimMatrix
+    location = stimMatrix.to_translation()
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = rotEmpty
-    rotEmpty.select = True
-    aldenStim.select = True
+    if sun and frontLight==0:
+        # create top-down sun lamp
+        addSun(Matrix.Translation((location[0],location[1],location[2]+math.sqrt((200)**2+(200)**2))))
 
-    bpy.ops.object.parent_set(type='OBJECT',keep_transform=False)
+    elif sun and frontLight==1:
+        addSun(Matrix.Translation((camera.location[0],-500,camera.location[2])) * Euler((math.pi/2,0,0)).to_matrix().to_4x4())
 
-    rotZ = math.atan((rotEmpty.location[0]-aldenStim.location[0])/(rotEmpty.location[1]-aldenStim.location[1]))
-    rotX = -math.atan((rotEmpty.location[2]-aldenStim.location[2])/(rotEmpty.location[1]-aldenStim.location[1]))
+    elif sun and frontLight==2:
+        # addSun(Matrix.Translation((camera.location[0],-500,camera.location[2])) * Euler((math.pi/2,0,0)).to_matrix().to_4x4())
+        # addSun(Matrix.Translation((camera.location[0],0,camera.location[2]+500)) * Euler((math.pi/2,0,0)).to_matrix().to_4x4())
+        # addSun(Matrix.Translation((camera.location[0],0,camera.location[2]-500)) * Euler((math.pi/2,0,0)).to_matrix().to_4x4())
+        # addSun(Matrix.Translation((camera.location[0]-500,0,camera.location[2])) * Euler((math.pi/2,0,0)).to_matrix().to_4x4())
+        # addSun(Matrix.Translation((camera.location[0]+500,0,camera.location[2])) * Euler((math.pi/2,0,0)).to_matrix().to_4x4())
+        pass
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = rotEmpty
-    rotEmpty.select = True
-    bpy.ops.transform.rotate(value=rotX,axis=(1,0,0),constraint_axis=(True,False,False),constraint_orientation='GLOBAL')
-    bpy.ops.transform.rotate(value=rotZ,axis=(0,0,1),constraint_axis=(False,False,True),constraint_orientation='GLOBAL')
+    if not sun or frontLight==2:
+        camera.matrix_world = tilt * worldMatrix(camera)
+    return
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = aldenStim
-    aldenStim.select = True
-    bpy.ops.object.parent_clear(type='CLEAR_KEEP_TRANSFORM')
+def aldenPlacement(aldenStim,camera,rotation):
 
-    deleteSingleObject(rotEmpty)
+    # the placement of correctAldenRotation as matrices: swing the stimulus about
+    # the camera, then tilt about the stimulus. the tilt is returned too since the
+    # camera of a scene without sun lamps is tilted with it
+    rotZ = math.atan((camera.location[0]-aldenStim.location[0])/(camera.location[1]-aldenStim.location[1]))
+    rotX = -math.atan((camera.location[2]-aldenStim.location[2])/(camera.location[1]-aldenStim.location[1]))
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = aldenStim
-    aldenStim.select = True
-    camera.select = True
+    pivot = Matrix.Translation(camera.location)
+    facing = pivot * Matrix.Rotation(rotZ,4,'Z') * Matrix.Rotation(rotX,4,'X') * pivot.inverted()
+    stimMatrix = facing * aldenStim.matrix_basis
 
-    if sun and frontLight==0:
-        # create top-down sun lamp
-        bpy.ops.object.lamp_add(type='SUN',location=(aldenStim.location[0],aldenStim.location[1],aldenStim.location[2]+math.sqrt((200)**2+(200)**2)),rotation=(0,0,0))
+    pivot = Matrix.Translation(stimMatrix.to_translation())
+    tilt = pivot * Matrix.Rotation(rotation,4,'X') * pivot.inverted()
+    return tilt * stimMatrix, tilt
 
-    elif sun and frontLight==1:
-        bpy.ops.object.lamp_add(type='SUN',location=(camera.location[0],-500,camera.location[2]),rotation=(math.pi/2,0,0))
+def addCamera():
 
-    elif sun and frontLight==2:
-        # bpy.ops.object.lamp_add(type='SUN',location=(camera.location[0],-500,camera.location[2]),rotation=(math.pi/2,0,0))
-        # bpy.ops.object.lamp_add(type='SUN',location=(camera.location[0],0,camera.location[2]+500),rotation=(math.pi/2,0,0))
-        # bpy.ops.object.lamp_add(type='SUN',location=(camera.location[0],0,camera.location[2]-500),rotation=(math.pi/2,0,0))
-        # bpy.ops.object.lamp_add(type='SUN',location=(camera.location[0]-500,0,camera.location[2]),rotation=(math.pi/2,0,0))
-        # bpy.ops.object.lamp_add(type='SUN',location=(camera.location[0]+500,0,camera.location[2]),rotation=(math.pi/2,0,0))
-        pass
+    # single center camera looking down +y
+    scn = bpy.context.scene
+    camera = bpy.data.objects.new('Camera',bpy.data.cameras.new('Camera'))
+    scn.objects.link(camera)
+    scn.camera = camera
+
+    camera.location = Vector((0,-500,0))
+    camera.rotation_euler = Euler((math.pi/2,0,0))
+    camera.data.type = 'PERSP'
+    camera.data.clip_end = 4000
+    camera.data.lens = 500
+    camera.data.sensor_fit = 'HORIZONTAL'
+    camera.data.sensor_width = 160
+    return camera
 
-    for s in bpy.data.objects:
-        if s.name.startswith('Sun'):
-            s.select = True
+def addSun(matrix):
 
-    # bpy.ops.object.select_all(action='DESELECT')
-    # bpy.context.scene.objects.active = aldenStim
-    # aldenStim.select = True
-    # camera.select = True
+    lamp = bpy.data.lamps.new('Sun','SUN')
+    lamp.use_nodes = True
+    sun = bpy.data.objects.new('Sun',lamp)
+    bpy.context.scene.objects.link(sun)
+    sun.matrix_world = matrix
+    return sun
 
-    bpy.ops.object.parent_set(type='OBJECT',keep_transform=False)
+def addPlane(name,radius,matrix):
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = aldenStim
-    aldenStim.select = True
-    bpy.ops.transform.rotate(value=-math.pi/180*2.2,axis=(1,0,0),constraint_axis=(True,False,False),constraint_orientation='GLOBAL')
+    # square plane facing +z in its own space, as primitive_plane_add makes it
+    verts,faces = envGeometry.plane(radius)
+    plane = bpy.data.objects.new(name,meshFromArrays(name,verts,faces))
+    bpy.context.scene.objects.link(plane)
+    plane.matrix_world = matrix
+    return plane
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = camera
-    camera.select = True
+###
+###         BOUNDS
+###
 
-    for s in bpy.data.objects:
-        if s.name.startswith('Sun'):
-            s.select = True
+boundsCache = OrderedDict()
+boundsCacheSize = 32
+meshVersion = [0]
 
-    bpy.ops.object.parent_clear(type='CLEAR_KEEP_TRANSFORM')
+def touchMesh(me):
+
+    # call after changing vertex coordinates in place so cached bounds are dropped.
+    # versions are unique over the session, so a new mesh reusing the memory of a
+    # deleted one never picks up its bounds
+    meshVersion[0] += 1
+    me['meshVersion'] = meshVersion[0]
     return
 
-###
-###         ENVIRONMENT: TEXTURE SURFACE
-###
+def worldMatrix(ob):
 
-def sphericalSurface(aldenStim):
+    # matrix_world from the object's own transform, no scene update needed
+    if ob.parent:
+        return worldMatrix(ob.parent) * ob.matrix_parent_inverse * ob.matrix_basis
 
-    bpy.context.scene.update()
-    vertsGlobal = [aldenStim.matrix_world * v.co for v in aldenStim.data.vertices]
-    x = [v[0] for v in vertsGlobal]
-    y = [v[1] for v in vertsGlobal]
-    z = [v[2] for v in vertsGlobal]
-    radiusOptions = [abs(max(x)-aldenStim.location[0]),abs(max(y)-aldenStim.location[1]),abs(min(x)-aldenStim.location[0]),abs(min(y)-aldenStim.location[1]),abs(min(z)-aldenStim.location[2])]
+    return ob.matrix_basis.copy()
 
-    bpy.ops.mesh.primitive_uv_sphere_add(size=max(radiusOptions)*math.sqrt(2),location=aldenStim.location,rotation=(0,0,0))
-    bpy.ops.object.transform_apply(rotation=True)
-    bowl = bpy.data.objects['Sphere']
-    bowl.name = 'Bowl'
+def objectBounds(ob,matrix=None):
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = bowl
-    bowl.select = True
+    # world space min/max/center/extent of a mesh object, or of its vertices under
+    # another matrix. cached on the mesh version and the matrix
+    if matrix is None:
+        matrix = worldMatrix(ob)
 
-    bpy.ops.object.shade_smooth()
+    me = ob.data
+    if 'meshVersion' not in me:
+        touchMesh(me)
 
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.subdivide(number_cuts=1)
-    bpy.ops.mesh.select_mode(type='VERT')
-    bpy.ops.mesh.select_all(action='DESELECT')
+    key = (me.as_pointer(),me['meshVersion'],len(me.vertices),tuple(tuple(row) for row in matrix))
 
-    bpy.context.scene.update()
-    vertices = [vert for vert in bmesh.from_edit_mesh(bpy.context.object.data).verts]
+    if key in boundsCache:
+        boundsCache.move_to_end(key)
+        return boundsCache[key]
 
-    for ver in vertices:
-        verGlobalZ = aldenStim.matrix_world * ver.co
+    co = np.empty(len(me.vertices)*3,dtype=np.float32)
+    me.vertices.foreach_get('co',co)
 
-        if verGlobalZ[2] > aldenStim.location[2]:
-            ver.select = True
+    matrix = np.array(matrix,dtype=np.float64)
+    vertsGlobal = np.dot(co.reshape(-1,3),matrix[:3,:3].T) + matrix[:3,3]
 
-    bpy.ops.mesh.delete(type='VERT')
-    bpy.ops.object.mode_set(mode='OBJECT')
-    return bowl
+    minCo = Vector(vertsGlobal.min(axis=0))
+    maxCo = Vector(vertsGlobal.max(axis=0))
+    bounds = {'min':minCo,'max':maxCo,'center':(minCo+maxCo)/2,'extent':maxCo-minCo}
 
-def walls(aldenStim):
+    boundsCache[key] = bounds
+    while len(boundsCache) > boundsCacheSize:
+        boundsCache.popitem(last=False)
 
-    bpy.ops.object.select_all(action='DESELECT')
-    scn.objects.active = aldenStim
-    aldenStim.select = True
-
-    bpy.context.scene.update()
-    vertsGlobal = [aldenStim.matrix_world * v.co for v in aldenStim.data.vertices]
-    x = [v[0] for v in vertsGlobal]
-    minX = min(x)
-    maxX = max(x)
-    maxYshift = max([v[1] for v in vertsGlobal])-aldenStim.location[1]
-
-    bpy.ops.transform.rotate(value=-math.pi/180*50,axis=(0,0,1),constraint_axis=(False,False,True),constraint_orientation='GLOBAL')
-    bpy.ops.object.transform_apply(rotation=True)
-
-    bpy.context.scene.update()
-    vertsGlobal = [aldenStim.matrix_world * v.co for v in aldenStim.data.vertices]
-    minZ = min([v[2] for v in vertsGlobal])
-    y = [v[1] for v in vertsGlobal]
-    x = [v[0] for v in vertsGlobal]
-    maxYL = max(y)
-
-    bpy.ops.mesh.primitive_plane_add(radius=160,location=(-160+maxYshift,maxYL,160+minZ),rotation=(math.pi/2,0,0))
-    wallL = bpy.data.objects['Plane']
-    wallL.name = 'Left Wall'
+    return bounds
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = aldenStim
-    aldenStim.select = True
-    wallL.select = True
-    bpy.ops.object.parent_set(type='OBJECT',keep_transform=False)
+###
+###         ENVIRONMENT: TEXTURE SURFACE
+###
 
-    bpy.ops.object.select_all(action='DESELECT')
-    scn.objects.active = aldenStim
-    aldenStim.select = True
+def bowlRadius(aldenStim):
 
-    bpy.ops.transform.rotate(value=math.pi/180*120,axis=(0,0,1),constraint_axis=(False,False,True),constraint_orientation='GLOBAL')
-    bpy.ops.object.transform_apply(rotation=True)
+    bounds = objectBounds(aldenStim)
+    minCo = bounds['min']-aldenStim.location
+    maxCo = bounds['max']-aldenStim.location
+    radiusOptions = [abs(maxCo[0]),abs(maxCo[1]),abs(minCo[0]),abs(minCo[1]),abs(minCo[2])]
+    return max(radiusOptions)*math.sqrt(2)
 
-    bpy.context.scene.update()
-    vertsGlobal = [aldenStim.matrix_world * v.co for v in aldenStim.data.vertices]
-    minZ = min([v[2] for v in vertsGlobal])
-    y = [v[1] for v in vertsGlobal]
-    x = [v[0] for v in vertsGlobal]
-    maxYR = max(y)
+def bowlVerts(aldenStim):
 
-    bpy.ops.mesh.primitive_plane_add(radius=160,location=(160-maxYshift,maxYR,160+minZ),rotation=(math.pi/2,0,0))
-    wallR = bpy.data.objects['Plane']
-    wallR.name = 'Right Wall'
+    # the half of a once subdivided uv sphere below the stimulus, cut level with
+    # the stimulus' own z axis: the hemisphere turned by its rotation
+    verts,faces = envGeometry.bowl(bowlRadius(aldenStim))
+    rotation = np.array(worldMatrix(aldenStim),dtype=np.float64)[:3,:3]
+    rotation /= np.linalg.norm(rotation,axis=0)
+    return np.dot(verts,rotation), faces
 
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = aldenStim
-    aldenStim.select = True
-    wallR.select = True
-    bpy.ops.object.parent_set(type='OBJECT',keep_transform=False)
+def sphericalSurface(aldenStim):
+
+    verts,faces = bowlVerts(aldenStim)
+    bowl = bpy.data.objects.new('Bowl',meshFromArrays('Sphere',verts,faces))
+    bowl.data.polygons.foreach_set('use_smooth',np.ones(len(bowl.data.polygons),dtype=bool))
 
     bpy.ops.object.select_all(action='DESELECT')
-    scn.objects.active = aldenStim
-    aldenStim.select = True
+    bpy.context.scene.objects.link(bowl)
+    bpy.context.scene.objects.active = bowl
+    bowl.select = True
+    bowl.location = aldenStim.location.copy()
+    return bowl
 
-    bpy.ops.transform.rotate(value=-math.pi/180*70,axis=(0,0,1),constraint_axis=(False,False,True),constraint_orientation='GLOBAL')
-    bpy.ops.object.transform_apply(rotation=True)
+def walls(aldenStim):
 
-    bpy.ops.object.select_all(action='DESELECT')
-    scn.objects.active = wallL
-    wallL.select = True
+    wallMatL,wallMatR = wallMatrices(aldenStim)
+    wallL = addPlane('Left Wall',160,wallMatL)
+    wallR = addPlane('Right Wall',160,wallMatR)
+    return wallL, wallR
 
-    bpy.ops.object.parent_clear(type='CLEAR_KEEP_TRANSFORM')
+def wallMatrices(aldenStim):
 
-    bpy.ops.object.select_all(action='DESELECT')
-    scn.objects.active = wallR
-    wallR.select = True
+    # each wall is placed against the stimulus turned by -50 (left) or +70 (right)
+    # degrees about its location, then swung back with it
+    center = aldenStim.location.copy()
+    pivot = Matrix.Translation(center)
+    upright = Euler((math.pi/2,0,0)).to_matrix().to_4x4()
+
+    matrix = worldMatrix(aldenStim)
+    maxYshift = objectBounds(aldenStim,matrix)['max'][1]-center[1]
+
+    turnL = pivot * Matrix.Rotation(-math.pi/180*50,4,'Z') * pivot.inverted()
+    bounds = objectBounds(aldenStim,turnL*matrix)
+    wallL = turnL.inverted() * Matrix.Translation((-160+maxYshift,bounds['max'][1],160+bounds['min'][2])) * upright
 
-    bpy.ops.object.parent_clear(type='CLEAR_KEEP_TRANSFORM')
+    turnR = pivot * Matrix.Rotation(math.pi/180*70,4,'Z') * pivot.inverted()
+    bounds = objectBounds(aldenStim,turnR*matrix)
+    wallR = turnR.inverted() * Matrix.Translation((160-maxYshift,bounds['max'][1],160+bounds['min'][2])) * upright
     return wallL, wallR
 
-def triHorizon(aldenStim):
+def horizonMesh():
 
-    bpy.context.scene.update()
-    vertsGlobal = [aldenStim.matrix_world * v.co for v in aldenStim.data.vertices]
-    maxY = max([v[1] for v in vertsGlobal])
-    minZ = min([v[2] for v in vertsGlobal])
+    verts,faces = envGeometry.horizon(startPos=-500,height=1000,width=500)
+    return meshFromArrays('Horizon',verts,faces)
 
-    startPos = -500
-    height = 1000
-    width = 500
-    centerX = 0
+def triHorizon(aldenStim):
 
-    edges = []
-    verts = [(-1,startPos,minZ),(width,startPos+height,minZ),(-width,startPos+height,minZ),(1,startPos,minZ)]
-    faces = [(0,1,2,3)]
+    minZ = objectBounds(aldenStim)['min'][2]
 
-    me = bpy.data.meshes.new('Horizon')
-    me.from_pydata(verts,edges,faces)
-    horizonVisible = bpy.data.objects.new('Horizon', me)
+    # floor height lives in the object location so templates can move it
+    horizonVisible = bpy.data.objects.new('Horizon', horizonMesh())
     
     bpy.ops.object.select_all(action='DESELECT')
     scn.objects.link(horizonVisible)
 
-    horizonVisible.location += Vector((0,43,0))
+    horizonVisible.location += Vector((0,43,minZ))
     return horizonVisible
 
 ###
@@ -357,19 +457,10 @@ def lightingSetupHDR(aldenStim):
     scn = bpy.context.scene
 
     # position and orient single center camera
-    bpy.ops.object.camera_add(location=(0,-500,0), rotation=(math.pi/2,0,0))
-    camera = bpy.data.objects['Camera']
-    scn.camera = camera
-
-    camera.data.type = 'PERSP'
-    camera.data.clip_end = 4000
-    camera.data.lens = 500
-    camera.data.sensor_fit = 'HORIZONTAL'
-    camera.data.sensor_width = 160
+    camera = addCamera()
 
-    bpy.ops.object.empty_add(type='PLAIN_AXES',radius=1,location=(0,0,0))
-    skyEmpty = bpy.data.objects['Empty']
-    skyEmpty.name = 'SkyEmpty'
+    skyEmpty = bpy.data.objects.new('SkyEmpty',None)
+    scn.objects.link(skyEmpty)
 
     w = scn.world
     root = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/TextureResources/pro_lighting_skies_demo_hdris/'
@@ -378,9 +469,9 @@ def lightingSetupHDR(aldenStim):
     texCoord = w.node_tree.nodes.new('ShaderNodeTexCoord')
     texCoord.object = skyEmpty
     jpg = w.node_tree.nodes.new('ShaderNodeTexEnvironment')
-    jpg.image = bpy.data.images.load(root+'cloudy08_high.jpg')
+    jpg.image = loadImage(root+'cloudy08_high.jpg')
     exr = w.node_tree.nodes.new('ShaderNodeTexEnvironment')
-    exr.image = bpy.data.images.load(root+'cloudy08_EXR.exr')
+    exr.image = loadImage(root+'cloudy08_EXR.exr')
     multiply = w.node_tree.nodes.new('ShaderNodeMath')
     multiply.operation = 'MULTIPLY'
     multiply.inputs[1].default_value = 0.2
@@ -424,19 +515,11 @@ def lightingSetupHDR(aldenStim):
     bpy.context.scene.world.light_settings.gather_method = 'APPROXIMATE'
     bpy.context.scene.world.light_settings.passes = 3
 
-    bpy.context.scene.update()
-    vertsGlobal = [aldenStim.matrix_world * v.co for v in aldenStim.data.vertices]
-    z = [v[2] for v in vertsGlobal]
-    centerHeight = (max(z)-min(z))/2
+    centerHeight = objectBounds(aldenStim)['extent'][2]/2
 
     skyEmpty.location = Vector((0,0,-0.03-centerHeight/1000)) # subtract the amount of alden scaling
     skyEmpty.rotation_euler = Euler((0,0,math.pi/180*180))
-
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.scene.objects.active = skyEmpty
-    skyEmpty.select = True
-
-    bpy.ops.transform.resize(value=(10,10,5),constraint_axis=(True, True, True))
+    skyEmpty.scale = Vector((10,10,5))
 
     correctAldenRotation(aldenStim,camera,False,-math.pi/180*2.2)
     return
@@ -446,15 +529,7 @@ def lightingSetupPlain(aldenStim):
     scn = bpy.context.scene
 
     # position and orient single, center camera
-    bpy.ops.object.camera_add(location=(0,-500,0), rotation=(math.pi/2,0,0))
-    camera = bpy.data.objects['Camera']
-    scn.camera = camera
-
-    camera.data.type = 'PERSP'
-    camera.data.clip_end = 4000
-    camera.data.lens = 500
-    camera.data.sensor_fit = 'HORIZONTAL'
-    camera.data.sensor_width = 160
+    camera = addCamera()
 
     # sky gray with sunlight
     bpy.context.scene.world.use_nodes = True
@@ -471,15 +546,7 @@ def lightingSetupFront(aldenStim):
     scn = bpy.context.scene
 
     # position and orient single, center camera
-    bpy.ops.object.camera_add(location=(0,-500,0), rotation=(math.pi/2,0,0))
-    camera = bpy.data.objects['Camera']
-    scn.camera = camera
-
-    camera.data.type = 'PERSP'
-    camera.data.clip_end = 4000
-    camera.data.lens = 500
-    camera.data.sensor_fit = 'HORIZONTAL'
-    camera.data.sensor_width = 160
+    camera = addCamera()
 
     # sky gray with sunlight
     bpy.context.scene.world.use_nodes = True
@@ -496,15 +563,7 @@ def lightingSetupFive(aldenStim):
     scn = bpy.context.scene
 
     # position and orient single, center camera
-    bpy.ops.object.camera_add(location=(0,-500,0), rotation=(math.pi/2,0,0))
-    camera = bpy.data.objects['Camera']
-    scn.camera = camera
-
-    camera.data.type = 'PERSP'
-    camera.data.clip_end = 4000
-    camera.data.lens = 500
-    camera.data.sensor_fit = 'HORIZONTAL'
-    camera.data.sensor_width = 160
+    camera = addCamera()
 
     # sky gray with sunlight
     bpy.context.scene.world.use_nodes = True
@@ -517,6 +576,70 @@ def lightingSetupFive(aldenStim):
     correctAldenRotation(aldenStim,camera,True,-math.pi/180*2.2,frontLight=2)
     return
 
+# per surface kind: texture mapping scale, displacement strength and mid level,
+# smooth shading, the floor color under the HDR sky and the textures_com image.
+# floor hex keeps flat geometry and only gets its relief from the normal map
+textureKinds = {
+    'Wall_Wooden':  {'scale':(0.25,0.25,0.25),'strength':0.3,'midLevel':1.0,'displace':True,'smooth':False,'floorColor':None,'image':'Wall_Wooden'},
+    'Wall_Mosaic':  {'scale':(0.3/4,0.3/4,0.3/4),'strength':0.1,'midLevel':1.0,'displace':True,'smooth':False,'floorColor':None,'image':'Wall_Mosaic'},
+    'Floor_Hex':    {'scale':(0.15/2,0.3/2*1.5,0.15/2),'strength':0.2,'midLevel':0.0,'displace':False,'smooth':False,'floorColor':(0.279,0.246,0.205,1.0),'image':'Floor_Hex'},
+    'Cracked_Soil': {'scale':(0.1/2,0.2/2*1.5,0.1/2),'strength':1.0,'midLevel':0.0,'displace':True,'smooth':True,'floorColor':(0.098,0.084,0.080,1.0),'image':'Cracked_Soil'},
+    'Dense_Scrub':  {'scale':(0.05/2,0.25/2*1.5,0.25/2),'strength':0.2,'midLevel':0.0,'displace':True,'smooth':True,'floorColor':(0.231,0.216,0.181,1.0),'image':'Scrub'},
+}
+
+def displaceEnvironment(environment,kind):
+
+    # uv unwrap, subdivide and displace a textured surface in its own space
+    settings = textureKinds[kind]
+    root = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/TextureResources/textures_com/'
+
+    bpy.ops.object.select_all(action='DESELECT')
+    bpy.context.scene.objects.active = environment
+    environment.select = True
+
+    if len(environment.data.uv_layers) == 0:
+        bpy.ops.object.mode_set(mode='EDIT')
+        bpy.ops.mesh.select_all(action='SELECT')
+        bpy.ops.uv.smart_project(angle_limit=66.0, island_margin=0.0)
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+        # what subdividing with 100 and then 2 cuts makes of the quad
+        environment.data = subdividedQuad(environment.data,303)
+
+    if settings['smooth']:
+        bpy.ops.object.shade_smooth()
+
+    if settings['displace']:
+        wallDisp = bpy.data.textures.new('Displacement',type='IMAGE')
+        wallDisp.image = loadImage(root+settings['image']+'_Displace.jpg')
+        wallDisp.crop_max_x = 1/settings['scale'][0]
+        wallDisp.crop_max_y = 1/settings['scale'][1]
+
+        wallTex = environment.modifiers.new('Displace',type='DISPLACE')
+        wallTex.texture = wallDisp
+        wallTex.texture_coords = 'UV'
+        wallTex.strength = settings['strength']
+        wallTex.mid_level = settings['midLevel']
+        bpy.ops.object.modifier_apply(apply_as='DATA',modifier=wallTex.name)
+
+    return
+
+def subdividedQuad(me,segments):
+
+    # the single quad of me as a segments x segments grid with its uv map
+    index = np.empty(4,dtype=np.int32)
+    me.loops.foreach_get('vertex_index',index)
+    co = np.empty(len(me.vertices)*3,dtype=np.float32)
+    me.vertices.foreach_get('co',co)
+    uv = np.empty(8,dtype=np.float32)
+    me.uv_layers[0].data.foreach_get('uv',uv)
+
+    verts,faces,uvs = envGeometry.quadGrid(co.reshape(-1,3)[index],uv,segments)
+    grid = meshFromArrays(me.name,verts,faces)
+    grid.uv_textures.new(me.uv_layers[0].name)
+    grid.uv_layers[0].data.foreach_set('uv',uvs.ravel())
+    return grid
+
 def makeEnvironmentTexture(environment,kind='Bowl'):
 
     bpy.ops.object.select_all(action='DESELECT')
@@ -549,95 +672,45 @@ def makeEnvironmentTexture(environment,kind='Bowl'):
         mat.node_tree.links.new(mix.outputs[0],mat.node_tree.nodes[0].inputs[0])
         shift = 0
 
-    elif kind in ['Floor_Hex','Dense_Scrub','Cracked_Soil','Wall_Wooden','Wall_Mosaic']:
+    elif kind in textureKinds and preview['active']:
+        # flat and untextured, but lowered as far as the displaced surface so
+        # the stimulus sits where it does in the full render
+        settings = textureKinds[kind]
+        if settings['floorColor']:
+            bpy.context.scene.world.node_tree.nodes['RGB'].outputs[0].default_value = settings['floorColor']
+            mat.node_tree.nodes[1].inputs[0].default_value = settings['floorColor']
+
+        shift = settings['strength']
 
+    elif kind in textureKinds:
+        settings = textureKinds[kind]
         root = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/TextureResources/textures_com/'
-        
-        if len(environment.data.uv_layers) == 0:
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.uv.smart_project(angle_limit=66.0, island_margin=0.0)
 
-            bpy.ops.mesh.subdivide(number_cuts=100)
-            bpy.ops.mesh.subdivide(number_cuts=2)
-            bpy.ops.object.mode_set(mode='OBJECT')
+        # geometry only depends on kind, take the baked mesh when there is one
+        if kind in envAssets:
+            environment.data = envAssets[kind].copy()
+        else:
+            displaceEnvironment(environment,kind)
+
+        if kind == 'Dense_Scrub':
+            makeScrub(environment,kind)
 
         texCoord = mat.node_tree.nodes.new('ShaderNodeTexCoord')
         mapping = mat.node_tree.nodes.new('ShaderNodeMapping')
         mapping.vector_type = 'TEXTURE'
+        mapping.scale = settings['scale']
 
-        # displacement part one:
-        wallDisp = bpy.data.textures.new('Displacement',type='IMAGE')
-        bpy.ops.object.modifier_add(type='DISPLACE')
-        wallTex = bpy.context.object.modifiers['Displace']
-        wallTex.texture = wallDisp
-        wallTex.texture_coords = 'UV'
-        
-        extraFloor = bpy.context.scene.world.node_tree.nodes['RGB'].outputs[0]
-
-        if kind == 'Wall_Wooden':
-            mapping.scale[0] = 0.25
-            mapping.scale[1] = 0.25
-            mapping.scale[2] = 0.25
-            wallTex.strength = 0.3
-            shift = wallTex.strength
-            wallTex.mid_level = 1.0
-
-        elif kind == 'Wall_Mosaic':
-            mapping.scale[0] = 0.3/4
-            mapping.scale[1] = 0.3/4
-            mapping.scale[2] = 0.3/4
-            wallTex.strength = 0.1
-            shift = wallTex.strength
-            wallTex.mid_level = 1.0
-
-        elif kind == 'Floor_Hex':
-            mapping.scale[0] = 0.15/2
-            mapping.scale[1] = 0.3/2*1.5
-            mapping.scale[2] = 0.15/2
-            wallTex.strength = 0.2
-            shift = wallTex.strength
-            wallTex.mid_level = 0.0
-            extraFloor.default_value = (0.279,0.246,0.205,1.0)
-
-        elif kind == 'Cracked_Soil':
-            mapping.scale[0] = 0.1/2
-            mapping.scale[1] = 0.2/2*1.5
-            mapping.scale[2] = 0.1/2
-            bpy.ops.object.shade_smooth()
-            wallTex.strength = 1.0
-            shift = wallTex.strength
-            wallTex.mid_level = 0.0
-            extraFloor.default_value = (0.098,0.084,0.080,1.0)
-
-        elif kind == 'Dense_Scrub':
-            mapping.scale[0] = 0.05/2
-            mapping.scale[1] = 0.25/2*1.5
-            mapping.scale[2] = 0.25/2
-            bpy.ops.object.shade_smooth()
-            wallTex.strength = 0.2
-            shift = wallTex.strength
-            wallTex.mid_level = 0.0
-            makeScrub(environment,kind)
-            kind = 'Scrub'
-            extraFloor.default_value = (0.231,0.216,0.181,1.0)
-
-        # displacement part two:
-        wallDisp.image = bpy.data.images.load(root+kind+'_Displace.jpg')
-        wallDisp.crop_max_x = 1/mapping.scale[0]
-        wallDisp.crop_max_y = 1/mapping.scale[1]
-
-        if kind == 'Floor_Hex':
-            bpy.ops.object.modifier_remove(modifier='Displace')
+        if settings['floorColor']:
+            extraFloor = bpy.context.scene.world.node_tree.nodes['RGB'].outputs[0]
+            extraFloor.default_value = settings['floorColor']
 
-        else:
-            bpy.ops.object.modifier_apply(apply_as='DATA',modifier='Displace')
+        shift = settings['strength']
 
         im = mat.node_tree.nodes.new('ShaderNodeTexImage')
-        im.image = bpy.data.images.load(root+kind+'.jpg')
+        im.image = loadImage(root+settings['image']+'.jpg')
 
         imNormal = mat.node_tree.nodes.new('ShaderNodeTexImage')
-        imNormal.image = bpy.data.images.load(root+kind+'_Normal.jpg')
+        imNormal.image = loadImage(root+settings['image']+'_Normal.jpg')
         imNormal.color_space = 'NONE'
 
         diffuse = mat.node_tree.nodes[1]
@@ -658,18 +731,20 @@ def makeEnvironmentTexture(environment,kind='Bowl'):
 
 def makeFade(environment):
 
-    colorLayer = environment.data.vertex_colors.new('Fading Bowl')
+    # every loop gets the height of its vertex between the lowest (0) and the
+    # highest (1) as its color, written in one go. 2.79 vertex colors are RGB
+    me = environment.data
+    colorLayer = me.vertex_colors.get('Fading Bowl') or me.vertex_colors.new('Fading Bowl')
 
-    verts = [v for v in environment.data.vertices]
-    allZ = [v.co.z for v in verts]
-    minZ = min(allZ)
-    maxZ = max(allZ)
+    co = np.empty(len(me.vertices)*3,dtype=np.float32)
+    me.vertices.foreach_get('co',co)
+    allZ = co[2::3].astype(np.float64)
 
-    for face in environment.data.polygons:
-        for vert,loop in zip(face.vertices,face.loop_indices):
-            colorMulti = (verts[vert].co.z-minZ)/(maxZ-minZ)
-            colorLayer.data[loop].color = (1.0*colorMulti,1.0*colorMulti,1.0*colorMulti) #,1.0*colorMulti)
+    index = np.empty(len(me.loops),dtype=np.int32)
+    me.loops.foreach_get('vertex_index',index)
 
+    colorMulti = (allZ[index]-allZ.min())/(allZ.max()-allZ.min())
+    colorLayer.data.foreach_set('color',np.repeat(colorMulti,3).astype(np.float32))
     return
 
 ###
@@ -678,45 +753,41 @@ def makeFade(environment):
 
 def stereotypicalGrass(xMin=None,xMax=None,yMin=None,yMax=None,leeway=None):
 
-    # load plants for grouping
+    # the plants are imported once per session and kept out of the scene as the
+    # 'Grasses' group: both plants in four hues, where the hues are linked
+    # duplicates sharing one mesh with their own object-level material
+    grasses = bpy.data.groups.get('Grasses')
+    if grasses is not None and len(grasses.objects) > 0:
+        return grasses
+
     root = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/TextureResources/'
     numVarieties = 4
 
-    for hue in range(0,numVarieties):
-        bpy.ops.wm.collada_import(filepath=root+'scrubBlockPlantFinal.dae')
+    bpy.ops.wm.collada_import(filepath=root+'scrubBlockPlantFinal.dae')
+    plants = [p for p in bpy.context.scene.objects if p.name.startswith('Plant1') or p.name.startswith('Plant2')]
 
-    # add plants to group
-    plants1 = [p for p in bpy.context.scene.objects if p.name.startswith('Plant1')]
-    plants2 = [p for p in bpy.context.scene.objects if p.name.startswith('Plant2')]
-    bpy.ops.object.group_add()
-    bpy.data.groups[0].name = 'Grasses'
+    if grasses is None:
+        grasses = bpy.data.groups.new('Grasses')
+    grasses.use_fake_user = True
 
-    # resize and color plant1
-    for hue in range(0,numVarieties):
-        plant = plants1[hue]
+    for plant in plants:
 
+        # resize once into the mesh itself
         bpy.ops.object.select_all(action='DESELECT')
         bpy.context.scene.objects.active = plant
         plant.select = True
         plant.location = Vector((0,0,4000))
         bpy.ops.transform.resize(value=(12,12,12),constraint_axis=(True, True, True))
         bpy.ops.object.transform_apply(scale=True)
-        bpy.ops.object.group_link(group='Grasses')
-        plantHue(plant,hue)
+        bpy.context.scene.objects.unlink(plant)
 
-    # resize and color plant2
-    for hue in range(0,numVarieties):
-        plant = plants2[hue]
+        for hue in range(0,numVarieties):
+            instance = plant if hue == 0 else plant.copy()
+            instance.use_fake_user = True
+            grasses.objects.link(instance)
+            plantHue(instance,hue)
 
-        bpy.ops.object.select_all(action='DESELECT')
-        bpy.context.scene.objects.active = plant
-        plant.select = True
-        plant.location = Vector((0,0,4000))
-        bpy.ops.transform.resize(value=(12,12,12),constraint_axis=(True, True, True))
-        bpy.ops.object.transform_apply(scale=True)
-        bpy.ops.object.group_link(group='Grasses')
-        plantHue(plant,hue)
-    return
+    return grasses
 
 def plantHue(plant,plantHue):
 
@@ -750,26 +821,28 @@ def plantHue(plant,plantHue):
     gradient.color_ramp.elements[1].color = light
     gradient.color_ramp.elements[1].position = 1.0
     matGradient.node_tree.links.new(gradient.outputs[0],matGradient.node_tree.nodes[1].inputs[0])
-    bpy.ops.object.material_slot_add()
+
+    # the mesh is shared between hues, so the material goes on the object
+    if len(plant.material_slots) == 0:
+        plant.data.materials.append(None)
+    plant.material_slots[0].link = 'OBJECT'
     plant.material_slots[0].material = matGradient
-    bpy.ops.object.material_slot_assign()
     return
 
-def makeScrub(horizon,kind,xMin=None,xMax=None,yMin=None,yMax=None,leeway=None):
+def scrubParticles(kind):
 
-    stereotypicalGrass()
-    bpy.context.scene.objects.active = horizon
-    bpy.ops.object.select_all(action='DESELECT')
-    horizon.select = True
+    # hair settings instancing the plant group, made once and shared by every
+    # scrub particle system
+    particleGroup = bpy.data.particles.get('Scrub ' + kind)
+    if particleGroup is not None:
+        return particleGroup
 
-    particlesOrig = [p for p in bpy.data.particles]
-    bpy.ops.object.particle_system_add()
-    particles = [p for p in bpy.data.particles]
-    particleGroup = [p for p in particles if p not in particlesOrig][0]
+    particleGroup = bpy.data.particles.new('Scrub ' + kind)
+    particleGroup.use_fake_user = True
     particleGroup.type = 'HAIR'
 
     particleGroup.render_type = 'GROUP'
-    particleGroup.dupli_group = bpy.data.groups['Grasses']
+    particleGroup.dupli_group = stereotypicalGrass()
     particleGroup.use_rotation_dupli = True
 
     particleGroup.size_random = 0.5
@@ -790,6 +863,24 @@ def makeScrub(horizon,kind,xMin=None,xMax=None,yMin=None,yMax=None,leeway=None):
     if kind == 'Dense_Scrub':
         particleGroup.count = 200
 
+    tex = bpy.data.textures.new('Scrub Clumps',type='VORONOI')
+    slot = particleGroup.texture_slots.add()
+    slot.texture = tex
+    slot.use_map_length = True
+    slot.use_map_clump = True
+    return particleGroup
+
+def makeScrub(horizon,kind,xMin=None,xMax=None,yMin=None,yMax=None,leeway=None):
+
+    # settings first, the first call imports the plants and changes the active object
+    particleGroup = scrubParticles(kind)
+    bpy.context.scene.objects.active = horizon
+    bpy.ops.object.select_all(action='DESELECT')
+    horizon.select = True
+
+    bpy.ops.object.particle_system_add()
+    horizon.particle_systems[-1].settings = particleGroup
+
     verts = horizon.data.vertices
 
     # bpy.ops.paint.weight_gradient() api context problem
@@ -799,40 +890,122 @@ def makeScrub(horizon,kind,xMin=None,xMax=None,yMin=None,yMax=None,leeway=None):
 
     obVertexGroup = horizon.vertex_groups[0]
 
-    for vertex in verts:
-        vertGlobal = horizon.matrix_world * vertex.co
-
-        if xMin == None:
-            obVertexGroup.add([vertex.index],1.4-(vertex.co.y+1)/50,'REPLACE')
-
-        else:
+    co = np.empty(len(verts)*3,dtype=np.float32)
+    verts.foreach_get('co',co)
+    co = co.reshape(-1,3).astype(np.float64)
+    weights = 1.4-(co[:,1]+1)/50
 
-            if vertGlobal[0] > (xMin-leeway) and vertGlobal[0] < (xMax+leeway) and vertGlobal[1] > (yMin-leeway) and vertGlobal[1] < (yMax+leeway):
-                obVertexGroup.add([vertex.index],0.0,'REPLACE')
+    if xMin != None:
+        matrix = np.array(worldMatrix(horizon),dtype=np.float64)
+        vertGlobal = np.dot(co,matrix[:3,:3].T) + matrix[:3,3]
+        inside = (vertGlobal[:,0] > (xMin-leeway)) & (vertGlobal[:,0] < (xMax+leeway)) & (vertGlobal[:,1] > (yMin-leeway)) & (vertGlobal[:,1] < (yMax+leeway))
+        weights[inside] = 0.0
 
-            else:
-                obVertexGroup.add([vertex.index],1.4-(vertex.co.y+1)/50,'REPLACE')
+    # vertex groups have no bulk setter, but add takes any number of vertices
+    # for one weight. the weight only depends on the row, so one call per row
+    values,rows = np.unique(weights,return_inverse=True)
+    order = np.argsort(rows,kind='stable')
+    for value,index in zip(values,np.split(order,np.cumsum(np.bincount(rows.ravel()))[:-1])):
+        obVertexGroup.add(index.tolist(),float(value),'REPLACE')
 
     horizon.data.update()
-    bpy.ops.texture.new()
-    tex = bpy.data.textures[0]
-    tex.type = 'VORONOI'
-    slot = particleGroup.texture_slots.add()
-    slot.texture = tex
-    slot.use_map_length = True
-    slot.use_map_clump = True
     return
 
 ###
 ###         RENDER
 ###
 
+def removeImage(imageFile):
+
+    # an output may be a hard link into renderCacheDir, writing over it in place
+    # would change the cached image of another job as well
+    if os.path.lexists(imageFile):
+        os.remove(imageFile)
+    return
+
 def render(destination):
 
+    removeImage(destination + bpy.context.scene.render.file_extension)
     bpy.context.scene.render.filepath = destination
     bpy.context.scene.frame_set(0)
-    bpy.ops.render.render(write_still=True)
-    return
+    with capturingStats():
+        bpy.ops.render.render(write_still=True)
+    logRenderStats(bpy.context.scene.cycles.samples)
+    return bpy.context.scene.cycles.samples
+
+def readPixels(imageFile):
+
+    # float RGBA pixels of an image file, bottom row first as in Image.pixels
+    im = bpy.data.images.load(imageFile)
+    pixels = np.array(im.pixels[:],dtype=np.float64)
+    bpy.data.images.remove(im)
+    return pixels.reshape(-1,4)
+
+def renderProgressive(destination,noiseThreshold=None,chunkSamples=None,maxSamples=None):
+
+    # render in chunks of samples with different seeds and average them. the
+    # spread between chunks estimates the noise left in their mean; stop once
+    # the 95th percentile of the relative error is under the threshold or the
+    # sample cap (scn.cycles.samples by default) is spent
+    scn = bpy.context.scene
+    if noiseThreshold is None:
+        noiseThreshold = progressiveThreshold
+    chunkSamples = chunkSamples or progressiveChunk
+    maxSamples = maxSamples or scn.cycles.samples
+
+    samples = scn.cycles.samples
+    seed = scn.cycles.seed
+    fileFormat = scn.render.image_settings.file_format
+    chunkFile = destination + '_chunk.exr'
+
+    scn.cycles.samples = chunkSamples
+    scn.render.image_settings.file_format = 'OPEN_EXR'
+
+    # the scene settings come back however the chunks end, later jobs render with them
+    try:
+        chunks = 0
+        while chunks*chunkSamples < maxSamples:
+            scn.cycles.seed = seed + chunks
+            render(chunkFile[:-4])
+            pixels = readPixels(chunkFile)
+
+            if chunks == 0:
+                total = pixels
+                totalSq = pixels**2
+            else:
+                total += pixels
+                totalSq += pixels**2
+
+            chunks += 1
+            if chunks < 2:
+                continue
+
+            mean = total/chunks
+            variance = np.maximum(totalSq/chunks-mean**2,0)*chunks/(chunks-1)
+            luminance = mean[:,:3].mean(axis=1)
+            error = np.sqrt(variance[:,:3].mean(axis=1)/chunks)/(luminance+0.01)
+            noise = np.percentile(error,95)
+            print('Progressive render: ' + str(chunks*chunkSamples) + ' samples, noise ' + str(round(noise,4)))
+
+            if noise < noiseThreshold:
+                break
+
+    finally:
+        if os.path.exists(chunkFile):
+            os.remove(chunkFile)
+        scn.cycles.samples = samples
+        scn.cycles.seed = seed
+        scn.render.image_settings.file_format = fileFormat
+
+    # write the averaged image through the scene's color management and output format
+    width = int(scn.render.resolution_x*scn.render.resolution_percentage/100)
+    height = int(scn.render.resolution_y*scn.render.resolution_percentage/100)
+    im = bpy.data.images.new('Progressive',width,height,alpha=True,float_buffer=True)
+    im.pixels[:] = (total/chunks).ravel().tolist()
+    removeImage(destination + scn.render.file_extension)
+    im.save_render(destination + scn.render.file_extension,scene=scn)
+    bpy.data.images.remove(im)
+    return chunks*chunkSamples
 
 def deleteAllObjects():
 
@@ -845,6 +1018,7 @@ def deleteAllObjects():
             bpy.ops.object.delete(use_global=False)
 
     deleteAllNodes()
+    purgeOrphans()
     return
 
 def deleteAllNodes():
@@ -867,58 +1041,892 @@ def deleteSingleObject(ob):
     return
 
 ###
-###         MAIN
+###         ENVIRONMENT ASSETS
 ###
 
-def doLandscape(aldenStim,landscapeType):
+envAssets = {}
+assetLibrary = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/TextureResources/environmentAssets.blend'
 
-    lightingSetupHDR(aldenStim)                         # HDR lighting
-    plane = triHorizon(aldenStim)
-    aldenShift = makeEnvironmentTexture(plane,landscapeType)
-    plane.location[2] = plane.location[2] - aldenShift
-    return
+def bakeEnvironmentAssets(libraryFile=assetLibrary):
 
-def doRoom(aldenStim,floorType,wallLtype,wallRtype):
+    # run the uv unwrap, subdivision and displacement of every textured kind once
+    # on the base floor or wall and keep the resulting meshes in a .blend library.
+    # rerun whenever textureKinds or the textures_com images change
+    for me in envAssets.values():
+        bpy.data.meshes.remove(me)
+    envAssets.clear()
 
-    lightingSetupHDR(aldenStim)                         # HDR lighting
-    plane = triHorizon(aldenStim)
-    wallL,wallR = walls(aldenStim)
-    aldenShift = makeEnvironmentTexture(plane,floorType)
-    makeEnvironmentTexture(wallL,wallLtype)
-    makeEnvironmentTexture(wallR,wallRtype)
-    plane.location[2] = plane.location[2] - aldenShift
-    wallL.location[2] = wallL.location[2] - aldenShift
-    wallR.location[2] = wallR.location[2] - aldenShift
-    return
+    meshes = set()
+    for kind in textureKinds:
+        if kind.startswith('Wall'):
+            ob = addPlane('Bake',160,Matrix.Identity(4))
+        else:
+            ob = bpy.data.objects.new('Bake',horizonMesh())
+            bpy.context.scene.objects.link(ob)
 
-def main(vertSpec,faceSpec,environmentDetail,outputDestination):
-    # mirror   glass
-    # 0 	 5 closed
-    # 1 	 6 open grass
-    # 2 	 7 open soil
-    # 3 	 8 uncorrugated bowl
-    # 4 	 9 corrugated bowl
+        displaceEnvironment(ob,kind)
+        me = ob.data
+        me.name = 'Env_' + kind
+        bpy.data.objects.remove(ob,do_unlink=True)
+        meshes.add(me)
 
-    deleteAllObjects()
-    aldenStim = draw(vertSpec,faceSpec)
+    bpy.data.libraries.write(libraryFile,meshes,fake_user=True)
 
-    if environmentDetail in range(0,4):
-        makeRamStimShader(aldenStim,'Mirror')
+    for me in meshes:
+        me.use_fake_user = True
+        envAssets[me.name[4:]] = me
 
-    elif environmentDetail == 4:
-        makeRamStimShader(aldenStim,'CorrugatedMirror')
+    print('Baked ' + str(len(meshes)) + ' environment meshes into ' + libraryFile)
+    return
 
-    elif environmentDetail in range(5,9):
-        makeRamStimShader(aldenStim,'Uncorrugated')
+def loadEnvironmentAssets(libraryFile=assetLibrary):
 
-    elif environmentDetail == 9:
-        makeRamStimShader(aldenStim,'Corrugated')
+    if not os.path.exists(libraryFile):
+        return
 
-    elif environmentDetail == 10:
-        makeRamStimShader(aldenStim,'UVUnwrap')
+    with bpy.data.libraries.load(libraryFile) as (dataFrom,dataTo):
+        dataTo.meshes = [name for name in dataFrom.meshes if name.startswith('Env_')]
 
-    elif environmentDetail == 11:
-        makeRamStimShader(aldenStim,'Plain')
+    for me in dataTo.meshes:
+        me.use_fake_user = True
+        envAssets[me.name[4:]] = me
+
+    return
+
+###
+###         IMAGE CACHE
+###
+
+imageCache = OrderedDict()
+imageCacheStats = {'hits':0,'misses':0,'evictions':0}
+
+def imageBytes(im):
+
+    # decoded size, zero while the pixels have not been read yet
+    if not im.has_data:
+        return 0
+
+    return im.size[0]*im.size[1]*im.channels*(4 if im.is_float else 1)
+
+def loadImage(imageFile):
+
+    # bpy.data.images.load that hands back the datablock already loaded for a path
+    # instead of decoding it again into a '.001' copy
+    key = os.path.abspath(imageFile)
+    im = bpy.data.images.get(imageCache.get(key,''))
+
+    if im is not None and os.path.abspath(bpy.path.abspath(im.filepath)) == key:
+        imageCacheStats['hits'] += 1
+        imageCache.move_to_end(key)
+        return im
+
+    imageCacheStats['misses'] += 1
+    im = bpy.data.images.load(key)
+    imageCache[key] = im.name
+    evictImages()
+    return im
+
+def evictImages():
+
+    # free least recently used images nothing uses any more until under the cap.
+    # images still in use are kept even if that leaves the cache over the cap
+    total = 0
+    for key in imageCache:
+        im = bpy.data.images.get(imageCache[key])
+        total += imageBytes(im) if im else 0
+
+    for key in list(imageCache):
+        if total <= imageCacheLimit:
+            break
+
+        im = bpy.data.images.get(imageCache[key])
+        if im is None:
+            del imageCache[key]
+
+        elif im.users == 0:
+            total -= imageBytes(im)
+            bpy.data.images.remove(im)
+            del imageCache[key]
+            imageCacheStats['evictions'] += 1
+
+    return
+
+def purgeOrphans():
+
+    # drop the meshes, materials, textures etc. left behind by deleted objects so the
+    # images they point to can be evicted. cached images themselves are kept
+    for collection in [bpy.data.meshes,bpy.data.materials,bpy.data.textures,bpy.data.lamps,bpy.data.cameras,bpy.data.particles]:
+        for block in list(collection):
+            if block.users == 0:
+                collection.remove(block)
+
+    return
+
+###
+###         ENVIRONMENT TEMPLATES
+###
+
+envTemplates = {}
+
+def saveTemplate(aldenStim,environmentDetail):
+
+    scn = bpy.context.scene
+    template = {'objects':[],'world':scn.world,'camera':scn.camera,'sky':None,'plane':None,'walls':None,'bowl':None}
+
+    names = {}
+    for ob in scn.objects:
+        if ob != aldenStim:
+            names[ob.name] = ob
+            template['objects'].append(ob)
+
+    template['sky'] = names.get('SkyEmpty')
+    template['plane'] = names.get('Horizon')
+    template['bowl'] = names.get('Bowl')
+
+    if 'Left Wall' in names:
+        template['walls'] = (names['Left Wall'],names['Right Wall'])
+
+    # floor and walls are lowered by the displacement strength of the floor
+    template['shift'] = 0
+
+    if template['plane']:
+        template['shift'] = objectBounds(aldenStim)['min'][2]-template['plane'].location[2]
+
+    # keep the datablocks alive while unlinked and out of the way of name lookups
+    for ob in template['objects']:
+        ob.use_fake_user = True
+        ob.name = 'Template' + str(environmentDetail) + ' ' + ob.name
+
+    scn.world.use_fake_user = True
+    envTemplates[environmentDetail] = template
+    return
+
+def stashTemplates():
+
+    scn = bpy.context.scene
+
+    for template in envTemplates.values():
+        for ob in template['objects']:
+            if ob.name in scn.objects:
+                scn.objects.unlink(ob)
+
+    scn.world = baseWorld
+    return
+
+def placeInTemplate(aldenStim,environmentDetail):
+
+    scn = bpy.context.scene
+    template = envTemplates[environmentDetail]
+
+    for ob in template['objects']:
+        scn.objects.link(ob)
+
+    scn.world = template['world']
+    scn.camera = template['camera']
+
+    # sky height is taken before the stimulus is rotated, as in lightingSetupHDR
+    if template['sky']:
+        centerHeight = objectBounds(aldenStim)['extent'][2]/2
+        template['sky'].location = Vector((0,0,-0.03-centerHeight/1000))
+
+    # the camera is tilted along with the stimulus in correctAldenRotation, so
+    # reset it before placing. sun lamps only carry a direction and are kept
+    camera = template['camera']
+    camera.location = Vector((0,-500,0))
+    camera.rotation_euler = Euler((math.pi/2,0,0))
+    correctAldenRotation(aldenStim,camera,False,-math.pi/180*2.2)
+
+    shift = template['shift']
+
+    if template['plane']:
+        template['plane'].location[2] = objectBounds(aldenStim)['min'][2]-shift
+
+    if template['walls']:
+        wallMatL,wallMatR = wallMatrices(aldenStim)
+        wallL,wallR = template['walls']
+        wallL.matrix_world = wallMatL
+        wallR.matrix_world = wallMatR
+        wallL.location[2] = wallL.location[2] - shift
+        wallR.location[2] = wallR.location[2] - shift
+
+    # the cut of the bowl and its fade follow the stimulus' rotation, so its
+    # vertices and colors are made again as sphericalSurface would
+    if template['bowl']:
+        me = template['bowl'].data
+        me.vertices.foreach_set('co',bowlVerts(aldenStim)[0].astype(np.float32).ravel())
+        me.update()
+        touchMesh(me)
+        makeFade(template['bowl'])
+        template['bowl'].location = aldenStim.location.copy()
+
+    scn.update()
+    return
+
+def clearTemplates():
+
+    stashTemplates()
+
+    for template in envTemplates.values():
+        for ob in template['objects']:
+            bpy.data.objects.remove(ob,do_unlink=True)
+
+        bpy.data.worlds.remove(template['world'],do_unlink=True)
+
+    envTemplates.clear()
+    return
+
+###
+###         RENDER PROFILE
+###
+
+# fastest tile size and thread count per environment code on this machine, as
+# found by autotune (autotuneRender.py)
+renderProfile = {}
+defaultTile = 32
+renderProfileFile = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/renderProfile.json'
+
+def availableCores():
+
+    return len(os.sched_getaffinity(0)) if hasattr(os,'sched_getaffinity') else os.cpu_count()
+
+def loadRenderProfile(profileFile=renderProfileFile):
+
+    renderProfile.clear()
+    if not os.path.exists(profileFile):
+        return
+
+    with open(profileFile) as inputfile:
+        profile = json.load(inputfile)
+
+    # timings from another machine say nothing about this one
+    if profile.get('host') != platform.node():
+        print('Render profile ' + profileFile + ' was tuned on ' + str(profile.get('host')) + ', not using it')
+        return
+
+    renderProfile.update(profile['envs'])
+    return
+
+def applyRenderProfile(environmentDetail):
+
+    # codes without an entry go back to the untuned settings, so nothing the job
+    # before tuned carries over
+    scn = bpy.context.scene
+    settings = renderProfile.get(str(environmentDetail))
+    tile = settings['tile'] if settings else defaultTile
+    scn.render.tile_x = tile
+    scn.render.tile_y = tile
+
+    if useProfileThreads and settings:
+        scn.render.threads_mode = 'FIXED'
+        scn.render.threads = settings['threads']
+    elif useProfileThreads:
+        scn.render.threads_mode = 'AUTO'
+
+    return
+
+def calibrateRender(tiles,threads,samples):
+
+    # time a short render of the scene as built for every tile size and thread
+    # count, fastest first. nothing is written to disk
+    scn = bpy.context.scene
+    saved = (scn.render.tile_x,scn.render.tile_y,scn.render.threads_mode,scn.render.threads,scn.cycles.samples)
+
+    scn.cycles.samples = samples
+    scn.render.threads_mode = 'FIXED'
+    bpy.ops.render.render()                             # kernels, images and caches warm up
+
+    timings = []
+    for tile in tiles:
+        for numThreads in threads:
+            scn.render.tile_x = tile
+            scn.render.tile_y = tile
+            scn.render.threads = numThreads
+
+            start = time.time()
+            bpy.ops.render.render()
+            timings.append({'tile':tile,'threads':numThreads,'seconds':time.time()-start})
+
+    scn.render.tile_x,scn.render.tile_y,scn.render.threads_mode,scn.render.threads,scn.cycles.samples = saved
+    return sorted(timings,key=lambda timing: timing['seconds'])
+
+def autotune(vertSpec,faceSpec,envts=range(12),tiles=(16,32,64,128,256),threads=None,samples=16,profileFile=renderProfileFile):
+
+    # calibrate every environment code with the given stimulus and save the
+    # fastest settings as the profile later renders on this host use
+    cores = availableCores()
+    threads = threads or sorted(set([cores,max(1,cores//2)]))
+    profile = {'host':platform.node(),'cores':cores,'samples':samples,'created':time.strftime('%Y-%m-%d %H:%M:%S'),'envs':{}}
+
+    for environmentDetail in envts:
+        stashTemplates()
+        deleteAllObjects()
+
+        aldenStim = draw(vertSpec,faceSpec)
+        makeRamStimShader(aldenStim,stimMaterial(environmentDetail))
+        buildEnvironment(aldenStim,environmentDetail)
+        bpy.context.scene.render.resolution_x = 1280
+        bpy.context.scene.render.resolution_y = 960
+
+        timings = calibrateRender(tiles,threads,samples)
+        best = dict(timings[0])
+        best['timings'] = timings
+        profile['envs'][str(environmentDetail)] = best
+        print('Environment ' + str(environmentDetail) + ': tile ' + str(best['tile']) + ', ' + str(best['threads']) + ' threads, ' + str(round(best['seconds'],2)) + 's for ' + str(samples) + ' samples')
+
+    with open(profileFile,'w') as outputfile:
+        json.dump(profile,outputfile,indent=1,sort_keys=True)
+
+    renderProfile.clear()
+    renderProfile.update(profile['envs'])
+    return profile
+
+###
+###         DENOISE
+###
+
+# low sample renders cleaned up by the Cycles denoiser. samples per environment
+# code from denoiseProfile.json (benchmarkDenoise.py), denoiseSamples otherwise
+denoiseProfile = {}
+denoiseProfileFile = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/denoiseProfile.json'
+
+def loadDenoiseProfile(profileFile=denoiseProfileFile):
+
+    denoiseProfile.clear()
+    if not os.path.exists(profileFile):
+        return
+
+    with open(profileFile) as inputfile:
+        denoiseProfile.update(json.load(inputfile)['envs'])
+    return
+
+def denoiseBudget(environmentDetail):
+
+    return denoiseProfile.get(str(environmentDetail),denoiseSamples)
+
+def renderDenoised(destination,environmentDetail):
+
+    # the denoiser makes its feature passes itself when it is on for the layer
+    scn = bpy.context.scene
+    layer = scn.render.layers.active
+    samples = scn.cycles.samples
+    useDenoising = layer.cycles.use_denoising
+
+    scn.cycles.samples = denoiseBudget(environmentDetail)
+    layer.cycles.use_denoising = True
+    try:
+        return render(destination)
+    finally:
+        scn.cycles.samples = samples
+        layer.cycles.use_denoising = useDenoising
+
+###
+###         EVENT LOG
+###
+
+# one JSON line per event: job start/stop, stage start/stop, scene and datablock
+# counts, and the Cycles render statistics read from the render handlers.
+# render_stats gets no stats string in 2.79, but a background Blender prints
+# each stats line to stdout and flushes it right before calling the handler, so
+# stdout goes to statsCapture while rendering and the handler reads it back
+eventLog = {'file':None,'job':None}
+statsCapture = {'file':None,'stdout':None,'offset':0}
+lastJob = {}                                            # fields, status and stage seconds of the latest job
+eventCollections = ['objects','meshes','materials','textures','images','lamps','cameras','worlds','groups','particles']
+renderStats = {}
+
+def openEventLog(outputDestination):
+
+    logFile = eventLogFile
+    if logFile is None:
+        logFile = os.path.join(os.path.dirname(os.path.abspath(outputDestination)),'renderEvents.jsonl')
+
+    eventLog['file'] = open(logFile,'a') if logFile else None
+    eventLog['job'] = os.path.basename(outputDestination)
+    return
+
+def closeEventLog():
+
+    if eventLog['file']:
+        eventLog['file'].close()
+    eventLog['file'] = None
+    eventLog['job'] = None
+    return
+
+def logEvent(event,**fields):
+
+    # single write per line so workers appending to the same log do not interleave
+    if eventLog['file']:
+        fields.update({'time':time.time(),'job':eventLog['job'],'event':event})
+        eventLog['file'].write(json.dumps(fields) + '\n')
+        eventLog['file'].flush()
+    return
+
+@contextmanager
+def stage(name):
+
+    logEvent('stage_start',stage=name)
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time()-start
+        logEvent('stage_stop',stage=name,seconds=seconds)
+        if 'stages' in lastJob:
+            lastJob['stages'][name] = lastJob['stages'].get(name,0.0) + seconds
+
+@contextmanager
+def jobEvents(outputDestination,**fields):
+
+    # job_start, the datablocks created and job_stop around one job
+    openEventLog(outputDestination)
+    logEvent('job_start',**fields)
+    lastJob.clear()
+    lastJob.update(fields)
+    lastJob['stages'] = {}
+    before = datablockPointers()
+    start = time.time()
+    status = 'error'
+
+    try:
+        yield
+        status = 'ok'
+
+    finally:
+        after = datablockPointers()
+        logEvent('datablocks',created=dict((name,len(after[name]-before[name])) for name in after),total=dict((name,len(after[name])) for name in after))
+        logEvent('job_stop',status=status,seconds=time.time()-start)
+        lastJob.update({'status':status,'seconds':time.time()-start})
+        closeEventLog()
+
+def sceneCounts():
+
+    counts = {'objects':0,'vertices':0,'faces':0}
+    for ob in bpy.context.scene.objects:
+        counts['objects'] += 1
+        if ob.type == 'MESH':
+            counts['vertices'] += len(ob.data.vertices)
+            counts['faces'] += len(ob.data.polygons)
+
+    return counts
+
+def datablockPointers():
+
+    return dict((name,set(block.as_pointer() for block in getattr(bpy.data,name))) for name in eventCollections)
+
+def renderPhase(stats):
+
+    # what Cycles is doing according to a render stats line
+    if 'BVH' in stats:
+        return 'bvh'
+
+    elif 'Path Tracing' in stats or 'Rendering' in stats:
+        return 'sample'
+
+    elif 'Denois' in stats:
+        return 'denoise'
+
+    elif 'Finished' in stats:
+        return None
+
+    return 'sync'
+
+def switchPhase(phase):
+
+    now = time.time()
+    if renderStats['phase']:
+        seconds = renderStats['seconds']
+        seconds[renderStats['phase']] = seconds.get(renderStats['phase'],0.0) + now-renderStats['phaseStart']
+
+    renderStats['phase'] = phase
+    renderStats['phaseStart'] = now
+    return
+
+def onRenderPre(scene):
+
+    renderStats.clear()
+    renderStats.update({'start':time.time(),'phase':None,'phaseStart':time.time(),'seconds':{},'peakMemoryMB':0.0,'lines':0})
+    return
+
+def capturedLine():
+
+    # the last stats line written to statsCapture since the previous call, the
+    # output is passed on to the real stdout
+    capture = statsCapture['file']
+    capture.seek(statsCapture['offset'])
+    output = capture.read()
+    statsCapture['offset'] += len(output)
+    os.write(statsCapture['stdout'],output)
+
+    lines = [line for line in output.decode('utf-8','replace').splitlines() if line.startswith('Fra:')]
+    return lines[-1] if lines else None
+
+def onRenderStats(stats=None):
+
+    if not renderStats:
+        return
+
+    stats = stats if isinstance(stats,str) else capturedLine() if statsCapture['file'] else None
+    if stats is None:
+        return
+
+    renderStats['lines'] += 1
+    for peak in re.findall(r'Peak[: ]\s*([\d.]+)M',stats):
+        renderStats['peakMemoryMB'] = max(renderStats['peakMemoryMB'],float(peak))
+
+    phase = renderPhase(stats)
+    if phase != renderStats['phase']:
+        switchPhase(phase)
+    return
+
+def onRenderPost(scene):
+
+    if renderStats:
+        switchPhase(None)
+        renderStats['renderSeconds'] = time.time()-renderStats['start']
+    return
+
+def watchRenderStats():
+
+    # by name, so running the script again in the same session does not stack handlers
+    for handlers,handler in [(bpy.app.handlers.render_pre,onRenderPre),(bpy.app.handlers.render_stats,onRenderStats),(bpy.app.handlers.render_post,onRenderPost)]:
+        for old in [h for h in handlers if getattr(h,'__name__','') == handler.__name__]:
+            handlers.remove(old)
+        handlers.append(handler)
+
+    return
+
+@contextmanager
+def capturingStats():
+
+    # stdout into a temporary file for onRenderStats while Blender renders. only
+    # a background Blender prints the stats lines
+    if not bpy.app.background:
+        yield
+        return
+
+    sys.stdout.flush()
+    with tempfile.TemporaryFile() as capture:
+        statsCapture.update({'file':capture,'stdout':os.dup(1),'offset':0})
+        os.dup2(capture.fileno(),1)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(statsCapture['stdout'],1)
+            capturedLine()
+            os.close(statsCapture['stdout'])
+            statsCapture.update({'file':None,'stdout':None,'offset':0})
+
+def logRenderStats(samples):
+
+    # the stage times and peak memory are None when no stats line was seen
+    seconds = renderStats.get('seconds',{})
+    seen = renderStats.get('lines',0) > 0
+    scn = bpy.context.scene
+    logEvent('render_stats',samples=samples,tile=scn.render.tile_x,threads=scn.render.threads,renderSeconds=renderStats.get('renderSeconds'),
+             syncSeconds=seconds.get('sync',0.0) if seen else None,bvhSeconds=seconds.get('bvh',0.0) if seen else None,
+             sampleSeconds=seconds.get('sample',0.0) if seen else None,denoiseSeconds=seconds.get('denoise',0.0) if seen else None,
+             peakMemoryMB=renderStats.get('peakMemoryMB') if seen else None)
+    renderStats.clear()
+    return
+
+###
+###         RENDER CACHE
+###
+
+# finished images by content: the stimulus geometry, the environment code, the
+# settings that change the image and the version of this module. a job whose
+# key is in the cache only links the cached image into place
+renderCacheDir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/renderCache'
+moduleVersion = {}
+
+def sourceVersion():
+
+    # any edit to this file or envGeometry may change the images, so they are
+    # part of every key
+    if 'digest' not in moduleVersion:
+        digest = hashlib.sha1()
+        for source in [inspect.getfile(sourceVersion),inspect.getfile(envGeometry)]:
+            with open(os.path.abspath(source),'rb') as inputfile:
+                digest.update(inputfile.read())
+        moduleVersion['digest'] = digest.hexdigest()
+    return moduleVersion['digest']
+
+def specHash(vertSpec,faceSpec):
+
+    # the arrays draw makes of the spec, so identical stimuli under other ids or
+    # written with other number formatting hash the same
+    verts = np.ascontiguousarray(np.asarray(vertSpec,dtype=np.float32)[:,:3])
+    faces = np.ascontiguousarray(np.asarray(faceSpec,dtype=np.float64)[:,:3].astype(np.int32))
+    digest = hashlib.sha1(verts.tobytes())
+    digest.update(faces.tobytes())
+    return digest.hexdigest()
+
+def renderKey(vertSpec,faceSpec,environmentDetail,useTemplate=False,progressive=False,denoise=False):
+
+    scn = bpy.context.scene
+    settings = [specHash(vertSpec,faceSpec),environmentDetail,sourceVersion(),
+                denoiseBudget(environmentDetail) if denoise else scn.cycles.samples,scn.cycles.seed,scn.cycles.caustics_refractive,scn.cycles.caustics_reflective,
+                scn.render.resolution_x,scn.render.resolution_y,scn.render.resolution_percentage,
+                scn.render.image_settings.file_format,useTemplate,progressive,denoise]
+    if progressive:
+        settings += [progressiveChunk,progressiveThreshold]
+
+    return hashlib.sha1(json.dumps(settings).encode()).hexdigest()
+
+def cachedImage(key):
+
+    return os.path.join(renderCacheDir,key + bpy.context.scene.render.file_extension)
+
+def linkFile(source,destination):
+
+    if os.path.exists(destination):
+        if os.path.samefile(source,destination):
+            return
+        os.remove(destination)
+
+    try:
+        os.link(source,destination)
+    except OSError:
+        shutil.copy2(source,destination)                # other file system
+    return
+
+def fetchRender(key,outputDestination):
+
+    # link the cached image to outputDestination, returns its samples or None
+    meta = os.path.join(renderCacheDir,key + '.json')
+    if not os.path.exists(meta) or not os.path.exists(cachedImage(key)):
+        return None
+
+    with open(meta) as inputfile:
+        samples = json.load(inputfile)['samples']
+
+    linkFile(cachedImage(key),outputDestination + bpy.context.scene.render.file_extension)
+    return samples
+
+def storeRender(key,outputDestination,samples):
+
+    image = outputDestination + bpy.context.scene.render.file_extension
+    if not os.path.exists(image):
+        return
+
+    os.makedirs(renderCacheDir,exist_ok=True)
+    if not os.path.exists(cachedImage(key)):
+        try:
+            os.link(image,cachedImage(key))
+        except OSError:
+            shutil.copy2(image,cachedImage(key))
+
+    # the metadata goes in last and in one step, other workers only trust an
+    # entry once it is there
+    meta = os.path.join(renderCacheDir,key + '.json')
+    with open(meta + '.' + str(os.getpid()),'w') as outputfile:
+        json.dump({'samples':samples,'output':outputDestination,'created':time.strftime('%Y-%m-%d %H:%M:%S')},outputfile)
+    os.replace(meta + '.' + str(os.getpid()),meta)
+    return
+
+###
+###         PREVIEW
+###
+
+# quick renders to check stimulus placement before a batch is rendered in full:
+# resolution percentages rendered in turn and the samples of every rung
+previewLadder = [10,25,100]
+previewSamples = 4
+preview = {'active':False}
+
+@contextmanager
+def previewing():
+
+    # scenes built meanwhile skip displacement, scrub, textures and the stimulus
+    # material, see buildScene and makeEnvironmentTexture
+    scn = bpy.context.scene
+    samples = scn.cycles.samples
+    percentage = scn.render.resolution_percentage
+
+    scn.cycles.samples = previewSamples
+    preview['active'] = True
+    try:
+        yield
+    finally:
+        scn.cycles.samples = samples
+        scn.render.resolution_percentage = percentage
+        preview['active'] = False
+
+def checkPlacement(aldenStim,margin=0.02):
+
+    # framing: every stimulus vertex inside the image, margin (a fraction of the
+    # frame) away from its edges. the vertices furthest out are picked in camera
+    # space and measured with world_to_camera_view. intersections: floor and wall
+    # planes with stimulus vertices on their far side from the camera, or a bowl
+    # that stimulus vertices stick out of
+    scn = bpy.context.scene
+    camera = scn.camera
+
+    co = np.empty(len(aldenStim.data.vertices)*3,dtype=np.float32)
+    aldenStim.data.vertices.foreach_get('co',co)
+    matrix = np.array(worldMatrix(aldenStim),dtype=np.float64)
+    co = np.dot(co.reshape(-1,3),matrix[:3,:3].T) + matrix[:3,3]
+
+    toCamera = np.array(worldMatrix(camera).inverted(),dtype=np.float64)
+    local = np.dot(co,toCamera[:3,:3].T) + toCamera[:3,3]
+    ratios = local[:,:2]/-local[:,2:3]
+    extremes = sorted(set(ratios.argmin(axis=0)) | set(ratios.argmax(axis=0)))
+    views = [world_to_camera_view(scn,camera,Vector(co[i])) for i in extremes]
+    edge = min(min(view[0],1-view[0],view[1],1-view[1]) for view in views)
+    framed = edge >= margin and min(view[2] for view in views) > 0
+
+    # walls are placed to touch the stimulus, only count vertices beyond rounding
+    intersections = []
+    cameraCo = worldMatrix(camera).to_translation()
+    tolerance = 1e-3*np.ptp(co,axis=0).max()
+    for ob in scn.objects:
+        name = ob.name.split('.')[0]
+
+        if name in ['Horizon','Left Wall','Right Wall']:
+            toPlane = worldMatrix(ob).inverted()
+            side = 1 if (toPlane * cameraCo)[2] > 0 else -1
+            toPlane = np.array(toPlane,dtype=np.float64)
+            local = np.dot(co,toPlane[:3,:3].T) + toPlane[:3,3]
+
+            planeCo = np.empty(len(ob.data.vertices)*3,dtype=np.float32)
+            ob.data.vertices.foreach_get('co',planeCo)
+            planeCo = planeCo.reshape(-1,3)
+            within = np.all((local[:,:2] >= planeCo[:,:2].min(axis=0)) & (local[:,:2] <= planeCo[:,:2].max(axis=0)),axis=1)
+            if np.any(within & (local[:,2]*side < -tolerance)):
+                intersections.append(name)
+
+        elif name == 'Bowl':
+            bounds = objectBounds(ob)
+            center = np.array((bounds['center'][0],bounds['center'][1],bounds['max'][2]))
+            outside = np.linalg.norm(co-center,axis=1) > bounds['extent'][0]/2 + tolerance
+            if np.any(outside & (co[:,2] < center[2])):
+                intersections.append(name)
+
+    return {'framed':bool(framed),'edge':float(edge),'intersections':intersections,'pass':bool(framed) and not intersections}
+
+def previewMain(vertSpec,faceSpec,environmentDetail,outputDestination,ladder=None):
+
+    # build the simplified scene of a job once, check the placement and render it
+    # with previewSamples at every resolution percentage of the ladder, to
+    # outputDestination_preview<percentage>. a job that fails the check stops
+    # after the first rung. returns the check
+    ladder = ladder or previewLadder
+    renderSettings(environmentDetail)
+
+    with previewing(), jobEvents(outputDestination,env=environmentDetail,preview=True):
+        aldenStim = buildScene(vertSpec,faceSpec,environmentDetail)
+        check = checkPlacement(aldenStim)
+        logEvent('placement',**check)
+
+        for percentage in ladder:
+            bpy.context.scene.render.resolution_percentage = percentage
+            with stage('render'):
+                render(outputDestination + '_preview' + str(percentage))
+
+            if not check['pass']:
+                break
+
+    print('Preview ' + outputDestination + (' passed' if check['pass'] else ' failed: ' + ', '.join((['framing'] if not check['framed'] else []) + check['intersections'])))
+    return check
+
+###
+###         RENDER OVERRIDES
+###
+
+# render settings a job may change for itself and where they live. they are set
+# after the render profile in renderSettings, so they win over it, and are part
+# of the render cache key like the settings they replace
+overrideSettings = {
+    'samples':('cycles','samples'),
+    'seed':('cycles','seed'),
+    'resolution_x':('render','resolution_x'),
+    'resolution_y':('render','resolution_y'),
+    'resolution_percentage':('render','resolution_percentage'),
+    'tile_x':('render','tile_x'),
+    'tile_y':('render','tile_y'),
+    'threads':('render','threads'),
+}
+renderOverrides = {}
+
+def overrideTarget(name):
+
+    if name not in overrideSettings:
+        raise ValueError('Unknown render override ' + str(name) + ', expected one of ' + ', '.join(sorted(overrideSettings)))
+
+    section,attribute = overrideSettings[name]
+    return getattr(bpy.context.scene,section), attribute
+
+def applyRenderOverrides():
+
+    for name,value in renderOverrides.items():
+        target,attribute = overrideTarget(name)
+        setattr(target,attribute,value)
+
+    if 'threads' in renderOverrides:
+        bpy.context.scene.render.threads_mode = 'FIXED'
+    return
+
+@contextmanager
+def overriding(overrides):
+
+    # jobs rendered meanwhile use overrides, the settings are put back after
+    scn = bpy.context.scene
+    saved = [(scn.render,'threads_mode',scn.render.threads_mode)]
+    for name in overrides:
+        target,attribute = overrideTarget(name)
+        saved.append((target,attribute,getattr(target,attribute)))
+
+    previous = dict(renderOverrides)
+    renderOverrides.update(overrides)
+    try:
+        yield
+    finally:
+        renderOverrides.clear()
+        renderOverrides.update(previous)
+        for target,attribute,value in reversed(saved):
+            setattr(target,attribute,value)
+
+###
+###         MAIN
+###
+
+def doLandscape(aldenStim,landscapeType):
+
+    with stage('lighting'):
+        lightingSetupHDR(aldenStim)                     # HDR lighting
+    plane = triHorizon(aldenStim)
+    aldenShift = makeEnvironmentTexture(plane,landscapeType)
+    plane.location[2] = plane.location[2] - aldenShift
+    return
+
+def doRoom(aldenStim,floorType,wallLtype,wallRtype):
+
+    with stage('lighting'):
+        lightingSetupHDR(aldenStim)                     # HDR lighting
+    plane = triHorizon(aldenStim)
+    wallL,wallR = walls(aldenStim)
+    aldenShift = makeEnvironmentTexture(plane,floorType)
+    makeEnvironmentTexture(wallL,wallLtype)
+    makeEnvironmentTexture(wallR,wallRtype)
+    plane.location[2] = plane.location[2] - aldenShift
+    wallL.location[2] = wallL.location[2] - aldenShift
+    wallR.location[2] = wallR.location[2] - aldenShift
+    return
+
+def stimMaterial(environmentDetail):
+
+    return variantCodes[environmentDetail][0]
+
+def renderSettings(environmentDetail):
+
+    bpy.context.scene.render.resolution_x = 1280
+    bpy.context.scene.render.resolution_y = 960
+    applyRenderProfile(environmentDetail)
+    applyRenderOverrides()
+    return
+
+def buildEnvironment(aldenStim,environmentDetail):
 
     # closed [Mirror, Uncorrugated]
     if environmentDetail in [0,5]:
@@ -939,26 +1947,281 @@ def main(vertSpec,faceSpec,environmentDetail,outputDestination):
 
     # bowl [Mirror, CorrugatedMirror, Uncorrugated, Corrugated]
     elif environmentDetail in [3,4,8,9]:
-        lightingSetupPlain(aldenStim)
+        with stage('lighting'):
+            lightingSetupPlain(aldenStim)
         bowl = sphericalSurface(aldenStim)
         makeEnvironmentTexture(bowl,'Bowl')
 
     elif environmentDetail in [11]:
-        lightingSetupFront(aldenStim)
+        with stage('lighting'):
+            lightingSetupFront(aldenStim)
 
     elif environmentDetail in [10]:
-        lightingSetupFive(aldenStim)
+        with stage('lighting'):
+            lightingSetupFive(aldenStim)
 
-    bpy.context.scene.render.resolution_x = 1280
-    bpy.context.scene.render.resolution_y = 960
-    render(outputDestination) 
     return
 
+def buildScene(vertSpec,faceSpec,environmentDetail,useTemplate=False,templated=False):
+
+    with stage('cleanup'):
+        stashTemplates()
+        deleteAllObjects()
+
+    if useTemplate and not templated:
+        bpy.context.scene.world = baseWorld.copy()
+
+    with stage('draw'):
+        aldenStim = draw(vertSpec,faceSpec)
+    logEvent('scene',after='draw',**sceneCounts())
+
+    with stage('material'):
+        makeRamStimShader(aldenStim,'Plain' if preview['active'] else stimMaterial(environmentDetail))
+
+    with stage('environment'):
+        if templated:
+            placeInTemplate(aldenStim,environmentDetail)
+        else:
+            buildEnvironment(aldenStim,environmentDetail)
+            if useTemplate:
+                saveTemplate(aldenStim,environmentDetail)
+    logEvent('scene',after='environment',**sceneCounts())
+    return aldenStim
+
+def main(vertSpec,faceSpec,environmentDetail,outputDestination,useTemplate=False,progressive=False,denoise=False):
+    # mirror   glass
+    # 0 	 5 closed
+    # 1 	 6 open grass
+    # 2 	 7 open soil
+    # 3 	 8 uncorrugated bowl
+    # 4 	 9 corrugated bowl
+
+    # with useTemplate the environment of each code is built once and kept;
+    # later jobs only swap the stimulus and move the environment around it.
+    # progressive renders until the image stops changing instead of always
+    # spending scn.cycles.samples, denoise renders denoiseBudget samples and
+    # denoises them. returns the number of samples rendered. every job appends
+    # its events to eventLogFile. a job rendered before with the same stimulus
+    # and settings is linked from renderCacheDir instead
+    return buildAndRender(vertSpec,faceSpec,environmentDetail,outputDestination,useTemplate,progressive,denoise)[0]
+
+def buildAndRender(vertSpec,faceSpec,environmentDetail,outputDestination,useTemplate=False,progressive=False,denoise=False):
+
+    # main, also returning the stimulus object it built, None when the image came
+    # from the render cache
+    if progressive and denoise:
+        raise ValueError('progressive renders average noisy chunks and cannot be denoised')
+
+    templated = useTemplate and environmentDetail in envTemplates
+
+    renderSettings(environmentDetail)
+    key = renderKey(vertSpec,faceSpec,environmentDetail,useTemplate,progressive,denoise)
+    cached = fetchRender(key,outputDestination) if useRenderCache else None
+
+    with jobEvents(outputDestination,env=environmentDetail,template=templated,swap=False,progressive=progressive,denoise=denoise,cached=cached is not None,key=key):
+        if cached is not None:
+            print('Reused ' + outputDestination + ' from the render cache')
+            return cached, None
+
+        aldenStim = buildScene(vertSpec,faceSpec,environmentDetail,useTemplate,templated)
+
+        with stage('render'):
+            if progressive:
+                samples = renderProgressive(outputDestination)
+            elif denoise:
+                samples = renderDenoised(outputDestination,environmentDetail)
+            else:
+                samples = render(outputDestination)
+
+        if useRenderCache:
+            storeRender(key,outputDestination,samples)
+
+    print('Rendered ' + outputDestination + ' with ' + str(samples) + ' samples')
+    return samples, aldenStim
+
+###
+###         VARIANTS
+###
+
+# every environment code as stimulus material, environment and lighting. codes
+# that only differ in the material share one scene, except corrugation which
+# displaces the stimulus mesh
+variantCodes = {
+    0:('Mirror','Room','HDR'),              5:('Uncorrugated','Room','HDR'),
+    1:('Mirror','Grass','HDR'),             6:('Uncorrugated','Grass','HDR'),
+    2:('Mirror','Soil','HDR'),              7:('Uncorrugated','Soil','HDR'),
+    3:('Mirror','Bowl','Plain'),            8:('Uncorrugated','Bowl','Plain'),
+    4:('CorrugatedMirror','Bowl','Plain'),  9:('Corrugated','Bowl','Plain'),
+    10:('UVUnwrap','None','Five'),
+    11:('Plain','None','Front'),
+}
+corrugatedMaterials = ['Corrugated','CorrugatedMirror']
+
+# all twelve codes as blocks of material x environment x lighting
+allVariants = [
+    {'materials':['Mirror','Uncorrugated'],'environments':['Room','Grass','Soil'],'lightings':['HDR']},
+    {'materials':['Mirror','Uncorrugated','CorrugatedMirror','Corrugated'],'environments':['Bowl'],'lightings':['Plain']},
+    {'materials':['UVUnwrap'],'environments':['None'],'lightings':['Five']},
+    {'materials':['Plain'],'environments':['None'],'lightings':['Front']},
+]
+
+def variantCode(material,environment,lighting):
+
+    for code,variant in variantCodes.items():
+        if variant == (material,environment,lighting):
+            return code
+
+    raise ValueError('No environment code renders ' + material + ' in ' + environment + ' with ' + lighting + ' lighting')
+
+def scheduleVariants(stims,variants,output):
+
+    # expand stimulus x material x environment x lighting into jobs ordered so that
+    # every scene is built once: its 'build' job goes through main, the 'swap'
+    # jobs after it only change the stimulus material
+    scenes = OrderedDict()
+    seen = set()
+
+    for stim in stims:
+        for block in variants:
+            for environment in block['environments']:
+                for lighting in block['lightings']:
+                    for material in block['materials']:
+                        code = variantCode(material,environment,lighting)
+                        if (stim,code) in seen:
+                            continue
+
+                        seen.add((stim,code))
+                        key = (stim,environment,lighting,material in corrugatedMaterials)
+                        outputDestination = output.format(stim=stim,code=code,material=material,environment=environment,lighting=lighting)
+                        scenes.setdefault(key,[]).append({'stim':stim,'code':code,'material':material,'output':outputDestination})
+
+    steps = []
+    for scene,jobs in enumerate(scenes.values()):
+        for i,job in enumerate(jobs):
+            job['action'] = 'build' if i == 0 else 'swap'
+            job['scene'] = scene
+            steps.append(job)
+
+    return steps
+
+def swapVariant(aldenStim,vertSpec,faceSpec,environmentDetail,material,outputDestination,useTemplate=False,progressive=False,denoise=False):
+
+    # render the scene of the previous job again with another material on its
+    # stimulus, aldenStim as buildAndRender returned it. useTemplate as that job
+    # was built
+    renderSettings(environmentDetail)
+    key = renderKey(vertSpec,faceSpec,environmentDetail,useTemplate,progressive,denoise)
+
+    with jobEvents(outputDestination,env=environmentDetail,template=False,swap=True,progressive=progressive,denoise=denoise,cached=False,key=key):
+        with stage('material'):
+            swapStimMaterial(aldenStim,material)
+
+        with stage('render'):
+            if progressive:
+                samples = renderProgressive(outputDestination)
+            elif denoise:
+                samples = renderDenoised(outputDestination,environmentDetail)
+            else:
+                samples = render(outputDestination)
+
+        if useRenderCache:
+            storeRender(key,outputDestination,samples)
+
+    print('Rendered ' + outputDestination + ' with ' + str(samples) + ' samples')
+    return samples
+
+def runVariants(stimuli,variants=allVariants,output='{stim}_photo_{code}',useTemplate=False,progressive=False,usePreview=False,denoise=False):
+
+    # stimuli: (name,(vertSpec,faceSpec)) pairs. output is formatted with stim,
+    # code, material, environment and lighting for each image. images in the
+    # render cache are only linked, which also renders stimuli that are the same
+    # under different names once. with usePreview every scene is checked with
+    # previewMain first and only stimuli passing in all of them are rendered
+    stimuli = OrderedDict(stimuli)
+    steps = scheduleVariants(list(stimuli),variants,output)
+
+    failed = []
+    if usePreview:
+        for step in steps:
+            if step['action'] == 'build' and step['stim'] not in failed:
+                vertSpec,faceSpec = stimuli[step['stim']]
+                if not previewMain(vertSpec,faceSpec,step['code'],step['output'])['pass']:
+                    failed.append(step['stim'])
+
+        steps = [step for step in steps if step['stim'] not in failed]
+        if failed:
+            print('Not rendering stimuli ' + ', '.join(str(stim) for stim in failed) + ', their previews failed')
+
+    duplicates = OrderedDict()
+    for stim,(vertSpec,faceSpec) in stimuli.items():
+        duplicates.setdefault(specHash(vertSpec,faceSpec),[]).append(str(stim))
+    for stims in duplicates.values():
+        if len(stims) > 1:
+            print('Stimuli ' + ', '.join(stims) + ' are identical')
+
+    counts = {'renders':0,'builds':0,'rebuildsAvoided':0,'cached':0,'failedPreview':failed}
+    built = (None,None)                                 # scene and stimulus of the last build
+    for step in steps:
+        vertSpec,faceSpec = stimuli[step['stim']]
+
+        renderSettings(step['code'])
+        if useRenderCache and fetchRender(renderKey(vertSpec,faceSpec,step['code'],useTemplate,progressive,denoise),step['output']) is not None:
+            print('Reused ' + step['output'] + ' from the render cache')
+            counts['cached'] += 1
+            continue
+
+        # a swap needs the scene of its build job, which is not there when the
+        # build came from the cache
+        if step['action'] == 'swap' and built[0] == step['scene'] and built[1] is not None:
+            swapVariant(built[1],vertSpec,faceSpec,step['code'],step['material'],step['output'],useTemplate=useTemplate,progressive=progressive,denoise=denoise)
+            counts['rebuildsAvoided'] += 1
+        else:
+            samples,aldenStim = buildAndRender(vertSpec,faceSpec,step['code'],step['output'],useTemplate=useTemplate,progressive=progressive,denoise=denoise)
+            counts['builds'] += 1
+            built = (step['scene'],aldenStim)
+
+        counts['renders'] += 1
+
+    print('Rendered ' + str(counts['renders']) + ' variants with ' + str(counts['builds']) + ' scene builds, ' + str(counts['rebuildsAvoided']) + ' rebuilds avoided, ' + str(counts['cached']) + ' from the render cache')
+    return counts
+
+###
+###         JOBS
+###
+
+def renderJob(job):
+
+    # one job as renderWorker.py and renderDaemon.py get it: {"id","vert","face",
+    # "env","out"} and optionally "overrides", "progressive", "denoise" and
+    # "template". returns the reply, with the seconds of every stage
+    start = time.time()
+    vertSpec,faceSpec = readSpec(job['vert'],job['face'])
+
+    with overriding(job.get('overrides',{})):
+        samples = main(vertSpec,faceSpec,int(job['env']),job['out'],useTemplate=job.get('template',False),progressive=job.get('progressive',False),denoise=job.get('denoise',False))
+
+    return {'id':job.get('id'),'status':'ok','seconds':time.time()-start,'samples':samples,'cached':lastJob.get('cached',False),'stages':dict(lastJob.get('stages',{}))}
+
+def cacheSizes():
+
+    # what a long running Blender keeps between jobs
+    return {
+        'specs':len(specCache),
+        'cleanMeshes':len(cleanMeshes),
+        'geometry':len(envGeometry.geometryCache),
+        'templates':sorted(envTemplates),
+        'images':len(imageCache),
+        'imageHits':imageCacheStats['hits'],
+        'imageMisses':imageCacheStats['misses'],
+        'imageEvictions':imageCacheStats['evictions'],
+    }
+
 ###
 ###         BLENDER INSTANCE RESET & SETUP, RUN MAIN
 ###
 
 scn = bpy.context.scene
+baseWorld = scn.world
 
 # use cycles render engine
 scn.render.engine = 'CYCLES'
@@ -974,8 +2237,8 @@ scn.cycles.device = 'CPU'
 #     else:
 #         d.use = False
 
-bpy.context.scene.render.tile_x = 32
-bpy.context.scene.render.tile_y = 32
+bpy.context.scene.render.tile_x = defaultTile
+bpy.context.scene.render.tile_y = defaultTile
 bpy.context.scene.render.resolution_percentage = 100
 
 # remove caustics to get rid of fireflies
@@ -983,5 +2246,33 @@ scn.cycles.caustics_refractive = False
 scn.cycles.caustics_reflective = False
 scn.cycles.samples = 512
 
+# decoded image memory kept around for reuse between renders
+imageCacheLimit = 2*1024**3
+
+# pre-displaced floor and wall meshes from bakeEnvironment.py, if baked
+loadEnvironmentAssets()
+
+# progressive rendering: samples per chunk and the noise level to stop at
+progressiveChunk = 32
+progressiveThreshold = 0.02
+
+# tile size and threads per environment code from renderProfile.json, if tuned
+# on this machine. callers that pin the thread count themselves turn off
+# useProfileThreads
+useProfileThreads = True
+loadRenderProfile()
+
+# samples of a denoised render where denoiseProfile.json has no budget
+denoiseSamples = 64
+loadDenoiseProfile()
+
+# JSON lines event log of every job, None for renderEvents.jsonl next to the
+# output image, '' for no log
+eventLogFile = None
+watchRenderStats()
+
+# reuse finished images from renderCacheDir when nothing that changes them did
+useRenderCache = True
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,31 @@
+#!/usr/bin/python
+
+# Find the fastest Cycles tile size and thread count for each environment code on
+# this machine with short calibration renders of one stimulus:
+#   blender --background --python autotuneRender.py -- --stim-dir stim --stim 1
+# The result goes to renderProfile.json next to V4Cycles_latest.py, which then
+# applies it to every render on the same host.
+
+import sys
+import os
+import argparse
+
+dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(dir)
+
+import V4Cycles_latest
+
+argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
+
+parser = argparse.ArgumentParser(description='Tune Cycles tile size and thread count per environment code')
+parser.add_argument('--stim-dir',default=dir+'/stim')
+parser.add_argument('--stim',type=int,default=1)
+parser.add_argument('--envts',nargs='+',type=int,default=list(range(12)))
+parser.add_argument('--tiles',nargs='+',type=int,default=[16,32,64,128,256])
+parser.add_argument('--threads',nargs='+',type=int,help='thread counts to try, default all and half of the cores')
+parser.add_argument('--samples',type=int,default=16,help='samples of each calibration render')
+args = parser.parse_args(argv)
+
+inFile = os.path.join(args.stim_dir,str(args.stim))
+vertSpec,faceSpec = V4Cycles_latest.readSpec(inFile+'_vert.txt',inFile+'_face.txt')
+V4Cycles_latest.autotune(vertSpec,faceSpec,args.envts,args.tiles,args.threads,args.samples)
@@ -0,0 +1,16 @@
+#!/usr/bin/python
+
+# Bake the uv mapped, subdivided and displaced floor and wall meshes once:
+#   blender --background --python bakeEnvironment.py
+# V4Cycles_latest picks up TextureResources/environmentAssets.blend on import
+# and only moves these meshes into place instead of rebuilding them.
+
+import sys
+import os
+
+dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(dir)
+
+import V4Cycles_latest
+
+V4Cycles_latest.bakeEnvironmentAssets()
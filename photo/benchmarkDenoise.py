@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+# Compare denoised low sample renders with full sample references in every
+# environment code and find the cheapest sample budget per code that stays close
+# to the reference:
+#   blender --background --python benchmarkDenoise.py -- --stim-dir stim --stims 1 2 3
+#   blender --background --python benchmarkDenoise.py -- --stims 1 --profile
+# SSIM and PSNR are measured over the whole frame and inside the stimulus mask,
+# the pixels the stimulus covers, where the glass refraction and the mirror
+# reflections are. References are rendered by main with scn.cycles.samples and
+# kept in the render cache, so later runs only render the low sample images.
+# --profile writes the budgets to denoiseProfile.json next to V4Cycles_latest.py,
+# which main(denoise=True) then renders with.
+
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(dir)
+
+import bpy
+from bpy_extras.object_utils import world_to_camera_view
+from mathutils import Vector
+import numpy as np
+import V4Cycles_latest
+
+argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
+
+parser = argparse.ArgumentParser(description='Benchmark denoised low sample renders against full sample references')
+parser.add_argument('--stim-dir',default=dir+'/stim')
+parser.add_argument('--stims',nargs='+',type=int,default=[1])
+parser.add_argument('--envts',nargs='+',type=int,default=list(range(12)))
+parser.add_argument('--budgets',nargs='+',type=int,default=[16,32,64,128],help='samples of the denoised renders')
+parser.add_argument('--min-ssim',type=float,default=0.97,help='SSIM inside the stimulus mask a budget needs for every stimulus')
+parser.add_argument('--min-psnr',type=float,default=35.0,help='PSNR in dB inside the stimulus mask a budget needs for every stimulus')
+parser.add_argument('--out',default=os.path.join(dir,'denoiseBenchmark.json'))
+parser.add_argument('--profile',action='store_true',help='write the chosen budgets to denoiseProfile.json')
+parser.add_argument('--keep-images',action='store_true')
+args = parser.parse_args(argv)
+
+def stimulusMask(width,height):
+
+    # pixels covered by the stimulus, bottom row first like the render pixels.
+    # the triangles are projected with world_to_camera_view and filled
+    scn = bpy.context.scene
+    aldenStim = scn.objects['AldenObject']
+    me = aldenStim.data
+
+    co = np.empty(len(me.vertices)*3,dtype=np.float32)
+    me.vertices.foreach_get('co',co)
+    matrix = np.array(V4Cycles_latest.worldMatrix(aldenStim),dtype=np.float64)
+    co = np.dot(co.reshape(-1,3),matrix[:3,:3].T) + matrix[:3,3]
+    xy = np.array([tuple(world_to_camera_view(scn,scn.camera,Vector(c)))[:2] for c in co])*(width,height)
+
+    starts = np.empty(len(me.polygons),dtype=np.int32)
+    totals = np.empty(len(me.polygons),dtype=np.int32)
+    index = np.empty(len(me.loops),dtype=np.int32)
+    me.polygons.foreach_get('loop_start',starts)
+    me.polygons.foreach_get('loop_total',totals)
+    me.loops.foreach_get('vertex_index',index)
+
+    mask = np.zeros((height,width),dtype=bool)
+    for start,total in zip(starts,totals):
+        for k in range(1,total-1):
+            tri = xy[[index[start],index[start+k],index[start+k+1]]]
+            x0,y0 = np.maximum(np.floor(tri.min(axis=0)).astype(int),0)
+            x1,y1 = np.minimum(np.ceil(tri.max(axis=0)).astype(int),(width,height))
+            if x0 >= x1 or y0 >= y1:
+                continue
+
+            px,py = np.meshgrid(np.arange(x0,x1)+0.5,np.arange(y0,y1)+0.5)
+            sides = [(b[0]-a[0])*(py-a[1])-(b[1]-a[1])*(px-a[0]) for a,b in [(tri[0],tri[1]),(tri[1],tri[2]),(tri[2],tri[0])]]
+            inside = ((sides[0] >= 0) & (sides[1] >= 0) & (sides[2] >= 0)) | ((sides[0] <= 0) & (sides[1] <= 0) & (sides[2] <= 0))
+            mask[y0:y1,x0:x1] |= inside
+
+    return mask
+
+def boxMean(image,size):
+
+    # mean of every size x size window, through an integral image
+    total = np.pad(image,((1,0),(1,0)),'constant').cumsum(axis=0).cumsum(axis=1)
+    return (total[size:,size:]-total[:-size,size:]-total[size:,:-size]+total[:-size,:-size])/size**2
+
+def ssimMap(a,b,size=7):
+
+    # SSIM of two luminance images in [0,1] over size x size windows, one value
+    # per window center
+    c1 = 0.01**2
+    c2 = 0.03**2
+    muA = boxMean(a,size)
+    muB = boxMean(b,size)
+    varA = boxMean(a*a,size)-muA**2
+    varB = boxMean(b*b,size)-muB**2
+    cov = boxMean(a*b,size)-muA*muB
+    return ((2*muA*muB+c1)*(2*cov+c2))/((muA**2+muB**2+c1)*(varA+varB+c2))
+
+def psnr(a,b):
+
+    mse = np.mean((a-b)**2)
+    return 100.0 if mse == 0 else float(10*np.log10(1.0/mse))
+
+def compare(image,reference,mask,size=7):
+
+    # full frame and stimulus mask SSIM on luminance and PSNR on RGB
+    height,width = mask.shape
+    image = np.clip(image[:,:3].reshape(height,width,3),0,1)
+    reference = np.clip(reference[:,:3].reshape(height,width,3),0,1)
+    weights = np.array((0.2126,0.7152,0.0722))
+
+    ssim = ssimMap(np.dot(image,weights),np.dot(reference,weights),size)
+    inner = mask[size//2:height-size//2,size//2:width-size//2]
+
+    scores = {'ssim':float(ssim.mean()),'psnr':psnr(image,reference),'maskPixels':int(mask.sum())}
+    scores['maskSsim'] = float(ssim[inner].mean()) if inner.any() else None
+    scores['maskPsnr'] = psnr(image[mask],reference[mask]) if mask.any() else None
+    return scores
+
+def chooseBudgets(runs,fullSamples):
+
+    # cheapest budget that keeps every stimulus above both thresholds, the full
+    # sample count where none does
+    budgets = {}
+    for env in sorted(set(run['env'] for run in runs)):
+        budgets[str(env)] = fullSamples
+        for budget in sorted(args.budgets):
+            scores = [run for run in runs if run['env'] == env and run['samples'] == budget]
+            if all(run['maskSsim'] is not None and run['maskSsim'] >= args.min_ssim and run['maskPsnr'] >= args.min_psnr for run in scores):
+                budgets[str(env)] = budget
+                break
+
+    return budgets
+
+if __name__ == "__main__":
+    scn = bpy.context.scene
+    ext = scn.render.file_extension
+    outDir = tempfile.mkdtemp(prefix='benchmarkDenoise')
+    runs = []
+
+    try:
+        for stimNum in args.stims:
+            inFile = os.path.join(args.stim_dir,str(stimNum))
+            vertSpec,faceSpec = V4Cycles_latest.readSpec(inFile+'_vert.txt',inFile+'_face.txt')
+
+            for env in args.envts:
+                reference = os.path.join(outDir,str(stimNum)+'_'+str(env)+'_reference')
+                V4Cycles_latest.useRenderCache = True
+                V4Cycles_latest.main(vertSpec,faceSpec,env,reference)
+                referencePixels = V4Cycles_latest.readPixels(reference+ext)
+
+                # the low sample renders build the scene, which the mask is taken from
+                V4Cycles_latest.useRenderCache = False
+                mask = None
+
+                for budget in sorted(args.budgets):
+                    V4Cycles_latest.denoiseProfile[str(env)] = budget
+                    output = os.path.join(outDir,str(stimNum)+'_'+str(env)+'_'+str(budget))
+                    start = time.time()
+                    V4Cycles_latest.main(vertSpec,faceSpec,env,output,denoise=True)
+                    seconds = time.time()-start
+
+                    if mask is None:
+                        width = int(scn.render.resolution_x*scn.render.resolution_percentage/100)
+                        height = int(scn.render.resolution_y*scn.render.resolution_percentage/100)
+                        mask = stimulusMask(width,height)
+
+                    run = {'stim':stimNum,'env':env,'samples':budget,'seconds':seconds}
+                    run.update(compare(V4Cycles_latest.readPixels(output+ext),referencePixels,mask))
+                    runs.append(run)
+                    print('Denoise stim ' + str(stimNum) + ' env ' + str(env) + ' ' + str(budget) + ' samples: SSIM ' + str(round(run['ssim'],4)) + ' (stimulus ' + str(run['maskSsim'] and round(run['maskSsim'],4)) + '), PSNR ' + str(round(run['psnr'],2)) + ' dB (stimulus ' + str(run['maskPsnr'] and round(run['maskPsnr'],2)) + ' dB), ' + str(round(seconds,1)) + ' s')
+
+    finally:
+        V4Cycles_latest.useRenderCache = True
+        V4Cycles_latest.loadDenoiseProfile()
+        if args.keep_images:
+            print('Images kept in ' + outDir)
+        else:
+            shutil.rmtree(outDir,ignore_errors=True)
+
+    budgets = chooseBudgets(runs,scn.cycles.samples)
+    results = {
+        'created':time.strftime('%Y-%m-%d %H:%M:%S'),
+        'blender':bpy.app.version_string,
+        'referenceSamples':scn.cycles.samples,
+        'minSsim':args.min_ssim,
+        'minPsnr':args.min_psnr,
+        'runs':runs,
+        'envs':budgets,
+    }
+
+    with open(args.out,'w') as outputfile:
+        json.dump(results,outputfile,indent=1,sort_keys=True)
+    print('Denoise benchmark written to ' + args.out)
+
+    for env,budget in sorted(budgets.items(),key=lambda item: int(item[0])):
+        print('env ' + env.rjust(2) + ': ' + str(budget) + ' samples')
+
+    if args.profile:
+        with open(V4Cycles_latest.denoiseProfileFile,'w') as outputfile:
+            json.dump({'created':results['created'],'referenceSamples':scn.cycles.samples,'minSsim':args.min_ssim,'minPsnr':args.min_psnr,'envs':budgets},outputfile,indent=1,sort_keys=True)
+        print('Denoise budgets saved to ' + V4Cycles_latest.denoiseProfileFile)
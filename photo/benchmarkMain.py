@@ -0,0 +1,253 @@
+#!/usr/bin/python
+
+# Time the stages of V4Cycles_latest.main for a fixed set of reference stimuli in
+# every environment code and keep the numbers as a JSON baseline:
+#
+#   blender --background --python benchmarkMain.py -- --out bench.json
+#   blender --background --python benchmarkMain.py -- --baseline bench.json --out new.json
+#   python benchmarkMain.py --standin --out standin.json
+#
+# Stages are timed by wrapping the module functions main calls (cleanup, draw,
+# material, lighting, environment, render). The render stage is the Cycles render
+# itself. Peak RSS is the high water mark of the process after each job.
+#
+# --standin runs without Blender on bpyStandIn: the scene is built but nothing is
+# rendered. The time spent inside the stand-in operators is reported apart
+# ('operators') and left out of the stage times, which then only hold the Python
+# side of scene construction.
+
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+
+dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(dir)
+
+argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else sys.argv[1:]
+
+parser = argparse.ArgumentParser(description='Benchmark the stages of V4Cycles_latest.main for all environment codes')
+parser.add_argument('--out',default='benchmark.json',help='where to write the results')
+parser.add_argument('--baseline',help='earlier results to compare against')
+parser.add_argument('--standin',action='store_true',help='run on the bpy stand-in, scene construction only')
+parser.add_argument('--stim-dir',help='benchmark the *_vert.txt/*_face.txt stimuli in this folder instead of the reference shapes')
+parser.add_argument('--stims',nargs='+',type=int,default=[1])
+parser.add_argument('--envts',nargs='+',type=int,default=list(range(12)))
+parser.add_argument('--repeats',type=int,default=1)
+parser.add_argument('--samples',type=int,help='override scn.cycles.samples')
+parser.add_argument('--percentage',type=int,help='override the resolution percentage')
+parser.add_argument('--template',action='store_true',help='run main with useTemplate=True')
+parser.add_argument('--progressive',action='store_true',help='run main with progressive=True')
+parser.add_argument('--keep-images',action='store_true')
+args = parser.parse_args(argv)
+
+if args.standin:
+    if args.progressive:
+        parser.error('--progressive needs rendered images, it does not work with --standin')
+    import bpyStandIn
+    bpyStandIn.install()
+
+import bpy
+import numpy as np
+import V4Cycles_latest
+
+# stage name and the module functions timed as that stage. a stage entered again
+# from inside itself (render from renderProgressive) is only counted once
+stages = [
+    ('cleanup',['stashTemplates','deleteAllObjects']),
+    ('draw',['draw']),
+    ('material',['makeRamStimShader']),
+    ('lighting',['lightingSetupHDR','lightingSetupPlain','lightingSetupFront','lightingSetupFive']),
+    ('environment',['triHorizon','walls','sphericalSurface','makeEnvironmentTexture','placeInTemplate','saveTemplate']),
+    ('render',['render','renderProgressive']),
+]
+
+current = {'stages':{},'operators':{},'active':set()}
+
+def operatorSeconds():
+
+    return bpyStandIn.state['operatorSeconds'] if args.standin else 0.0
+
+def timeStage(stage,function):
+
+    def timed(*args,**kwargs):
+
+        if stage in current['active']:
+            return function(*args,**kwargs)
+
+        current['active'].add(stage)
+        start = time.perf_counter()
+        operators = operatorSeconds()
+        try:
+            return function(*args,**kwargs)
+        finally:
+            operators = operatorSeconds()-operators
+            current['stages'][stage] = current['stages'].get(stage,0.0) + time.perf_counter()-start-operators
+            current['operators'][stage] = current['operators'].get(stage,0.0) + operators
+            current['active'].discard(stage)
+
+    return timed
+
+def wrapStages():
+
+    for stage,names in stages:
+        for name in names:
+            setattr(V4Cycles_latest,name,timeStage(stage,getattr(V4Cycles_latest,name)))
+    return
+
+def referenceStimulus(rings,segments):
+
+    # lumpy, elongated closed surface in the spec convention (y up, 1-based
+    # triangles) so every machine benchmarks the same meshes
+    theta = np.linspace(0,np.pi,rings+1)[1:-1]
+    phi = np.linspace(0,2*np.pi,segments,endpoint=False)
+    t,p = np.meshgrid(theta,phi,indexing='ij')
+    radius = 25*(1+0.25*np.sin(3*t)*np.cos(2*p))
+    ring = np.stack([radius*np.sin(t)*np.cos(p),1.6*radius*np.cos(t),radius*np.sin(t)*np.sin(p)],axis=-1).reshape(-1,3)
+    verts = np.concatenate([[(0,40,0)],ring,[(0,-40,0)]]).astype(np.float32)
+
+    faces = []
+    bottom = len(verts)-1
+    for s in range(segments):
+        n = (s+1) % segments
+        faces.append((0,1+n,1+s))
+        for r in range(rings-2):
+            a,b = 1+r*segments,1+(r+1)*segments
+            faces.append((a+s,a+n,b+s))
+            faces.append((a+n,b+n,b+s))
+        last = 1+(rings-2)*segments
+        faces.append((last+s,last+n,bottom))
+
+    return verts, np.array(faces,dtype=np.int32)+1
+
+def loadStimuli():
+
+    if args.stim_dir:
+        stimuli = []
+        for stimNum in args.stims:
+            inFile = os.path.join(args.stim_dir,str(stimNum))
+            stimuli.append(('stim'+str(stimNum),V4Cycles_latest.readSpec(inFile+'_vert.txt',inFile+'_face.txt')))
+        return stimuli
+
+    return [('small',referenceStimulus(16,32)),('medium',referenceStimulus(32,64)),('large',referenceStimulus(64,128))]
+
+def peakRss():
+
+    # high water mark of this process in MB, None where resource is missing
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak/(1024.0*1024 if sys.platform == 'darwin' else 1024.0),1)
+
+def benchmark(stimuli,outDir):
+
+    runs = []
+    for name,(vertSpec,faceSpec) in stimuli:
+        for env in args.envts:
+            for repeat in range(args.repeats):
+                current['stages'] = {}
+                current['operators'] = {}
+
+                start = time.perf_counter()
+                samples = V4Cycles_latest.main(vertSpec,faceSpec,env,os.path.join(outDir,name+'_'+str(env)),useTemplate=args.template,progressive=args.progressive)
+                total = time.perf_counter()-start
+
+                run = {'stim':name,'env':env,'repeat':repeat,'total':total,'stages':current['stages'],'samples':samples,'peakRssMB':peakRss()}
+                if args.standin:
+                    run['operators'] = current['operators']
+                    run['total'] -= sum(current['operators'].values())
+
+                runs.append(run)
+                print('Benchmark ' + name + ' env ' + str(env) + ': ' + ', '.join(stage + ' ' + str(round(run['stages'].get(stage,0),3)) for stage,names in stages) + ' s')
+
+    return runs
+
+def summarize(runs):
+
+    # median seconds per environment code and stage over stimuli and repeats
+    summary = {}
+    for env in sorted(set(run['env'] for run in runs)):
+        envRuns = [run for run in runs if run['env'] == env]
+        entry = {'total':float(np.median([run['total'] for run in envRuns]))}
+        for stage,names in stages:
+            entry[stage] = float(np.median([run['stages'].get(stage,0.0) for run in envRuns]))
+
+        rss = [run['peakRssMB'] for run in envRuns if run['peakRssMB'] is not None]
+        entry['peakRssMB'] = max(rss) if rss else None
+        summary[str(env)] = entry
+
+    return summary
+
+def compare(results,baseline):
+
+    for key in ['mode','settings']:
+        if results[key] != baseline.get(key):
+            print('Warning: ' + key + ' differs from the baseline: ' + json.dumps(baseline.get(key)) + ' -> ' + json.dumps(results[key]))
+
+    print('env  stage          baseline       now   ratio')
+    for env,entry in sorted(results['summary'].items(),key=lambda item: int(item[0])):
+        if env not in baseline['summary']:
+            continue
+
+        for stage in [stage for stage,names in stages] + ['total']:
+            before = baseline['summary'][env].get(stage)
+            after = entry[stage]
+            if not before and not after:
+                continue
+
+            # ratios of stages taking a few milliseconds are mostly noise
+            ratio = after/before if before else float('inf')
+            flag = ''
+            if abs(after-(before or 0)) > 0.01:
+                flag = '  slower' if ratio > 1.1 else ('  faster' if ratio < 0.9 else '')
+            print(env.rjust(3) + '  ' + stage.ljust(12) + ('%10.3f' % (before or 0)) + ('%10.3f' % after) + ('%8.2f' % ratio) + flag)
+
+    return
+
+if __name__ == "__main__":
+    scn = bpy.context.scene
+    if args.samples:
+        scn.cycles.samples = args.samples
+    if args.percentage:
+        scn.render.resolution_percentage = args.percentage
+
+    # every run has to build and render, not link an earlier image
+    V4Cycles_latest.useRenderCache = False
+
+    stimuli = loadStimuli()
+    wrapStages()
+    outDir = tempfile.mkdtemp(prefix='benchmarkMain')
+
+    try:
+        runs = benchmark(stimuli,outDir)
+    finally:
+        if args.keep_images:
+            print('Images kept in ' + outDir)
+        else:
+            shutil.rmtree(outDir,ignore_errors=True)
+
+    results = {
+        'created':time.strftime('%Y-%m-%d %H:%M:%S'),
+        'mode':'standin' if args.standin else 'blender',
+        'blender':bpy.app.version_string,
+        'machine':{'host':platform.node(),'platform':platform.platform(),'cpus':os.cpu_count()},
+        'settings':{'samples':scn.cycles.samples,'percentage':scn.render.resolution_percentage,'template':args.template,'progressive':args.progressive,'repeats':args.repeats},
+        'stimuli':dict((name,{'verts':len(vertSpec),'faces':len(faceSpec)}) for name,(vertSpec,faceSpec) in stimuli),
+        'runs':runs,
+        'summary':summarize(runs),
+    }
+
+    with open(args.out,'w') as outputfile:
+        json.dump(results,outputfile,indent=1,sort_keys=True)
+    print('Benchmark written to ' + args.out)
+
+    if args.baseline:
+        with open(args.baseline) as inputfile:
+            compare(results,json.load(inputfile))
@@ -0,0 +1,1165 @@
+#!/usr/bin/python
+
+# A small pure Python stand-in for the parts of bpy, bmesh, mathutils and
+# bpy_extras that V4Cycles_latest uses, so its scene construction can run and
+# be timed outside Blender:
+#
+#   import bpyStandIn
+#   bpyStandIn.install()
+#   import V4Cycles_latest
+#
+# Only what benchmarkMain.py reaches is there. Object transforms, mesh arrays
+# (foreach_get/foreach_set), transform_apply and bmesh welding are modelled so
+# the Python loops see realistic vertex counts, and datablocks count their users
+# as Blender does, so deleted objects leave orphans for purgeOrphans and unused
+# images for evictImages. Node trees and render settings accept anything, and
+# rendering, displacement, hole filling and normal recalculation do nothing.
+
+import sys
+import os
+import math
+import time
+import types
+import numpy as np
+
+###
+###         MATHUTILS
+###
+
+class Vector:
+
+    def __init__(self,values=(0.0,0.0,0.0)):
+        self._v = [float(value) for value in values]
+
+    def __len__(self):
+        return len(self._v)
+
+    def __iter__(self):
+        return iter(self._v)
+
+    def __getitem__(self,index):
+        return self._v[index]
+
+    def __setitem__(self,index,value):
+        self._v[index] = float(value)
+        return
+
+    def __add__(self,other):
+        return Vector([a+b for a,b in zip(self._v,other)])
+
+    def __sub__(self,other):
+        return Vector([a-b for a,b in zip(self._v,other)])
+
+    def __truediv__(self,other):
+        return Vector([a/other for a in self._v])
+
+    def copy(self):
+        return Vector(self._v)
+
+    def axisProperty(index):
+        return property(lambda self: self._v[index],lambda self,value: self.__setitem__(index,value))
+
+    x = axisProperty(0)
+    y = axisProperty(1)
+    z = axisProperty(2)
+    w = axisProperty(3)
+
+class Euler(Vector):
+
+    def __init__(self,angles=(0.0,0.0,0.0),order='XYZ'):
+        Vector.__init__(self,angles)
+        self.order = order
+
+    def to_matrix(self):
+        return Matrix.Rotation(self._v[2],3,'Z') * Matrix.Rotation(self._v[1],3,'Y') * Matrix.Rotation(self._v[0],3,'X')
+
+class Matrix:
+
+    def __init__(self,rows=((1,0,0,0),(0,1,0,0),(0,0,1,0),(0,0,0,1))):
+        self._rows = [Vector(row) for row in rows]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __array__(self,dtype=None,copy=None):
+        return np.array([list(row) for row in self._rows],dtype=dtype)
+
+    def __mul__(self,other):
+        if isinstance(other,Matrix):
+            return Matrix(np.dot(np.array(self,dtype=np.float64),np.array(other,dtype=np.float64)))
+
+        # plain Python for single vectors, numpy costs more than it saves here
+        co = list(other)
+        if len(co) == 3 and len(self._rows) == 4:
+            return Vector([row[0]*co[0]+row[1]*co[1]+row[2]*co[2]+row[3] for row in self._rows[:3]])
+
+        return Vector([sum(a*b for a,b in zip(row,co)) for row in self._rows])
+
+    @staticmethod
+    def Identity(size):
+        return Matrix(np.identity(size))
+
+    @staticmethod
+    def Translation(vector):
+        matrix = np.identity(4)
+        matrix[:3,3] = list(vector)[:3]
+        return Matrix(matrix)
+
+    @staticmethod
+    def Rotation(angle,size,axis):
+        c,s = math.cos(angle),math.sin(angle)
+        rotation = {'X':[[1,0,0],[0,c,-s],[0,s,c]],'Y':[[c,0,s],[0,1,0],[-s,0,c]],'Z':[[c,-s,0],[s,c,0],[0,0,1]]}[axis]
+        matrix = np.identity(size)
+        matrix[:3,:3] = rotation
+        return Matrix(matrix)
+
+    def copy(self):
+        return Matrix(self._rows)
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(np.array(self,dtype=np.float64)))
+
+    def to_translation(self):
+        return Vector([self._rows[0][3],self._rows[1][3],self._rows[2][3]])
+
+    def to_3x3(self):
+        return Matrix([row[:3] for row in self._rows[:3]])
+
+    def to_4x4(self):
+        matrix = np.identity(4)
+        matrix[:3,:3] = np.array(self.to_3x3(),dtype=np.float64)
+        if len(self) == 4:
+            matrix[:3,3] = list(self.to_translation())
+        return Matrix(matrix)
+
+    def to_scale(self):
+        return Vector(np.linalg.norm(np.array(self.to_3x3(),dtype=np.float64),axis=0))
+
+    def to_euler(self):
+
+        # XYZ euler of the rotation part, as Euler.to_matrix builds it
+        r = np.array(self.to_3x3(),dtype=np.float64)/np.array(self.to_scale())
+        if abs(r[2,0]) < 1-1e-9:
+            return Euler((math.atan2(r[2,1],r[2,2]),math.asin(-r[2,0]),math.atan2(r[1,0],r[0,0])))
+
+        return Euler((math.atan2(-r[1,2],r[1,1]),math.asin(-max(-1.0,min(1.0,r[2,0]))),0.0))
+
+###
+###         ID DATABLOCKS
+###
+
+class Stub:
+
+    # accepts any attribute, item or call. unknown children are made on first use
+    # and kept, so settings written to them can be read back
+
+    def __getattr__(self,name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        child = Stub()
+        object.__setattr__(self,name,child)
+        return child
+
+    def __getitem__(self,key):
+        items = self.__dict__.setdefault('_items',{})
+        if key not in items:
+            items[key] = Stub()
+        return items[key]
+
+    def __setitem__(self,key,value):
+        self.__dict__.setdefault('_items',{})[key] = value
+        return
+
+    def __call__(self,*args,**kwargs):
+        return Stub()
+
+    def __iter__(self):
+        return iter([])
+
+    def __bool__(self):
+        return True
+
+class ID(Stub):
+
+    def __init__(self,name):
+        self.name = name
+        self.use_fake_user = False
+        self.props = {}
+
+    def __getitem__(self,key):
+        return self.props[key]
+
+    def __setitem__(self,key,value):
+        self.props[key] = value
+        return
+
+    def __contains__(self,key):
+        return key in self.props
+
+    def as_pointer(self):
+        return id(self)
+
+    @property
+    def users(self):
+        return 1
+
+def pointers(block,holders,attribute):
+
+    # how many of holders point to block through attribute, read without making
+    # a Stub child where it was never set
+    return sum(1 for holder in holders if holder.__dict__.get(attribute) is block)
+
+class Collection:
+
+    def __init__(self,make):
+        self.make = make
+        self.blocks = []
+        self.names = {}
+
+    def __iter__(self):
+        return iter(list(self.blocks))
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def get(self,name,default=None):
+        block = self.names.get(name)
+        if block is None or block.name != name:
+            block = next((b for b in self.blocks if b.name == name),default)
+        return block
+
+    def keys(self):
+        return [block.name for block in self.blocks]
+
+    def add(self,block,name):
+        taken = set(self.keys())
+        unique = name
+        n = 0
+        while unique in taken:
+            n += 1
+            unique = name + '.' + str(n).zfill(3)
+
+        block.name = unique
+        self.blocks.append(block)
+        self.names[unique] = block
+        return block
+
+    def new(self,name,*args,**kwargs):
+        return self.add(self.make(name,*args,**kwargs),name)
+
+    def remove(self,block,do_unlink=True):
+        if block in self.blocks:
+            self.blocks.remove(block)
+            self.names.pop(block.name,None)
+
+        if do_unlink and isinstance(block,Object):
+            for scene in data.scenes:
+                if block in scene.objects.list:
+                    scene.objects.unlink(block)
+            for group in data.groups:
+                if block in group.objects.list:
+                    group.objects.unlink(block)
+        return
+
+###
+###         MESHES
+###
+
+class ArrayCollection:
+
+    # element collection of a mesh backed by one numpy array per attribute
+    def __init__(self,mesh,attributes):
+        self.mesh = mesh
+        self.attributes = attributes
+        self.arrays = dict((name,np.zeros((0,)+shape,dtype=dtype)) for name,(shape,dtype) in attributes.items())
+
+    def __len__(self):
+        return len(next(iter(self.arrays.values())))
+
+    def add(self,count):
+        for name,(shape,dtype) in self.attributes.items():
+            self.arrays[name] = np.concatenate([self.arrays[name],np.zeros((count,)+shape,dtype=dtype)])
+        return
+
+    def resize(self,count):
+        for name in self.arrays:
+            self.arrays[name] = self.arrays[name][:0]
+        self.add(count)
+        return
+
+    def foreach_get(self,attribute,seq):
+        seq[:] = self.arrays[attribute].ravel()
+        return
+
+    def foreach_set(self,attribute,seq):
+        array = self.arrays[attribute]
+        array[...] = np.asarray(seq,dtype=array.dtype).reshape(array.shape)
+        return
+
+class Layers(Stub):
+
+    # uv_layers, vertex_colors: named per-loop layers
+    def __init__(self,mesh,make):
+        self.mesh = mesh
+        self.make = make
+        self.layers = []
+
+    def __len__(self):
+        return len(self.layers)
+
+    def __iter__(self):
+        return iter(list(self.layers))
+
+    def __getitem__(self,key):
+        if isinstance(key,int):
+            return self.layers[key]
+        return next(layer for layer in self.layers if layer.name == key)
+
+    def get(self,name,default=None):
+        return next((layer for layer in self.layers if layer.name == name),default)
+
+    def new(self,name='Layer'):
+        layer = self.make(self.mesh,name)
+        self.layers.append(layer)
+        return layer
+
+def uvLayer(mesh,name):
+
+    layer = Stub()
+    layer.name = name
+    layer.data = ArrayCollection(mesh,{'uv':((2,),np.float32)})
+    layer.data.add(len(mesh.loops))
+    return layer
+
+def colorLayer(mesh,name):
+
+    # 2.79 vertex colors are RGB
+    layer = Stub()
+    layer.name = name
+    layer.data = ArrayCollection(mesh,{'color':((3,),np.float32)})
+    layer.data.add(len(mesh.loops))
+    layer.data.arrays['color'][:] = 1.0
+    return layer
+
+class Mesh(ID):
+
+    def __init__(self,name):
+        ID.__init__(self,name)
+        self.vertices = ArrayCollection(self,{'co':((3,),np.float32),'select':((),bool)})
+        self.loops = ArrayCollection(self,{'vertex_index':((),np.int32)})
+        self.polygons = ArrayCollection(self,{'loop_start':((),np.int32),'loop_total':((),np.int32),'use_smooth':((),bool)})
+        self.uv_layers = Layers(self,uvLayer)
+        self.uv_textures = self.uv_layers
+        self.vertex_colors = Layers(self,colorLayer)
+        self.materials = []
+
+    @property
+    def users(self):
+        return int(self.use_fake_user) + sum(1 for ob in data.objects if ob.data is self)
+
+    @property
+    def edges(self):
+        return MeshEdges(self)
+
+    def copy(self):
+        me = data.meshes.new(self.name)
+        me.setGeometry(self.vertices.arrays['co'],self.faceList())
+        me.materials = list(self.materials)
+        me.props = dict(self.props)
+        for layer in self.uv_layers:
+            me.uv_layers.new(layer.name).data.arrays['uv'][:] = layer.data.arrays['uv']
+        for layer in self.vertex_colors:
+            me.vertex_colors.new(layer.name).data.arrays['color'][:] = layer.data.arrays['color']
+        return me
+
+    def faceList(self):
+
+        # (m,k) array when all polygons have k sides, a list of arrays otherwise
+        starts = self.polygons.arrays['loop_start']
+        totals = self.polygons.arrays['loop_total']
+        index = self.loops.arrays['vertex_index']
+        if len(totals) and (totals == totals[0]).all():
+            return index.reshape(-1,int(totals[0]))
+        return [index[s:s+t] for s,t in zip(starts,totals)]
+
+    def setGeometry(self,verts,faces):
+        self.vertices.resize(len(verts))
+        self.vertices.arrays['co'][:] = np.asarray(verts,dtype=np.float32).reshape(-1,3)
+
+        if isinstance(faces,np.ndarray):
+            totals = np.full(len(faces),faces.shape[1] if faces.ndim == 2 else 0,dtype=np.int32)
+            index = faces.ravel()
+        else:
+            totals = np.array([len(face) for face in faces],dtype=np.int32)
+            index = np.concatenate([np.asarray(face,dtype=np.int32) for face in faces]) if len(faces) else []
+
+        self.loops.resize(int(totals.sum()))
+        self.loops.arrays['vertex_index'][:] = index
+
+        self.polygons.resize(len(faces))
+        self.polygons.arrays['loop_total'][:] = totals
+        self.polygons.arrays['loop_start'][:] = np.cumsum(totals)-totals
+
+        for layers in [self.uv_layers,self.vertex_colors]:
+            for layer in layers:
+                layer.data.resize(len(self.loops))
+        return
+
+    def update(self,calc_edges=False,calc_tessface=False):
+        return
+
+    def transform(self,matrix):
+        matrix = np.array(matrix,dtype=np.float64)
+        co = self.vertices.arrays['co']
+        co[:] = np.dot(co,matrix[:3,:3].T) + matrix[:3,3]
+        return
+
+class MeshEdges:
+
+    # edges only exist as the outlines of the faces, their flags are not kept
+    def __init__(self,me):
+        self.count = len(edgeArray(me))
+
+    def __len__(self):
+        return self.count
+
+    def foreach_set(self,attribute,seq):
+        return
+
+def edgeArray(me):
+
+    faces = me.faceList()
+    if isinstance(faces,np.ndarray):
+        pairs = np.stack([faces,np.roll(faces,-1,axis=1)],axis=-1).reshape(-1,2)
+    else:
+        pairs = np.array([pair for face in faces for pair in zip(face,np.roll(face,-1))]).reshape(-1,2)
+    return np.unique(np.sort(pairs,axis=1),axis=0)
+
+###
+###         OBJECTS AND SCENE
+###
+
+class MaterialSlot:
+
+    def __init__(self,ob,index):
+        self.ob = ob
+        self.index = index
+
+    def state(self):
+        while len(self.ob.slots) <= self.index:
+            self.ob.slots.append({'link':'DATA','material':None})
+        return self.ob.slots[self.index]
+
+    @property
+    def link(self):
+        return self.state()['link']
+
+    @link.setter
+    def link(self,value):
+        self.state()['link'] = value
+        return
+
+    @property
+    def material(self):
+        if self.link == 'OBJECT':
+            return self.state()['material']
+        return self.ob.data.materials[self.index]
+
+    @material.setter
+    def material(self,value):
+        if self.link == 'OBJECT':
+            self.state()['material'] = value
+        else:
+            self.ob.data.materials[self.index] = value
+        return
+
+class NamedList(Stub):
+
+    def __init__(self,make):
+        self.make = make
+        self.items = []
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __bool__(self):
+        return len(self.items) > 0
+
+    def __getitem__(self,key):
+        if isinstance(key,int):
+            return self.items[key]
+        return next(item for item in self.items if item.name == key)
+
+    def new(self,name='',type=''):
+        item = self.make(name,type)
+        item.index = len(self.items)
+        self.items.append(item)
+        return item
+
+    def remove(self,item):
+        self.items.remove(item)
+        return
+
+def modifier(name,type):
+
+    mod = Stub()
+    mod.name = name or type.title()
+    mod.type = type
+    return mod
+
+def vertexGroup(name,type):
+
+    group = Stub()
+    group.name = name or 'Group'
+    group.weights = {}
+    def add(index,weight,type):
+        for i in index:
+            group.weights[i] = weight
+        return
+    group.add = add
+    return group
+
+def particleSystem(name,type):
+
+    system = Stub()
+    system.name = name or 'ParticleSystem'
+    system.settings = None
+    return system
+
+class Object(ID):
+
+    def __init__(self,name,objectData):
+        ID.__init__(self,name)
+        self.data = objectData
+        self.type = 'EMPTY' if objectData is None else {Mesh:'MESH',Lamp:'LAMP',Camera:'CAMERA'}.get(type(objectData),'MESH')
+        self.parent = None
+        self.matrix_parent_inverse = Matrix.Identity(4)
+        self._location = Vector()
+        self._rotation = Euler()
+        self._scale = Vector((1,1,1))
+        self.select = False
+        self.slots = []
+        self.modifiers = NamedList(modifier)
+        self.vertex_groups = NamedList(vertexGroup)
+        self.particle_systems = NamedList(particleSystem)
+
+    def copy(self):
+        ob = data.objects.new(self.name,self.data)
+        ob.matrix_basis = self.matrix_basis
+        ob.slots = [dict(slot) for slot in self.slots]
+        ob.props = dict(self.props)
+        return ob
+
+    @property
+    def users(self):
+        return int(self.use_fake_user) + sum(1 for scene in data.scenes if self in scene.objects.list) + sum(1 for group in data.groups if self in group.objects.list)
+
+    location = property(lambda self: self._location,lambda self,value: setattr(self,'_location',Vector(value)))
+    rotation_euler = property(lambda self: self._rotation,lambda self,value: setattr(self,'_rotation',Euler(value)))
+    scale = property(lambda self: self._scale,lambda self,value: setattr(self,'_scale',Vector(value)))
+
+    @property
+    def material_slots(self):
+        count = len(self.data.materials) if isinstance(self.data,Mesh) else len(self.slots)
+        return [MaterialSlot(self,i) for i in range(count)]
+
+    @property
+    def matrix_basis(self):
+        key = (tuple(self._location),tuple(self._rotation),tuple(self._scale))
+        if self.__dict__.get('basisKey') != key:
+            self.basisKey = key
+            self.basis = Matrix.Translation(self._location) * self._rotation.to_matrix().to_4x4() * scaleMatrix(self._scale)
+        return self.basis.copy()
+
+    @matrix_basis.setter
+    def matrix_basis(self,matrix):
+        matrix = Matrix(np.array(matrix,dtype=np.float64))
+        self._location = matrix.to_translation()
+        self._rotation = matrix.to_euler()
+        self._scale = matrix.to_scale()
+        return
+
+    @property
+    def matrix_world(self):
+        if self.parent:
+            return self.parent.matrix_world * self.matrix_parent_inverse * self.matrix_basis
+        return self.matrix_basis
+
+    @matrix_world.setter
+    def matrix_world(self,matrix):
+        if self.parent:
+            matrix = (self.parent.matrix_world * self.matrix_parent_inverse).inverted() * matrix
+        self.matrix_basis = matrix
+        return
+
+def scaleMatrix(scale):
+
+    matrix = np.identity(4)
+    matrix[0,0],matrix[1,1],matrix[2,2] = scale[0],scale[1],scale[2]
+    return Matrix(matrix)
+
+class ObjectLinks:
+
+    # scene.objects and group.objects
+    def __init__(self):
+        self.list = []
+        self.active = None
+
+    def __iter__(self):
+        return iter(list(self.list))
+
+    def __len__(self):
+        return len(self.list)
+
+    def __bool__(self):
+        return len(self.list) > 0
+
+    def __contains__(self,name):
+        return any(ob.name == name for ob in self.list)
+
+    def link(self,ob):
+        if ob in self.list:
+            raise RuntimeError('Object "' + ob.name + '" already in scene')
+        self.list.append(ob)
+        return
+
+    def unlink(self,ob):
+        self.list.remove(ob)
+        if self.active is ob:
+            self.active = None
+        return
+
+class Scene(ID):
+
+    def __init__(self,name):
+        ID.__init__(self,name)
+        self.objects = ObjectLinks()
+        self.camera = None
+        self.world = data.worlds.new('World')
+        self.frame_current = 1
+        self.render.resolution_x = 1920
+        self.render.resolution_y = 1080
+        self.render.resolution_percentage = 50
+        self.render.tile_x = 64
+        self.render.tile_y = 64
+        self.render.threads_mode = 'AUTO'
+        self.render.threads = os.cpu_count()
+        self.render.file_extension = '.png'
+        self.render.image_settings.file_format = 'PNG'
+        self.cycles.samples = 128
+        self.cycles.seed = 0
+
+    def update(self):
+        return
+
+    def frame_set(self,frame):
+        self.frame_current = frame
+        return
+
+class Group(ID):
+
+    def __init__(self,name):
+        ID.__init__(self,name)
+        self.objects = ObjectLinks()
+
+###
+###         NODES, MATERIALS, WORLDS AND OTHER DATA
+###
+
+class Sockets(Stub):
+
+    def __init__(self):
+        self.sockets = {}
+
+    def __getitem__(self,index):
+        if index not in self.sockets:
+            self.sockets[index] = Stub()
+        return self.sockets[index]
+
+class Node(Stub):
+
+    def __init__(self,type,name):
+        self.type = type
+        self.name = name
+        self.inputs = Sockets()
+        self.outputs = Sockets()
+
+nodeNames = {'ShaderNodeOutputWorld':'World Output','ShaderNodeOutputMaterial':'Material Output','ShaderNodeBsdfDiffuse':'Diffuse BSDF',
+             'ShaderNodeTexImage':'Image Texture','ShaderNodeTexEnvironment':'Environment Texture','ShaderNodeValToRGB':'ColorRamp'}
+
+class Nodes(Stub):
+
+    def __init__(self):
+        self.nodes = []
+
+    def __iter__(self):
+        return iter(list(self.nodes))
+
+    def __getitem__(self,key):
+        if isinstance(key,int):
+            return self.nodes[key]
+        return next(node for node in self.nodes if node.name == key)
+
+    def new(self,type):
+        name = nodeNames.get(type,type.replace('ShaderNode',''))
+        taken = set(node.name for node in self.nodes)
+        unique = name
+        n = 0
+        while unique in taken:
+            n += 1
+            unique = name + '.' + str(n).zfill(3)
+
+        node = Node(type,unique)
+        self.nodes.append(node)
+        return node
+
+    def remove(self,node):
+        self.nodes.remove(node)
+        return
+
+class Links(Stub):
+
+    def __init__(self):
+        self.links = []
+
+    def new(self,output,input):
+        link = Stub()
+        link.from_socket = output
+        link.to_socket = input
+        self.links.append(link)
+        return link
+
+def nodeTree(*types):
+
+    tree = Stub()
+    tree.nodes = Nodes()
+    tree.links = Links()
+    for type in types:
+        tree.nodes.new(type)
+    return tree
+
+class Material(ID):
+
+    def __init__(self,name):
+        ID.__init__(self,name)
+        self.use_nodes = False
+        self.node_tree = nodeTree('ShaderNodeOutputMaterial','ShaderNodeBsdfDiffuse')
+
+    @property
+    def users(self):
+        count = int(self.use_fake_user)
+        count += sum(me.materials.count(self) for me in data.meshes)
+        count += sum(1 for ob in data.objects for slot in ob.slots if slot['material'] is self)
+        return count
+
+class World(ID):
+
+    def __init__(self,name):
+        ID.__init__(self,name)
+        self.use_nodes = False
+        self.node_tree = nodeTree('ShaderNodeOutputWorld','ShaderNodeBackground')
+
+    def copy(self):
+        world = data.worlds.new(self.name)
+        world.use_nodes = self.use_nodes
+        for node in self.node_tree.nodes:
+            if node.type not in ['ShaderNodeOutputWorld','ShaderNodeBackground']:
+                copied = world.node_tree.nodes.new(node.type)
+                if 'image' in node.__dict__:
+                    copied.image = node.image
+        return world
+
+class Lamp(ID):
+
+    def __init__(self,name,type='POINT'):
+        ID.__init__(self,name)
+        self.type = type
+        self.node_tree = nodeTree('ShaderNodeOutputLamp','ShaderNodeEmission')
+
+    @property
+    def users(self):
+        return int(self.use_fake_user) + sum(1 for ob in data.objects if ob.data is self)
+
+class Camera(ID):
+
+    def __init__(self,name):
+        ID.__init__(self,name)
+        self.type = 'PERSP'
+        self.lens = 35.0
+        self.sensor_width = 32.0
+        self.sensor_fit = 'AUTO'
+        self.clip_start = 0.1
+        self.clip_end = 100.0
+
+    users = Lamp.users
+
+class Image(ID):
+
+    def __init__(self,name,width=0,height=0,alpha=False,float_buffer=False):
+        ID.__init__(self,name)
+        self.filepath = ''
+        self.size = (width,height)
+        self.channels = 4
+        self.is_float = float_buffer
+        self.has_data = width > 0
+        self.pixels = [0.0]*(width*height*4)
+
+    @property
+    def users(self):
+        nodes = [node for block in list(data.materials)+list(data.worlds)+list(data.lamps) for node in block.node_tree.nodes]
+        return int(self.use_fake_user) + pointers(self,nodes,'image') + pointers(self,data.textures,'image')
+
+class ImageCollection(Collection):
+
+    # files are not read, every loaded image counts as a decoded 2k texture so
+    # the image cache has sizes to weigh
+    def load(self,filepath,check_existing=False):
+        im = self.new(os.path.basename(filepath))
+        im.filepath = filepath
+        im.is_float = os.path.splitext(filepath)[1].lower() in ['.exr','.hdr']
+        im.size = (2048,2048)
+        im.has_data = True
+        return im
+
+class Libraries(Stub):
+
+    # nothing is read from or written to .blend files
+    def load(self,filepath,link=False):
+        dataFrom = Stub()
+        dataFrom.meshes = []
+        dataTo = Stub()
+        dataTo.meshes = []
+
+        class Library:
+            def __enter__(self):
+                return dataFrom, dataTo
+            def __exit__(self,*args):
+                return False
+
+        return Library()
+
+class Texture(ID):
+
+    def __init__(self,name,type='NONE'):
+        ID.__init__(self,name)
+        self.type = type
+
+    @property
+    def users(self):
+        modifiers = [mod for ob in data.objects for mod in ob.modifiers]
+        slots = [slot for settings in data.particles for slot in settings.texture_slots]
+        return int(self.use_fake_user) + pointers(self,modifiers,'texture') + pointers(self,slots,'texture')
+
+class TextureSlots(Stub):
+
+    def __init__(self):
+        self.slots = []
+
+    def __iter__(self):
+        return iter(list(self.slots))
+
+    def add(self):
+        slot = Stub()
+        self.slots.append(slot)
+        return slot
+
+class ParticleSettings(ID):
+
+    def __init__(self,name):
+        ID.__init__(self,name)
+        self.texture_slots = TextureSlots()
+
+    @property
+    def users(self):
+        return int(self.use_fake_user) + pointers(self,[system for ob in data.objects for system in ob.particle_systems],'settings')
+
+class Data:
+
+    def __init__(self):
+        self.filepath = ''
+        for name,make in [('objects',Object),('meshes',Mesh),('materials',Material),('textures',Texture),('lamps',Lamp),
+                          ('cameras',Camera),('worlds',World),('groups',Group),('particles',ParticleSettings),('scenes',Scene)]:
+            setattr(self,name,Collection(make))
+
+        self.images = ImageCollection(Image)
+        self.libraries = Libraries()
+
+###
+###         OPERATORS
+###
+
+def selectedObjects():
+
+    return [ob for ob in context.scene.objects if ob.select]
+
+def opSelectAll(action='TOGGLE'):
+
+    objects = list(context.scene.objects)
+    select = action == 'SELECT' or (action == 'TOGGLE' and not any(ob.select for ob in objects))
+    for ob in objects:
+        ob.select = select
+    return {'FINISHED'}
+
+def opDelete(use_global=False):
+
+    for ob in selectedObjects():
+        context.scene.objects.unlink(ob)
+        if ob.users == 0:
+            data.objects.remove(ob)
+    return {'FINISHED'}
+
+def opTransformApply(location=False,rotation=False,scale=False):
+
+    for ob in selectedObjects():
+        applied = np.identity(4)
+        if location:
+            applied = np.dot(np.array(Matrix.Translation(ob.location)),applied)
+            ob.location = (0,0,0)
+        if rotation:
+            applied = np.dot(applied,np.array(ob.rotation_euler.to_matrix().to_4x4()))
+            ob.rotation_euler = (0,0,0)
+        if scale:
+            applied = np.dot(applied,np.array(scaleMatrix(ob.scale)))
+            ob.scale = (1,1,1)
+        if isinstance(ob.data,Mesh):
+            ob.data.transform(Matrix(applied))
+    return {'FINISHED'}
+
+def opModeSet(mode='OBJECT'):
+
+    state['mode'] = mode
+    return {'FINISHED'}
+
+def opResize(value=(1,1,1),**kwargs):
+
+    for ob in selectedObjects():
+        ob.scale = Vector([s*v for s,v in zip(ob.scale,value)])
+    return {'FINISHED'}
+
+def opModifierAdd(type='DISPLACE'):
+
+    context.scene.objects.active.modifiers.new(type.title(),type)
+    return {'FINISHED'}
+
+def opModifierApply(apply_as='DATA',modifier=''):
+
+    ob = context.scene.objects.active
+    ob.modifiers.remove(ob.modifiers[modifier])
+    return {'FINISHED'}
+
+def opMaterialSlotAdd():
+
+    context.scene.objects.active.data.materials.append(None)
+    return {'FINISHED'}
+
+def opParticleSystemAdd():
+
+    context.scene.objects.active.particle_systems.new('ParticleSystem')
+    return {'FINISHED'}
+
+def opSmartProject(**kwargs):
+
+    me = context.scene.objects.active.data
+    if len(me.uv_layers) == 0:
+        me.uv_layers.new('UVMap')
+    return {'FINISHED'}
+
+def opMeshSelectAll(action='TOGGLE'):
+
+    select = context.scene.objects.active.data.vertices.arrays['select']
+    select[:] = action == 'SELECT' or (action == 'TOGGLE' and not select.any())
+    return {'FINISHED'}
+
+def opColladaImport(filepath=''):
+
+    # two plants of crossed blades in place of scrubBlockPlantFinal.dae
+    for name in ['Plant1','Plant2']:
+        verts = []
+        faces = []
+        for blade in range(8):
+            angle = math.pi*blade/8
+            c,s = math.cos(angle)*0.1,math.sin(angle)*0.1
+            base = len(verts)
+            verts.extend([(-c,-s,0),(c,s,0),(c*0.2,s*0.2,1),(-c*0.2,-s*0.2,1)])
+            faces.append((base,base+1,base+2,base+3))
+
+        me = data.meshes.new(name)
+        me.setGeometry(verts,faces)
+        ob = data.objects.new(name,me)
+        context.scene.objects.link(ob)
+        ob.select = True
+    return {'FINISHED'}
+
+def opRender(write_still=False,**kwargs):
+
+    for handler in app.handlers.render_pre + app.handlers.render_post:
+        handler(context.scene)
+    return {'FINISHED'}
+
+class OperatorGroup(Stub):
+
+    # registered operators run, all the others do nothing. the time spent in them
+    # is kept in state['operatorSeconds'] so it can be told apart from the caller's
+    def __init__(self,operators):
+        self.operators = operators
+
+    def __getattr__(self,name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        operator = self.operators.get(name,lambda *args,**kwargs: {'FINISHED'})
+
+        def timed(*args,**kwargs):
+            start = time.perf_counter()
+            try:
+                return operator(*args,**kwargs)
+            finally:
+                state['operatorSeconds'] += time.perf_counter()-start
+
+        return timed
+
+operators = {
+    'object': {'select_all':opSelectAll,'delete':opDelete,'transform_apply':opTransformApply,'mode_set':opModeSet,
+               'modifier_add':opModifierAdd,'modifier_apply':opModifierApply,'material_slot_add':opMaterialSlotAdd,'particle_system_add':opParticleSystemAdd},
+    'mesh': {'select_all':opMeshSelectAll},
+    'uv': {'smart_project':opSmartProject},
+    'transform': {'resize':opResize},
+    'wm': {'collada_import':opColladaImport},
+    'render': {'render':opRender},
+}
+
+###
+###         BMESH AND BPY_EXTRAS
+###
+
+class BMesh:
+
+    # bmesh.new() holds the arrays of a mesh between from_mesh and to_mesh
+    def __init__(self):
+        self.verts = []
+        self.edges = []
+        self.faces = []
+
+    def from_mesh(self,me):
+        self.co = me.vertices.arrays['co'].copy()
+        self.faceData = me.faceList()
+        self.verts = range(len(self.co))
+        self.edges = range(len(edgeArray(me)))
+        self.faces = range(len(self.faceData))
+        return
+
+    def to_mesh(self,me):
+        me.setGeometry(self.co,self.faceData)
+        return
+
+    def free(self):
+        return
+
+def bmRemoveDoubles(bm,verts=(),dist=0.0001):
+
+    # weld the vertices sharing a cell of a dist sized grid, faces that lose a
+    # corner to the weld go
+    keys = np.round(bm.co/dist).astype(np.int64)
+    unique,first,inverse = np.unique(keys,axis=0,return_index=True,return_inverse=True)
+    inverse = inverse.ravel()
+    bm.co = bm.co[first]
+
+    if isinstance(bm.faceData,np.ndarray):
+        faces = inverse[bm.faceData]
+        ordered = np.sort(faces,axis=1)
+        bm.faceData = faces[(np.diff(ordered,axis=1) != 0).all(axis=1)]
+    else:
+        faces = [inverse[face] for face in bm.faceData]
+        bm.faceData = [face for face in faces if len(set(face.tolist())) == len(face)]
+
+    bm.verts = range(len(bm.co))
+    bm.faces = range(len(bm.faceData))
+    return {}
+
+def worldToCameraView(scene,camera,co):
+
+    # normalized frame coordinates and depth, as bpy_extras.object_utils.world_to_camera_view
+    local = camera.matrix_world.inverted() * Vector(co)
+    depth = -local[2]
+    if depth == 0:
+        return Vector((0.5,0.5,0.0))
+
+    width = camera.data.sensor_width/camera.data.lens
+    height = width*scene.render.resolution_y/scene.render.resolution_x
+    return Vector((local[0]/depth/width+0.5,local[1]/depth/height+0.5,depth))
+
+###
+###         INSTALL
+###
+
+data = None
+context = None
+app = None
+state = {}
+
+def reset():
+
+    # fresh session: one scene with an empty world, no objects
+    global data, context, app
+    data = Data()
+    context = Stub()
+    context.scene = data.scenes.new('Scene')
+    context.user_preferences = Stub()
+    state['mode'] = 'OBJECT'
+    state['operatorSeconds'] = 0.0
+
+    app = Stub()
+    app.version = (2,79,0)
+    app.version_string = '2.79 (stand-in)'
+    app.background = True
+    for name in ['render_pre','render_post','render_stats','render_write','render_complete','render_cancel','load_post','scene_update_post']:
+        setattr(app.handlers,name,[])
+
+    bpy = sys.modules.get('bpy')
+    if bpy is not None and getattr(bpy,'standIn',False):
+        bpy.data = data
+        bpy.app = app
+    return
+
+class Context(types.ModuleType):
+
+    # bpy.context.object is the active object, as in Blender
+    def __getattr__(self,name):
+        if name in ['object','active_object']:
+            return context.scene.objects.active
+        return getattr(context,name)
+
+def install():
+
+    # put the stand-in modules in place of bpy, bmesh, mathutils and bpy_extras
+    reset()
+
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Vector = Vector
+    mathutils.Euler = Euler
+    mathutils.Matrix = Matrix
+
+    bpy = types.ModuleType('bpy')
+    bpy.standIn = True
+    bpy.data = data
+    bpy.context = Context('bpy.context')
+    bpy.app = app
+    bpy.ops = Stub()
+    for group,ops in operators.items():
+        setattr(bpy.ops,group,OperatorGroup(ops))
+    bpy.path = types.ModuleType('bpy.path')
+    bpy.path.abspath = lambda path: os.path.join(os.path.dirname(data.filepath),path[2:]) if path.startswith('//') else path
+
+    bmesh = types.ModuleType('bmesh')
+    bmesh.new = BMesh
+    bmesh.ops = OperatorGroup({'remove_doubles':bmRemoveDoubles})
+
+    extras = types.ModuleType('bpy_extras')
+    objectUtils = types.ModuleType('bpy_extras.object_utils')
+    objectUtils.world_to_camera_view = worldToCameraView
+    extras.object_utils = objectUtils
+
+    sys.modules.update({'bpy':bpy,'bmesh':bmesh,'mathutils':mathutils,'bpy_extras':extras,'bpy_extras.object_utils':objectUtils})
+    return bpy
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+# Vertex and face arrays of the environment surfaces in closed form: the bowl
+# hemisphere, the floor trapezoid, the wall planes and subdivided grids of a
+# quad. No bpy here, V4Cycles_latest turns the arrays into meshes with
+# meshFromArrays. Results are cached by their parameters and shared, callers
+# copy before changing them.
+
+import numpy as np
+from collections import OrderedDict
+
+geometryCache = OrderedDict()
+geometryCacheSize = 16
+
+def cached(key,make):
+
+    if key in geometryCache:
+        geometryCache.move_to_end(key)
+        return geometryCache[key]
+
+    geometryCache[key] = make()
+    while len(geometryCache) > geometryCacheSize:
+        geometryCache.popitem(last=False)
+
+    return geometryCache[key]
+
+def bowl(radius,segments=64,rings=32):
+
+    # lower half of a uv sphere of segments x rings around the origin: the rim on
+    # z=0, quads down to a fan of triangles around the bottom pole. faces point
+    # out as on primitive_uv_sphere_add. returns verts and [quads,triangles]
+    def make():
+        rows = rings//2
+        theta = np.pi/2 + np.arange(rows)*np.pi/rings
+        phi = np.arange(segments)*2*np.pi/segments
+        t,p = np.meshgrid(theta,phi,indexing='ij')
+        ring = np.stack([np.sin(t)*np.cos(p),np.sin(t)*np.sin(p),np.cos(t)],axis=-1).reshape(-1,3)
+        verts = (np.concatenate([ring,[(0,0,-1)]])*radius).astype(np.float32)
+
+        r = np.arange(rows-1)[:,None]
+        s = np.arange(segments)[None,:]
+        n = (s+1) % segments
+        quads = np.stack([r*segments+s,(r+1)*segments+s,(r+1)*segments+n,r*segments+n],axis=-1).reshape(-1,4)
+
+        last = (rows-1)*segments
+        pole = len(verts)-1
+        triangles = np.stack([last+s[0],np.full(segments,pole),last+n[0]],axis=-1)
+        return verts, [quads.astype(np.int32),triangles.astype(np.int32)]
+
+    return cached(('bowl',float(radius),segments,rings),make)
+
+def horizon(startPos=-500,height=1000,width=500):
+
+    # floor seen from the camera: one quad, narrow at startPos and width wide
+    # height further on
+    def make():
+        verts = np.array([(-1,startPos,0),(width,startPos+height,0),(-width,startPos+height,0),(1,startPos,0)],dtype=np.float32)
+        return verts, np.array([(0,1,2,3)],dtype=np.int32)
+
+    return cached(('horizon',startPos,height,width),make)
+
+def plane(radius):
+
+    # square plane facing +z, as primitive_plane_add makes it
+    def make():
+        verts = np.array([(-radius,-radius,0),(radius,-radius,0),(radius,radius,0),(-radius,radius,0)],dtype=np.float32)
+        return verts, np.array([(0,1,2,3)],dtype=np.int32)
+
+    return cached(('plane',float(radius)),make)
+
+def quadGrid(corners,uvs,segments):
+
+    # the quad corners[0..3] cut into segments x segments quads, positions and uv
+    # coordinates interpolated bilinearly as subdivide does. returns verts,
+    # faces and the uv of every loop
+    corners = np.asarray(corners,dtype=np.float64).reshape(4,3)
+    uvs = np.asarray(uvs,dtype=np.float64).reshape(4,2)
+
+    def make():
+        steps = np.linspace(0,1,segments+1)
+        t,u = np.meshgrid(steps,steps,indexing='ij')
+        weights = np.stack([(1-u)*(1-t),u*(1-t),u*t,(1-u)*t],axis=-1).reshape(-1,4)
+        verts = np.dot(weights,corners).astype(np.float32)
+        vertUvs = np.dot(weights,uvs).astype(np.float32)
+
+        first = (np.arange(segments)[:,None]*(segments+1) + np.arange(segments)[None,:]).ravel()
+        faces = np.stack([first,first+1,first+segments+2,first+segments+1],axis=-1).astype(np.int32)
+        return verts, faces, vertUvs[faces].reshape(-1,2)
+
+    return cached(('quadGrid',corners.tobytes(),uvs.tobytes(),segments),make)
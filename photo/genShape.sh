@@ -2,6 +2,12 @@ jarf=$(pwd)/shapeGen/generateStimuli.jar
 natdir=$(pwd)/shapeGen/native/macos
 stimdir=$(pwd)/stim/
 
-java -Djava.library.path=$natdir -jar $jarf $stimdir 1 1 20 True True True SHADE 1 1 1 1 0.3 0.3 0.3
+# render each shape while the generator is still writing the next ones, the
+# renderer stops once .done is there
+mkdir -p $stimdir
+rm -f $stimdir/.done
 
-blender --background --python testMakePhoto.py
\ No newline at end of file
+(java -Djava.library.path=$natdir -jar $jarf $stimdir 1 1 20 True True True SHADE 1 1 1 1 0.3 0.3 0.3; touch $stimdir/.done) &
+
+blender --background --python streamMakePhoto.py -- $stimdir
+wait
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+# A Blender that stays up and renders jobs sent to it over a local socket, so
+# Blender, the Cycles kernels and the setup at the bottom of V4Cycles_latest.py
+# are paid for once, and the read specs, cleaned stimulus meshes, environment
+# geometry, the templates of jobs with "template":true and the decoded images
+# stay warm from job to job:
+#   blender --background --python renderDaemon.py -- --socket /tmp/v4render.sock
+#   python renderDaemon.py --submit jobs.jsonl --socket /tmp/v4render.sock
+# Clients write one JSON job per line, as in a renderFarm.py manifest,
+#   {"id":..,"vert":..,"face":..,"env":..,"out":..,"overrides":{"samples":64}}
+# and get one JSON line back per job with its status, seconds, samples, whether
+# it came from the render cache and the seconds of every stage. {"cmd":"stats"}
+# answers with the cache sizes, {"cmd":"stop"} ends the daemon. Jobs run one at
+# a time in the order they come in. A failed job clears the environment
+# templates, which may be half built, and the daemon goes on with the next one.
+
+import sys
+import os
+import json
+import time
+import socket
+import argparse
+import traceback
+
+dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(dir)
+
+argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else sys.argv[1:]
+
+parser = argparse.ArgumentParser(description='Keep Blender and V4Cycles_latest loaded and render jobs sent over a local socket')
+parser.add_argument('--socket',default='/tmp/v4render.sock')
+parser.add_argument('--threads',type=int,help='pin the render threads, the render profile only sets tiles then')
+parser.add_argument('--submit',metavar='MANIFEST',help='send the jobs of this JSON lines manifest to a running daemon and print the replies')
+args = parser.parse_args(argv)
+
+def serveJob(V4Cycles_latest,message):
+
+    if message.get('cmd') == 'stats':
+        return {'status':'ok','caches':V4Cycles_latest.cacheSizes()}
+
+    start = time.time()
+    try:
+        result = V4Cycles_latest.renderJob(message)
+
+    except Exception:
+        result = {'id':message.get('id'),'status':'error','error':traceback.format_exc(),'seconds':time.time()-start}
+        V4Cycles_latest.clearTemplates()
+
+    result['caches'] = V4Cycles_latest.cacheSizes()
+    return result
+
+def serve():
+
+    import bpy
+    import V4Cycles_latest
+
+    if args.threads:
+        bpy.context.scene.render.threads_mode = 'FIXED'
+        bpy.context.scene.render.threads = args.threads
+        V4Cycles_latest.useProfileThreads = False
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)                          # left by a daemon that was killed
+
+    server = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    server.bind(args.socket)
+    server.listen(4)
+    print('Render daemon listening on ' + args.socket)
+
+    served = 0
+    running = True
+    try:
+        while running:
+            connection,address = server.accept()
+            with connection, connection.makefile('rw') as stream:
+                for line in stream:
+                    if not line.strip():
+                        continue
+
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        result = {'status':'error','error':'not a JSON line: ' + line.strip()}
+                    else:
+                        if message.get('cmd') == 'stop':
+                            stream.write(json.dumps({'status':'ok','served':served}) + '\n')
+                            stream.flush()
+                            running = False
+                            break
+
+                        result = serveJob(V4Cycles_latest,message)
+                        served += 'cmd' not in message
+
+                    try:
+                        stream.write(json.dumps(result) + '\n')
+                        stream.flush()
+                    except (IOError,OSError):
+                        break                           # client went away, wait for the next one
+
+    finally:
+        server.close()
+        os.remove(args.socket)
+
+    print('Render daemon served ' + str(served) + ' jobs')
+    return
+
+def submit(manifestFile):
+
+    # replies come back in the order the jobs were sent
+    client = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    client.connect(args.socket)
+    failed = 0
+
+    with client, client.makefile('rw') as stream, open(manifestFile) as inputfile:
+        for line in inputfile:
+            if not line.strip():
+                continue
+
+            stream.write(line.strip() + '\n')
+            stream.flush()
+            result = json.loads(stream.readline())
+            failed += result['status'] != 'ok'
+            print(json.dumps(result))
+
+    return failed
+
+if __name__ == "__main__":
+    if args.submit:
+        sys.exit(1 if submit(args.submit) else 0)
+    serve()
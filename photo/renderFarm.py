@@ -0,0 +1,231 @@
+#!/usr/bin/python
+
+# Render (stimulus, environment) jobs with several Blender processes at once.
+#
+#   python renderFarm.py jobs.jsonl --workers 8
+#   python renderFarm.py --stim-dir stim --stims 1 2 3 --workers 8
+#
+# A manifest has one JSON job per line: {"id":..,"vert":..,"face":..,"env":..,"out":..},
+# optionally with render "overrides" such as {"samples":128,"resolution_percentage":50}.
+# Each worker is a long running Blender (renderWorker.py) pinned to its own share
+# of the cores. Jobs are handed out from one queue, a worker that dies is
+# restarted and its job retried, and every finished job is appended to a log
+# next to the manifest so that an interrupted run resumes where it stopped.
+
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+import subprocess
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+dir = os.path.dirname(os.path.abspath(__file__))
+
+def readManifest(manifestFile):
+
+    jobs = []
+    with open(manifestFile) as inputfile:
+        for line in inputfile:
+            if line.strip():
+                jobs.append(json.loads(line))
+
+    return jobs
+
+def makeManifest(stimPath,stims,envts):
+
+    # same jobs and output names as testMakePhoto.py
+    jobs = []
+    for stimNum in stims:
+        inFile = os.path.abspath(stimPath) + '/' + str(stimNum)
+        for ed in envts:
+            jobs.append({'id':str(stimNum)+'_'+str(ed),'vert':inFile+'_vert.txt','face':inFile+'_face.txt','env':ed,'out':inFile+'_photo_'+str(ed)})
+
+    return jobs
+
+def readLog(logFile):
+
+    done = set()
+    if os.path.exists(logFile):
+        with open(logFile) as inputfile:
+            for line in inputfile:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue                            # line cut short by a previous crash
+
+                if entry['status'] == 'ok':
+                    done.add(entry['id'])
+
+    return done
+
+def coreShares(numWorkers):
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os,'sched_getaffinity') else list(range(os.cpu_count()))
+    perWorker = max(1,len(cores)//numWorkers)
+    return [cores[(w*perWorker)%len(cores):(w*perWorker)%len(cores)+perWorker] for w in range(numWorkers)]
+
+class Worker:
+
+    def __init__(self,workerId,cores,args):
+        self.workerId = workerId
+        self.cores = cores
+        self.args = args
+        self.proc = None
+
+    def start(self):
+
+        readFd,writeFd = os.pipe()
+        cmd = [self.args.blender,'--background','--python',dir+'/renderWorker.py','--',str(len(self.cores)),str(writeFd)]
+
+        if self.args.log_dir:
+            out = open(os.path.join(self.args.log_dir,'worker'+str(self.workerId)+'.log'),'a')
+        else:
+            out = subprocess.DEVNULL
+
+        pin = None
+        if hasattr(os,'sched_setaffinity'):
+            pin = lambda: os.sched_setaffinity(0,self.cores)
+
+        self.proc = subprocess.Popen(cmd,cwd=dir,stdin=subprocess.PIPE,stdout=out,stderr=subprocess.STDOUT,
+                                     pass_fds=(writeFd,),preexec_fn=pin,universal_newlines=True)
+        os.close(writeFd)
+        self.results = os.fdopen(readFd,'r')
+        if out is not subprocess.DEVNULL:
+            out.close()
+        return
+
+    def stop(self):
+
+        if self.proc:
+            try:
+                self.proc.stdin.close()
+            except (IOError,OSError):
+                pass
+            self.proc.wait()
+            self.results.close()
+            self.proc = None
+        return
+
+    def run(self,job):
+
+        # returns the worker's reply, or None when the process died on this job
+        if self.proc is None:
+            self.start()
+
+        try:
+            self.proc.stdin.write(json.dumps(job) + '\n')
+            self.proc.stdin.flush()
+        except (IOError,OSError):
+            line = ''
+        else:
+            line = self.results.readline()
+
+        if not line:
+            self.proc.kill()
+            self.stop()
+            return None
+
+        result = json.loads(line)
+        if result['status'] != 'ok':
+            self.stop()                                 # the worker exits after an error
+        return result
+
+def workerLoop(worker,jobs,log,lock,counts,retries):
+
+    while True:
+        try:
+            job = jobs.get_nowait()
+        except queue.Empty:
+            break
+
+        result = worker.run(job)
+        if result is None:
+            result = {'id':job['id'],'status':'crashed'}
+
+        with lock:
+            if result['status'] == 'ok':
+                counts['ok'] += 1
+
+            else:
+                job['attempts'] = job.get('attempts',0) + 1
+                if job['attempts'] <= retries:
+                    counts['retried'] += 1
+                    jobs.put(job)
+                else:
+                    counts['failed'] += 1
+
+            result['worker'] = worker.workerId
+            log.write(json.dumps(result) + '\n')
+            log.flush()
+            print('[' + str(counts['ok']+counts['failed']) + '/' + str(counts['total']) + '] ' + job['id'] + ' ' + result['status'])
+
+    worker.stop()
+    return
+
+def renderFarm(jobs,logFile,args):
+
+    done = readLog(logFile)
+    todo = [job for job in jobs if job['id'] not in done]
+    print(str(len(jobs)-len(todo)) + ' of ' + str(len(jobs)) + ' jobs already done')
+
+    jobQueue = queue.Queue()
+    for job in todo:
+        jobQueue.put(job)
+
+    counts = {'ok':0,'failed':0,'retried':0,'total':len(todo)}
+    lock = threading.Lock()
+    numWorkers = max(1,min(args.workers,len(todo)))
+    start = time.time()
+
+    with open(logFile,'a') as log:
+        threads = []
+        for w,cores in enumerate(coreShares(numWorkers)):
+            thread = threading.Thread(target=workerLoop,args=(Worker(w,cores,args),jobQueue,log,lock,counts,args.retries))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+    print('rendered ' + str(counts['ok']) + ', failed ' + str(counts['failed']) + ', retried ' + str(counts['retried']) + ' in ' + str(round(time.time()-start)) + 's')
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render (stimulus, environment) jobs with several Blender workers')
+    parser.add_argument('manifest',nargs='?',help='JSON lines job manifest')
+    parser.add_argument('--stim-dir',help='build the jobs from the *_vert.txt/*_face.txt files in this folder instead')
+    parser.add_argument('--stims',nargs='+',type=int,default=[1])
+    parser.add_argument('--envts',nargs='+',type=int,default=list(range(12)))
+    parser.add_argument('--workers',type=int,default=4)
+    parser.add_argument('--retries',type=int,default=2)
+    parser.add_argument('--log',help='job log used to resume, defaults to <manifest>.done')
+    parser.add_argument('--log-dir',help='keep the Blender output of each worker in this folder')
+    parser.add_argument('--blender',default='blender')
+    parser.add_argument('--progressive',action='store_true',help='stop rendering each job once it has converged')
+    parser.add_argument('--denoise',action='store_true',help='render each job with the denoiser and its denoise budget of samples')
+    args = parser.parse_args()
+
+    if args.manifest:
+        jobs = readManifest(args.manifest)
+        logFile = args.log or args.manifest + '.done'
+    elif args.stim_dir:
+        jobs = makeManifest(args.stim_dir,args.stims,args.envts)
+        logFile = args.log or os.path.join(args.stim_dir,'renderFarm.done')
+    else:
+        parser.error('give a manifest or --stim-dir')
+
+    if args.progressive:
+        for job in jobs:
+            job['progressive'] = True
+    if args.denoise:
+        for job in jobs:
+            job['denoise'] = True
+
+    counts = renderFarm(jobs,logFile,args)
+    sys.exit(1 if counts['failed'] else 0)
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+
+# Blender side of renderFarm.py. Started as
+#   blender --background --python renderWorker.py -- <threads> <resultFd>
+# it reads one JSON job per line from stdin, renders it with V4Cycles_latest.renderJob
+# and answers with one JSON line on the result pipe, so that the Blender and
+# Cycles output on stdout never mixes with the replies.
+
+import sys
+import os
+import json
+import time
+import traceback
+
+dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(dir)
+
+import bpy
+import V4Cycles_latest
+
+def reply(result):
+
+    results.write(json.dumps(result) + '\n')
+    results.flush()
+    return
+
+argv = sys.argv[sys.argv.index('--')+1:]
+results = os.fdopen(int(argv[1]),'w')
+
+# pin this worker to its share of the cores, the render profile only sets tiles
+bpy.context.scene.render.threads_mode = 'FIXED'
+bpy.context.scene.render.threads = int(argv[0])
+V4Cycles_latest.useProfileThreads = False
+
+for line in sys.stdin:
+    if not line.strip():
+        continue
+
+    job = json.loads(line)
+    start = time.time()
+
+    try:
+        result = V4Cycles_latest.renderJob(job)
+
+    except Exception:
+        # scene state is unknown after a failure, let the driver start a fresh worker
+        reply({'id':job['id'],'status':'error','error':traceback.format_exc(),'seconds':time.time()-start})
+        sys.exit(1)
+
+    reply(result)
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+# Render stimuli while generateStimuli.jar is still writing them. genShape.sh
+# starts it next to the generator as
+#   blender --background --python streamMakePhoto.py -- stim
+# A watcher thread scans the folder for N_vert.txt/N_face.txt pairs, reads a pair
+# once both files have stopped growing and parse into a valid mesh, and hands it
+# to the render loop through a bounded queue, so no more than --queue parsed
+# stimuli wait in memory. genShape.sh writes stim/.done when the generator exits;
+# the pairs left then are taken as they are and the render loop ends after them.
+
+import sys
+import os
+import re
+import time
+import argparse
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(dir)
+
+import V4Cycles_latest
+
+argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
+
+parser = argparse.ArgumentParser(description='Render each stimulus as soon as the shape generator has written it')
+parser.add_argument('stim_dir',nargs='?',default=os.path.join(dir,'stim'))
+parser.add_argument('--queue',type=int,default=2,help='parsed stimuli waiting for the renderer at most')
+parser.add_argument('--poll',type=float,default=1.0,help='seconds between scans of the folder')
+parser.add_argument('--settle',type=float,default=2.0,help='seconds a pair has to keep its size before it is read')
+parser.add_argument('--preview',action='store_true',help='render only stimuli whose previews pass the placement check')
+parser.add_argument('--idle-timeout',type=float,default=3600,help='stop when nothing new turned up for this long and there is no .done, 0 waits forever')
+args = parser.parse_args(argv)
+
+sentinel = os.path.join(args.stim_dir,'.done')
+
+def scanPairs(stimDir):
+
+    # stimulus number -> sizes of its vert and face file, for every complete pair
+    pairs = {}
+    if not os.path.isdir(stimDir):
+        return pairs
+
+    for name in os.listdir(stimDir):
+        match = re.match(r'^(\d+)_vert\.txt$',name)
+        if match is None:
+            continue
+
+        inFile = os.path.join(stimDir,match.group(1))
+        try:
+            pairs[int(match.group(1))] = (os.path.getsize(inFile+'_vert.txt'),os.path.getsize(inFile+'_face.txt'))
+        except OSError:
+            continue                                    # face file not there yet
+
+    return pairs
+
+def readPair(stimDir,stimNum):
+
+    # None while the files do not parse into a mesh, a half written line or face
+    # list is taken as not finished yet
+    inFile = os.path.join(stimDir,str(stimNum))
+    try:
+        vertSpec,faceSpec = V4Cycles_latest.readSpec(inFile+'_vert.txt',inFile+'_face.txt')
+    except (ValueError,IndexError,OSError):
+        return None
+
+    if len(vertSpec) == 0 or len(faceSpec) == 0 or faceSpec.min() < 1 or faceSpec.max() > len(vertSpec):
+        return None
+    return vertSpec,faceSpec
+
+def watch(stimDir,jobs):
+
+    seen = {}                                           # stimulus number -> (sizes, when first seen at them)
+    queued = set()
+    lastNew = time.time()
+
+    try:
+        while True:
+            # look for the sentinel before scanning, every pair written before it
+            # is then in this scan
+            finished = os.path.exists(sentinel)
+            now = time.time()
+
+            for stimNum,sizes in sorted(scanPairs(stimDir).items()):
+                if stimNum in queued:
+                    continue
+
+                if stimNum not in seen or seen[stimNum][0] != sizes:
+                    seen[stimNum] = (sizes,now)
+                    lastNew = now
+                if not finished and now-seen[stimNum][1] < args.settle:
+                    continue
+
+                spec = readPair(stimDir,stimNum)
+                if spec is None:
+                    if finished:
+                        print('Skipping stimulus ' + str(stimNum) + ', its files are incomplete')
+                        queued.add(stimNum)
+                    continue
+
+                jobs.put((stimNum,spec))                # waits while the renderer is behind
+                queued.add(stimNum)
+
+            if finished:
+                break
+            if args.idle_timeout and now-lastNew > args.idle_timeout:
+                print('No new stimuli in ' + str(args.idle_timeout) + 's and no ' + sentinel + ', stopping')
+                break
+            time.sleep(args.poll)
+
+    finally:
+        jobs.put(None)                                  # end of stream, also when the watcher fails
+    return
+
+if __name__ == "__main__":
+    jobs = queue.Queue(maxsize=max(1,args.queue))
+    watcher = threading.Thread(target=watch,args=(args.stim_dir,jobs))
+    watcher.daemon = True
+    watcher.start()
+
+    rendered = 0
+    start = time.time()
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        stimNum,spec = job
+        print('Rendering stimulus ' + str(stimNum) + ', ' + str(jobs.qsize()) + ' waiting')
+        V4Cycles_latest.runVariants([(stimNum,spec)],V4Cycles_latest.allVariants,os.path.join(args.stim_dir,'{stim}_photo_{code}'),usePreview=args.preview)
+        rendered += 1
+
+    print('Rendered ' + str(rendered) + ' stimuli in ' + str(round(time.time()-start)) + 's')
@@ -2,7 +2,6 @@
 
 import sys
 import os
-import csv
 
 dir = os.getcwd()
 sys.path.append(dir)
@@ -12,20 +11,14 @@ import V4Cycles_latest
 
 stims = [1]
 
+stimuli = []
 for stimNum in stims:
     inFile = stimPath + "/" + str(stimNum)
     try:
-        with open(inFile+'_face.txt', newline='') as inputfile:
-            faceSpec = list(csv.reader(inputfile))
-        inputfile.close()
-
-        with open(inFile+'_vert.txt', newline='') as inputfile:
-            vertSpec = list(csv.reader(inputfile))
-        inputfile.close()
+        stimuli.append((stimNum,V4Cycles_latest.readSpec(inFile+'_vert.txt',inFile+'_face.txt')))
 
     except:
         print("Error: unable to fetch data")
 
-    envts = range(12)
-    for ed in range(len(envts)):
-        V4Cycles_latest.main(vertSpec,faceSpec,envts[ed],inFile+'_photo_'+str(envts[ed]))
+# all 12 environment codes; mirror and glass versions of a scene share one build
+V4Cycles_latest.runVariants(stimuli,V4Cycles_latest.allVariants,stimPath+'/{stim}_photo_{code}')